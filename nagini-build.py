@@ -1,9 +1,14 @@
 #!/usr/bin/python2
 # -*- coding: utf8 -*-
-from os.path import join, isdir
+from os.path import join, isdir, basename, abspath
+from nagini.builder.cache import BuildCache, DEFAULT_CACHE_DIR
 from nagini.builder.package import PlainProjectPackage, ProjectPackage
+from nagini.builder.pipeline import build_projects, OrderedReporter
+from nagini.builder.upload import DEFAULT_MANIFEST, FAILED, UploadManifest, \
+    Uploader
 from os import getcwd, listdir
 from nagini.client import AzkabanClient
+from nagini.sessions import SessionCache
 import argparse
 import sys
 import os
@@ -26,6 +31,56 @@ def main():
                         help='Username to authenticate on server')
     parser.add_argument('-P', '--password', dest='password', required=True,
                         help='Password to authenticate on server')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None,
+                        help='Build projects in N worker processes and '
+                             'upload each one as soon as it is built')
+    parser.add_argument('-c', '--cache', dest='cache', default=False,
+                        action='store_true',
+                        help='Reuse zips of unchanged projects and skip '
+                             'inspection of unchanged modules')
+    parser.add_argument('--cache-dir', dest='cache_dir',
+                        default=DEFAULT_CACHE_DIR,
+                        help='Build cache dir (default: %(default)s)')
+    parser.add_argument('-z', '--compress-level', dest='compress_level',
+                        type=int, default=6, choices=range(10),
+                        help='Zip compression level, 0 - no compression '
+                             '(default: %(default)s)')
+    parser.add_argument('-d', '--discovery', dest='discovery',
+                        default='import', choices=['import', 'ast'],
+                        help='How to find flows: import every module or '
+                             'parse modules and import only ones with flows '
+                             '(default: %(default)s)')
+    parser.add_argument('--compile-python', dest='compile_python',
+                        default=None, metavar='INTERPRETER',
+                        help='Ship bytecode compiled by interpreter of '
+                             'executors, so jobs start without compiling')
+    parser.add_argument('-O', '--optimize', dest='optimize',
+                        action='store_true', default=False,
+                        help='Remove redundant dependencies and fuse chains '
+                             'of jobs marked fusable into single jobs')
+    parser.add_argument('--layer-dir', dest='layer_dir', default=None,
+                        help='Publish shared packages of projects (listed '
+                             'in package.yml) to this dir once instead of '
+                             'packing them into every project zip')
+    parser.add_argument('--layer-executor-dir', dest='layer_executor_dir',
+                        default=None,
+                        help='Path of --layer-dir on executors, if it is '
+                             'mounted elsewhere')
+    parser.add_argument('-U', '--upload-jobs', dest='upload_jobs', type=int,
+                        default=4,
+                        help='Max simultaneous uploads (default: %(default)s)')
+    parser.add_argument('-f', '--force', dest='force', default=False,
+                        action='store_true',
+                        help='Upload projects even if they did not change '
+                             'since the last upload')
+    parser.add_argument('--upload-manifest', dest='upload_manifest',
+                        default=DEFAULT_MANIFEST,
+                        help='File with digests of uploaded projects '
+                             '(default: %(default)s)')
+    parser.add_argument('-s', '--session-cache', dest='session_cache',
+                        default=False, action='store_true',
+                        help='Reuse Azkaban sessions of previous logins, '
+                             'here and in jobs of uploaded projects')
     args = parser.parse_args()
 
     config = {
@@ -35,9 +90,16 @@ def main():
             'password': args.password
         }
     }
+    if args.session_cache:
+        config['server']['session_cache'] = True
 
-    client = AzkabanClient(config["server"]["host"])
+    client = AzkabanClient(config["server"]["host"],
+                           pool_size=max(10, args.upload_jobs),
+                           session_cache=SessionCache()
+                           if args.session_cache else None)
     client.login(config["server"]["username"], config["server"]["password"])
+    uploader = Uploader(client, UploadManifest(args.upload_manifest),
+                        concurrency=args.upload_jobs, force=args.force)
 
     projects = []
     os.environ['NAGINI_BUILDING'] = 'true'
@@ -48,23 +110,83 @@ def main():
     else:
         items = [args.root]
 
+    items = [p for p in items if isdir(p)]
+    cache_dir = args.cache_dir if args.cache else None
+    options = dict(compress_level=args.compress_level,
+                   discovery=args.discovery,
+                   compile_python=args.compile_python,
+                   layer_dir=args.layer_dir,
+                   layer_executor_dir=args.layer_executor_dir,
+                   optimize=args.optimize)
+
+    if args.jobs:
+        failed = build_and_upload(uploader, items, args.plain, config,
+                                  args.jobs, cache_dir=cache_dir, **options)
+        if failed:
+            print "Failed projects: %s" % ", ".join(failed)
+            sys.exit(1)
+        return
+
     for root_path in items:
-        if isdir(root_path):
-            if args.plain:
-                project = PlainProjectPackage(root_path)
-            else:
-                project = ProjectPackage(root_path)
-            project.build(config=config)
-            projects.append(project)
+        if args.plain:
+            project = PlainProjectPackage(root_path,
+                                          compress_level=args.compress_level)
+        else:
+            cache = BuildCache(cache_dir) if cache_dir else None
+            project = ProjectPackage(root_path, cache=cache, **options)
+        project.build(config=config)
+        projects.append(project)
 
     print "Uploading projects:"
-    for item in projects:
-        sys.stdout.write("{0:<56}".format(item.name))
-        sys.stdout.flush()
-        client.upload_project_zip(item.name, item.zip_path)
-        sys.stdout.write("{0:>4}\n".format("OK"))
-        sys.stdout.flush()
-        item.clear()
+    reporter = OrderedReporter(sys.stdout)
+    failed = []
+    for index, item in enumerate(projects):
+        uploader.submit(item.name, item.zip_path, item.digest,
+                        upload_callback(reporter, index, item, failed))
+    uploader.close()
+    if failed:
+        print "Failed projects: %s" % ", ".join(failed)
+        sys.exit(1)
+
+
+def upload_callback(reporter, index, project, failed):
+    """Return callback of `Uploader.submit` reporting result of upload
+    and removing project files
+    """
+    def callback(status, error):
+        project.clear()
+        if status == FAILED:
+            failed.append(project.name)
+            line = "{0:<56}{1:>4}\n{2}".format(project.name, status, error)
+        else:
+            line = "{0:<56}{1:>4}\n".format(project.name, status)
+        reporter.report(index, line)
+    return callback
+
+
+def build_and_upload(uploader, items, plain, config, jobs, **options):
+    """Build projects in parallel, upload every changed project right
+    after its zip is ready and print results in order of `items`.
+
+    :return: names of failed projects
+    """
+    failed = []
+    reporter = OrderedReporter(sys.stdout)
+    for result in build_projects(items, plain, config, processes=jobs,
+                                 **options):
+        uploader.poll()
+        if result.ok:
+            uploader.submit(result.project.name, result.project.zip_path,
+                            result.project.digest,
+                            upload_callback(reporter, result.index,
+                                            result.project, failed))
+        else:
+            name = basename(abspath(result.root_path))
+            failed.append(name)
+            reporter.report(result.index, "{0:<56}{1:>4}\n{2}".format(
+                name, FAILED, result.error))
+    uploader.close()
+    return failed
 
 
 if __name__ == "__main__":
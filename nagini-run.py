@@ -3,47 +3,44 @@
 # Script that run remote flows
 from __future__ import absolute_import, print_function, unicode_literals
 
-import json
 import os
 import sys
-from codecs import open
 from optparse import OptionParser
-from tempfile import mkstemp
 
-from six import iteritems
+from nagini.runner import Checkpoints, LocalRunner, SUCCEEDED
 
-from nagini.utility import flatten
 
-
-def fill_queue(job, queue=None):
-    if queue is None:
-        queue = []
-
-    queue.append(job)
-    requires = flatten(job.requires())
-    if requires:
-        for parent in requires:
-            fill_queue(parent, queue)
-
-    return reversed(queue)
-
-
-def output_to_input_props(path):
-    with open(path) as fd:
-        content = json.load(fd)
-
-    with open(path, 'w') as fd:
-        fd.write('')
-        for name, value in iteritems(content):
-            fd.write('{0}={1}\n'.format(name, value))
+def report(node):
+    print('Job {0}: {1}{2}'.format(node.name, node.status,
+                                   ' (checkpoint)' if node.resumed and not node.join
+                                   else ''))
+    if node.error:
+        print(node.error)
 
 
 if __name__ == '__main__':
-    parser = OptionParser()
+    parser = OptionParser(usage='%prog [options] module:Job')
     parser.add_option('--pythonpath', type='string',
                       default=None, dest='pythonpath')
+    parser.add_option('-j', '--jobs', type='int', default=1, dest='jobs',
+                      help='Max number of jobs run at once in separate '
+                           'processes, all jobs run in this process if 1')
+    parser.add_option('-w', '--working-dir', type='string',
+                      default=os.getcwd(), dest='working_dir',
+                      help='working.dir property of jobs (default: current '
+                           'directory)')
+    parser.add_option('-r', '--resume', action='store_true', default=False,
+                      dest='resume',
+                      help='Skip jobs completed by previous runs whose '
+                           'fields and outputs did not change')
+    parser.add_option('--checkpoints', type='string',
+                      default=None, dest='checkpoints',
+                      help='File of completed jobs (default: file of '
+                           'working dir in ~/.cache/nagini/checkpoints)')
 
     options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('module:Job argument is required')
 
     if options.pythonpath:
         sys.path.insert(0, options.pythonpath)
@@ -53,22 +50,18 @@ if __name__ == '__main__':
     module = __import__(module_name, fromlist=[root_job_name])
     root_job = getattr(module, root_job_name)()
 
-    jobs_queue = fill_queue(root_job)
-    print('Job queue:', jobs_queue)
-
-    # with TemporaryFile(mode="r")
-    _, input_prop_file = mkstemp(prefix="nagini-run-props-")
-    for job in jobs_queue:
-        _, output_prop_file = mkstemp(prefix='nagini-run-props-')
-        os.environ['JOB_PROP_FILE'] = input_prop_file
-        os.environ['JOB_OUTPUT_PROP_FILE'] = output_prop_file
-        print('JOB_PROP_FILE', os.environ['JOB_PROP_FILE'])
-        print('JOB_OUTPUT_PROP_FILE', os.environ['JOB_OUTPUT_PROP_FILE'])
-        print('Launcher: job', job)
-        print('Launcher: about to job.execute()')
-
-        job.execute()
-
-        output_to_input_props(output_prop_file)
-        os.remove(input_prop_file)
-        input_prop_file = output_prop_file
+    if options.checkpoints:
+        checkpoints = Checkpoints(options.checkpoints)
+    else:
+        checkpoints = Checkpoints.for_working_dir(options.working_dir)
+    runner = LocalRunner(root_job, processes=options.jobs,
+                         base_props={'working.dir': options.working_dir},
+                         callback=report,
+                         checkpoints=checkpoints,
+                         resume=options.resume)
+    print('Jobs:', ', '.join(node.name for node in runner.nodes))
+
+    if not runner.run():
+        failed = [n.name for n in runner.nodes if n.status != SUCCEEDED]
+        print('Not succeeded jobs:', ', '.join(failed))
+        sys.exit(1)
@@ -0,0 +1,261 @@
+# -*- coding: utf8 -*-
+"""Deterministic zip writer for project packages.
+
+Members are written in sorted order with fixed timestamps and
+permissions, so the same inputs always give a byte-identical zip.
+Small members are compressed in a thread pool (zlib releases the GIL),
+large members are streamed in chunks, so memory stays bounded.
+"""
+from __future__ import absolute_import, print_function
+
+import os
+import shutil
+import stat
+import struct
+import zipfile
+import zlib
+from multiprocessing.pool import ThreadPool
+
+from six import binary_type, PY2
+
+STREAM_THRESHOLD = 8 << 20  # members bigger than this are streamed
+CHUNK_SIZE = 1 << 20
+ZIP32_LIMIT = 0xF0000000  # leave space for headers below 4 GB
+
+DOS_DATE = (1 << 5) | 1  # 1980-01-01
+DOS_TIME = 0
+
+_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+_CENTRAL_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+_END_RECORD = struct.Struct('<4s4H2LH')
+
+
+class ZipMember(object):
+    """Zip entry with data from file (`path`) or from memory (`data`)"""
+
+    def __init__(self, arcname, path=None, data=None):
+        self.arcname = arcname
+        self.path = path
+        self.data = data
+        self.is_dir = path is None and data is None
+        self.mode = 0o644
+        if path is not None and os.stat(path).st_mode & stat.S_IXUSR:
+            self.mode = 0o755
+
+    @property
+    def size(self):
+        if self.path is not None:
+            return os.path.getsize(self.path)
+        return len(self.data or b'')
+
+    def read(self):
+        if self.path is not None:
+            with open(self.path, 'rb') as fd:
+                return fd.read()
+        return self.data or b''
+
+
+def _compress(args):
+    """Return (crc, file size, compressed bytes) of in-memory member"""
+    member, level = args
+    if member.is_dir:
+        return 0, 0, b''
+    data = member.read()
+    crc = zlib.crc32(data) & 0xffffffff
+    if level:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        data = compressor.compress(data) + compressor.flush()
+        return crc, member.size, data
+    return crc, len(data), data
+
+
+class DeterministicZipWriter(object):
+    def __init__(self, fd, compress_level=6):
+        self.fd = fd
+        self.compress_level = compress_level
+        self.compress_type = (zipfile.ZIP_DEFLATED if compress_level
+                              else zipfile.ZIP_STORED)
+        self._central = []
+
+    def _arcname(self, member):
+        name = member.arcname
+        if isinstance(name, binary_type):
+            name = name.decode('utf8')
+        flags = 0
+        try:
+            encoded = name.encode('ascii')
+        except UnicodeEncodeError:
+            encoded = name.encode('utf8')
+            flags |= 0x800
+        return encoded, flags
+
+    def _local_header(self, name, flags, compress_type, crc, compress_size,
+                      file_size):
+        return _LOCAL_HEADER.pack(b'PK\003\004', 20, 0, flags, compress_type,
+                                  DOS_TIME, DOS_DATE, crc, compress_size,
+                                  file_size, len(name), 0) + name
+
+    def write_compressed(self, member, crc, file_size, data):
+        name, flags = self._arcname(member)
+        compress_type = 0 if member.is_dir else self.compress_type
+        offset = self.fd.tell()
+        self.fd.write(self._local_header(name, flags, compress_type, crc,
+                                         len(data), file_size))
+        self.fd.write(data)
+        self._add_central(member, name, flags, compress_type, crc, len(data),
+                          file_size, offset)
+
+    def write_streamed(self, member):
+        """Write big member in chunks, patching header afterwards"""
+        name, flags = self._arcname(member)
+        offset = self.fd.tell()
+        self.fd.write(self._local_header(name, flags, self.compress_type,
+                                         0, 0, 0))
+        crc = 0
+        file_size = 0
+        compress_size = 0
+        compressor = None
+        if self.compress_level:
+            compressor = zlib.compressobj(self.compress_level,
+                                          zlib.DEFLATED, -15)
+        with open(member.path, 'rb') as src:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                crc = zlib.crc32(chunk, crc)
+                file_size += len(chunk)
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                compress_size += len(chunk)
+                self.fd.write(chunk)
+        if compressor:
+            tail = compressor.flush()
+            compress_size += len(tail)
+            self.fd.write(tail)
+        crc &= 0xffffffff
+
+        end = self.fd.tell()
+        self.fd.seek(offset)
+        self.fd.write(self._local_header(name, flags, self.compress_type, crc,
+                                         compress_size, file_size))
+        self.fd.seek(end)
+        self._add_central(member, name, flags, self.compress_type, crc,
+                          compress_size, file_size, offset)
+
+    def _add_central(self, member, name, flags, compress_type, crc,
+                     compress_size, file_size, offset):
+        if member.is_dir:
+            attr = ((stat.S_IFDIR | 0o755) << 16) | 0x10
+        else:
+            attr = (stat.S_IFREG | member.mode) << 16
+        self._central.append(_CENTRAL_HEADER.pack(
+            b'PK\001\002', 20, 3, 20, 0, flags, compress_type, DOS_TIME,
+            DOS_DATE, crc, compress_size, file_size, len(name), 0, 0, 0, 0,
+            attr, offset) + name)
+
+    def close(self):
+        offset = self.fd.tell()
+        for record in self._central:
+            self.fd.write(record)
+        size = self.fd.tell() - offset
+        count = len(self._central)
+        self.fd.write(_END_RECORD.pack(b'PK\005\006', 0, 0, count, count,
+                                       size, offset, 0))
+
+
+def _with_dirs(members):
+    """Add directory entries for all parent dirs of members"""
+    result = {m.arcname: m for m in members}
+    for member in members:
+        parts = member.arcname.split('/')[:-1]
+        for n in range(1, len(parts) + 1):
+            name = '/'.join(parts[:n]) + '/'
+            if name not in result:
+                result[name] = ZipMember(name)
+    return [result[name] for name in sorted(result)]
+
+
+def _write_zip64(zip_path, members, compress_level):
+    """Fallback for archives that don't fit zip32 limits"""
+    compress_type = (zipfile.ZIP_DEFLATED if compress_level
+                     else zipfile.ZIP_STORED)
+    with zipfile.ZipFile(zip_path, 'w', compress_type,
+                         allowZip64=True) as archive:
+        for member in members:
+            info = zipfile.ZipInfo(member.arcname, (1980, 1, 1, 0, 0, 0))
+            info.create_system = 3
+            info.compress_type = compress_type
+            if member.is_dir:
+                info.external_attr = ((stat.S_IFDIR | 0o755) << 16) | 0x10
+                archive.writestr(info, b'')
+            elif member.path is None:
+                info.external_attr = (stat.S_IFREG | member.mode) << 16
+                archive.writestr(info, member.data or b'')
+            else:
+                info.external_attr = (stat.S_IFREG | member.mode) << 16
+                _write_zip64_file(archive, info, member)
+
+
+def _write_zip64_file(archive, info, member):
+    """Copy file member into zip64 archive in chunks"""
+    if not PY2:
+        with open(member.path, 'rb') as src, \
+                archive.open(info, 'w',
+                             force_zip64=member.size >= ZIP32_LIMIT) as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        return
+    # ZipFile.write() streams but takes mtime and mode from the file,
+    # rewrite them in the local header and the central directory entry
+    archive.write(member.path, member.arcname)
+    written = archive.filelist[-1]
+    written.date_time = info.date_time
+    written.create_system = info.create_system
+    written.external_attr = info.external_attr
+    end = archive.fp.tell()
+    archive.fp.seek(written.header_offset)
+    archive.fp.write(written.FileHeader(
+        written.file_size * 1.05 > zipfile.ZIP64_LIMIT))
+    archive.fp.seek(end)
+
+
+def write_zip(zip_path, members, compress_level=6, threads=None):
+    """Write deterministic zip
+
+    :param str zip_path: output filename
+    :param list[ZipMember] members: zip entries, parent dir entries are
+    added automatically
+    :param int compress_level: zlib level, 0 - store without compression
+    :param int threads: compression threads, cpu count by default
+    """
+    members = _with_dirs(members)
+    if len(members) >= 0xFFFF or \
+            sum(m.size for m in members) >= ZIP32_LIMIT:
+        _write_zip64(zip_path, members, compress_level)
+        return
+
+    pool = ThreadPool(threads)
+    try:
+        with open(zip_path, 'wb') as fd:
+            writer = DeterministicZipWriter(fd, compress_level)
+            batch = []
+            for member in members:
+                if member.path is not None and \
+                        member.size > STREAM_THRESHOLD:
+                    _flush_batch(pool, writer, batch)
+                    writer.write_streamed(member)
+                else:
+                    batch.append(member)
+                    if len(batch) >= 256:
+                        _flush_batch(pool, writer, batch)
+            _flush_batch(pool, writer, batch)
+            writer.close()
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _flush_batch(pool, writer, batch):
+    """Compress batch in parallel and write results in order"""
+    level = writer.compress_level
+    results = pool.map(_compress, [(m, level) for m in batch])
+    for member, (crc, file_size, data) in zip(batch, results):
+        writer.write_compressed(member, crc, file_size, data)
+    del batch[:]
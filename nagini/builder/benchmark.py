@@ -0,0 +1,191 @@
+# -*- coding: utf8 -*-
+"""Benchmark of the build path on synthetic projects.
+
+Generates a project with the given number of modules, jobs and flows,
+builds it several times in fresh worker processes and writes timings of
+every build phase (see `ProjectPackage.timings`) to a json file::
+
+    python -m nagini.builder.benchmark --jobs 500 --flows 10 -o new.json
+    python -m nagini.builder.benchmark --compare old.json new.json
+
+Jobs are laid out in diamonds: every job requires the two previous ones,
+so builders have to deduplicate shared parents.
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+from os.path import getsize, join
+from tempfile import mkdtemp
+from textwrap import dedent
+
+from nagini.builder.pipeline import build_projects
+
+PHASES = ('copy', 'fingerprint', 'discovery', 'dag', 'render', 'bytecode',
+          'zip', 'cache')
+
+_JOB = dedent('''
+
+    class Job{n}(BaseJob):
+        def requires(self):
+            return [{requires}]
+    ''')
+
+_FLOW = dedent('''
+
+    class Flow{n}(BaseFlow):
+        def requires(self):
+            return Job{tail}()
+    ''')
+
+
+def generate_project(root, name='bench', modules=20, jobs=200, flows=5,
+                     diamonds=True):
+    """Write synthetic project to `root/name` and return its path.
+
+    Jobs are split into `modules` contiguous blocks, so modules only
+    import modules with lower numbers. Flows end at the last `flows` jobs.
+    """
+    path = join(root, name)
+    os.makedirs(path)
+    open(join(path, '__init__.py'), 'w').close()
+    per_module = max(1, -(-jobs // modules))
+    module_of = {}
+    for m in range(modules):
+        lines = ['from nagini import BaseJob\n']
+        imports = set()
+        block = range(m * per_module, min(jobs, (m + 1) * per_module))
+        for n in block:
+            module_of[n] = m
+            parents = [n - 1, n - 2] if diamonds else [n - 1]
+            parents = [p for p in parents if p >= 0]
+            imports.update(p for p in parents if module_of[p] != m)
+            lines.append(_JOB.format(n=n, requires=', '.join(
+                'Job%d()' % p for p in parents)))
+        for p in sorted(imports):
+            lines.insert(1, 'from %s.jobs_%d import Job%d\n'
+                         % (name, module_of[p], p))
+        with open(join(path, 'jobs_%d.py' % m), 'w') as fd:
+            fd.write(''.join(lines))
+
+    lines = ['from nagini import BaseFlow\n']
+    for f in range(min(flows, jobs)):
+        tail = jobs - 1 - f
+        lines.insert(1, 'from %s.jobs_%d import Job%d\n'
+                     % (name, module_of[tail], tail))
+        lines.append(_FLOW.format(n=f, tail=tail))
+    with open(join(path, 'flows.py'), 'w') as fd:
+        fd.write(''.join(lines))
+    return path
+
+
+def _stats(values):
+    values = sorted(values)
+    return {'min': values[0], 'max': values[-1],
+            'median': values[len(values) // 2]}
+
+
+def run(path, repeat=3, **options):
+    """Build project `repeat` times, each in a fresh process
+
+    :param options: `ProjectPackage` arguments
+    :return: runs and min/median/max of every phase
+    :rtype: dict
+    """
+    runs = []
+    for _ in range(repeat):
+        result, = build_projects([path], processes=1, **options)
+        if not result.ok:
+            raise RuntimeError(result.error)
+        project = result.project
+        try:
+            runs.append({
+                'phases': project.timings,
+                'total': sum(project.timings.values()),
+                'zip_size': getsize(project.zip_path),
+                'dag': project.dag_stats
+            })
+        finally:
+            project.clear()
+
+    summary = {}
+    for phase in PHASES + ('total',):
+        values = [r['total'] if phase == 'total' else r['phases'].get(phase)
+                  for r in runs]
+        if None not in values:
+            summary[phase] = _stats(values)
+    return {'runs': runs, 'summary': summary}
+
+
+def compare(old, new, stream=sys.stdout):
+    """Print median time of every phase of two benchmark results"""
+    print('{0:<12}{1:>12}{2:>12}{3:>9}'.format('phase', 'old, s', 'new, s',
+                                               'ratio'), file=stream)
+    for phase in PHASES + ('total',):
+        if phase in old['summary'] and phase in new['summary']:
+            before = old['summary'][phase]['median']
+            after = new['summary'][phase]['median']
+            print('{0:<12}{1:>12.4f}{2:>12.4f}{3:>9}'.format(
+                phase, before, after,
+                '%.2f' % (after / before) if before else '-'), file=stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark nagini builder')
+    parser.add_argument('--modules', type=int, default=20)
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--flows', type=int, default=5)
+    parser.add_argument('--no-diamonds', dest='diamonds',
+                        action='store_false', default=True,
+                        help='Linear chains instead of diamonds')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-d', '--discovery', choices=('import', 'ast'),
+                        default='import')
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        default=False)
+    parser.add_argument('-z', '--compress-level', dest='compress_level',
+                        type=int, default=6)
+    parser.add_argument('--label', default=None,
+                        help='Name of measured version, e.g. git revision')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Json file for results, stdout by default')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='Compare two result files instead of running')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            compare(json.load(old), json.load(new))
+        return
+
+    params = {'modules': args.modules, 'jobs': args.jobs,
+              'flows': args.flows, 'diamonds': args.diamonds}
+    options = {'discovery': args.discovery, 'optimize': args.optimize,
+               'compress_level': args.compress_level}
+    root = mkdtemp(prefix='nagini-bench-')
+    os.environ['NAGINI_BUILDING'] = 'true'
+    try:
+        path = generate_project(root, **params)
+        result = run(path, args.repeat, **options)
+    finally:
+        shutil.rmtree(root)
+
+    result.update({
+        'label': args.label,
+        'python': platform.python_version(),
+        'params': params,
+        'options': options
+    })
+    if args.output:
+        with open(args.output, 'w') as fd:
+            json.dump(result, fd, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
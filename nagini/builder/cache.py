@@ -0,0 +1,137 @@
+# -*- coding: utf8 -*-
+from __future__ import absolute_import, print_function
+
+import hashlib
+import json
+import os
+import shutil
+from os.path import exists, expanduser, join, relpath
+
+from nagini.builder.templates import _templates_dir
+
+DEFAULT_CACHE_DIR = '~/.cache/nagini/build'
+IGNORED_EXTENSIONS = ('.pyc', '.pyo')
+IGNORED_DIRS = ('__pycache__', '.git', '.hg', '.svn', '.tox', '.pytest_cache',
+                '.mypy_cache', '.ipynb_checkpoints')
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def walk_files(root):
+    """Yield sorted relative paths of all project files except bytecode,
+    VCS and tool caches
+    """
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(d for d in dir_names if d not in IGNORED_DIRS)
+        for file_name in sorted(file_names):
+            if not file_name.endswith(IGNORED_EXTENSIONS):
+                yield relpath(join(dir_path, file_name), root)
+
+
+class BuildCache(object):
+    """Persistent cache of built project zips and module inspection results.
+
+    Layout of cache dir::
+
+        <project name>/<fingerprint>.zip   last built zip of the project
+        <project name>/modules.json        flows found in every module and
+                                           hashes of modules it imports
+        <project name>/ast.json            static summaries of modules
+
+    Zips contain config.yml with server credentials, so cache dirs are
+    created readable only by owner.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_DIR):
+        self.path = expanduser(path)
+
+    def _project_dir(self, name):
+        path = join(self.path, name)
+        if not exists(path):
+            os.makedirs(path, 0o700)
+        return path
+
+    def fingerprint(self, project_path, config=None, options=None,
+                    files=None):
+        """Return (fingerprint, file hashes) of project.
+
+        Fingerprint covers every project file (including system.properties),
+        config passed to `build()`, build options affecting the zip and
+        builder templates.
+
+        :param list[str] files: relative paths of packaged files, all
+        project files by default
+        :rtype: (str, dict[str,str])
+        """
+        hashes = {}
+        digest = hashlib.sha1()
+        if files is None:
+            files = walk_files(project_path)
+        for path in files:
+            hashes[path] = file_digest(join(project_path, path))
+            digest.update(('%s %s\n' % (path, hashes[path])).encode('utf8'))
+        for name in sorted(os.listdir(_templates_dir)):
+            if name.endswith('.j2'):
+                digest.update(file_digest(join(_templates_dir, name))
+                              .encode('utf8'))
+        digest.update(json.dumps([config, options],
+                                 sort_keys=True).encode('utf8'))
+        return digest.hexdigest(), hashes
+
+    def restore_zip(self, name, fingerprint, zip_path):
+        """Copy cached zip to `zip_path` if fingerprint matches
+
+        :return: True if zip was restored
+        """
+        cached = join(self.path, name, fingerprint + '.zip')
+        if not exists(cached):
+            return False
+        shutil.copyfile(cached, zip_path)
+        return True
+
+    def store_zip(self, name, fingerprint, zip_path):
+        """Save zip as the only cached zip of project"""
+        project_dir = self._project_dir(name)
+        for item in os.listdir(project_dir):
+            if item.endswith('.zip'):
+                os.remove(join(project_dir, item))
+        tmp_path = join(project_dir, fingerprint + '.zip.tmp')
+        shutil.copyfile(zip_path, tmp_path)
+        os.rename(tmp_path, join(project_dir, fingerprint + '.zip'))
+
+    def load_json(self, name, kind):
+        """Return cached json data of project or empty dict
+
+        :param str kind: 'modules' - flows found in every module,
+        'ast' - static summaries of modules
+        """
+        path = join(self.path, name, kind + '.json')
+        if not exists(path):
+            return {}
+        try:
+            with open(path) as fd:
+                return json.load(fd)
+        except ValueError:
+            return {}
+
+    def store_json(self, name, kind, data):
+        path = join(self._project_dir(name), kind + '.json')
+        with open(path + '.tmp', 'w') as fd:
+            json.dump(data, fd, sort_keys=True)
+        os.rename(path + '.tmp', path)
+
+    def load_modules(self, name):
+        """Return {module path: {'hash': ..., 'flows': [...],
+        'imports': {module path: hash}}} of project, `imports` are project
+        modules imported directly or indirectly
+        """
+        return self.load_json(name, 'modules')
+
+    def store_modules(self, name, modules):
+        self.store_json(name, 'modules', modules)
@@ -0,0 +1,286 @@
+# -*- coding: utf8 -*-
+"""Static flow discovery.
+
+Modules are parsed with `ast` instead of being imported, class
+inheritance is resolved across the whole project and only modules that
+define flows are imported later by the builder.
+
+Limitations: only classes defined at module level (including inside
+module level if/try blocks) are found, and bases must be plain names
+or dotted attributes. Bases from packages outside of the project other
+than nagini are treated as non-flows.
+"""
+from __future__ import absolute_import, print_function
+
+import ast
+import inspect
+from os.path import join
+
+from nagini.builder.cache import file_digest, walk_files
+from nagini.flow import BaseFlow, EmbeddedFlow
+from nagini.loader import remove_ext
+
+FLOW = 'flow'
+EMBEDDED = 'embedded'
+
+_NESTED_BODIES = ('body', 'orelse', 'handlers', 'finalbody')
+
+
+def _top_level(body):
+    """Yield module level statements, descending into if/try blocks"""
+    for node in body:
+        yield node
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)) or \
+                type(node).__name__ == 'AsyncFunctionDef':
+            continue
+        for field in _NESTED_BODIES:
+            for child in getattr(node, field, None) or []:
+                for item in _top_level([child]):
+                    yield item
+
+
+def _dotted(node):
+    """Return dotted name of Name/Attribute node or None"""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        value = _dotted(node.value)
+        if value:
+            return value + '.' + node.attr
+    return None
+
+
+def module_name(project_name, path):
+    """Return import path of project file: 'pkg/__init__.py' -> 'name.pkg'"""
+    parts = [project_name] + remove_ext(path, 'py').split('/')
+    if parts[-1] == '__init__':
+        parts.pop()
+    return '.'.join(parts)
+
+
+def summarize(source, module, is_package):
+    """Return classes with their base expressions, imported names and
+    dotted names of imported modules (or their members) of module source.
+
+    :param str module: import path of module
+    :param bool is_package: module is `__init__.py`
+    :rtype: dict
+    """
+    tree = ast.parse(source)
+    classes = {}
+    imports = {}
+    modules = set()
+    package = module if is_package else module.rpartition('.')[0]
+    for node in _top_level(tree.body):
+        if isinstance(node, ast.ClassDef):
+            classes[node.name] = [_dotted(b) for b in node.bases]
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    local = alias.asname
+                    target = alias.name
+                else:
+                    local = target = alias.name.split('.')[0]
+                imports[local] = {
+                    'absolute': target,
+                    'implicit': package + '.' + target,
+                    'implicit_module': package + '.' + target.split('.')[0]
+                }
+                modules.update([alias.name, package + '.' + alias.name])
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ''
+            if node.level:
+                parent = package.split('.')
+                if node.level > 1:
+                    parent = parent[:-(node.level - 1)]
+                base = '.'.join(parent + ([base] if base else []))
+                implicit = None
+            else:
+                # python 2 implicit relative import
+                implicit = package + '.' + base
+            modules.update(filter(None, [base, implicit]))
+            for alias in node.names:
+                if alias.name == '*':
+                    continue
+                # imported name may be a submodule
+                modules.update(filter(None, [
+                    base + '.' + alias.name,
+                    implicit and implicit + '.' + alias.name]))
+                imports[alias.asname or alias.name] = {
+                    'absolute': base + '.' + alias.name,
+                    'implicit': implicit and implicit + '.' + alias.name,
+                    'implicit_module': implicit
+                }
+    return {'classes': classes, 'imports': imports,
+            'modules': sorted(modules)}
+
+
+class FlowFinder(object):
+    """Find flow classes of project without importing it"""
+
+    def __init__(self, project_path, project_name, summaries=None,
+                 file_hashes=None):
+        """
+        :param dict summaries: cached summaries of files (relative path ->
+        summary with source hash), updated in place
+        :param dict file_hashes: known hashes of project files
+        """
+        self.project_path = project_path
+        self.name = project_name
+        self.summaries = summaries if summaries is not None else {}
+        self.file_hashes = file_hashes or {}
+        self.modules = {}  # import path -> summary
+        self.paths = {}  # import path -> relative file path
+        self._kinds = {}
+
+    def _load(self):
+        for path in walk_files(self.project_path):
+            if not path.endswith('.py') or path.endswith('Launcher.py'):
+                continue
+            full_path = join(self.project_path, path)
+            file_hash = self.file_hashes.get(path) or file_digest(full_path)
+            summary = self.summaries.get(path)
+            if not summary or summary.get('hash') != file_hash or \
+                    'modules' not in summary:
+                module = module_name(self.name, path)
+                with open(full_path, 'rb') as fd:
+                    source = fd.read()
+                try:
+                    summary = summarize(source, module,
+                                        path.endswith('__init__.py'))
+                except SyntaxError:
+                    summary = {'classes': {}, 'imports': {}, 'modules': []}
+                summary['hash'] = file_hash
+                self.summaries[path] = summary
+            module = module_name(self.name, path)
+            self.modules[module] = summary
+            self.paths[module] = path
+
+    def find(self):
+        """Yield (relative module path, class name) of every non embedded
+        flow defined in project, except `__init__.py` modules.
+        """
+        self._load()
+        for module in sorted(self.modules):
+            path = self.paths[module]
+            if path.endswith('__init__.py'):
+                continue
+            for name in sorted(self.modules[module]['classes']):
+                if self._kind((module, name)) == FLOW:
+                    yield path, name
+
+    def dependencies(self):
+        """Return {relative path: set of relative paths} of project
+        modules every module imports directly or indirectly, including
+        its parent packages
+        """
+        if not self.modules:
+            self._load()
+        direct = {}
+        for module, summary in self.modules.items():
+            names = list(summary['modules'])
+            names.append(module.rpartition('.')[0])  # parent packages
+            found = set()
+            for name in names:
+                parts = name.split('.')
+                for n in range(1, len(parts) + 1):
+                    prefix = '.'.join(parts[:n])
+                    if prefix in self.modules and prefix != module:
+                        found.add(prefix)
+            direct[module] = found
+
+        result = {}
+        for module in self.modules:
+            seen = set()
+            stack = list(direct[module])
+            while stack:
+                item = stack.pop()
+                if item not in seen and item != module:
+                    seen.add(item)
+                    stack.extend(direct[item])
+            result[self.paths[module]] = set(self.paths[m] for m in seen)
+        return result
+
+    def _kind(self, class_id, seen=None):
+        """Return FLOW, EMBEDDED or None for project class"""
+        if class_id in self._kinds:
+            return self._kinds[class_id]
+        seen = seen or set()
+        if class_id in seen:  # broken inheritance cycle
+            return None
+        seen.add(class_id)
+
+        module, name = class_id
+        kind = None
+        for base in self.modules[module]['classes'][name]:
+            target = self._resolve_local(module, base) if base else None
+            if isinstance(target, tuple):
+                base_kind = self._kind(target, seen)
+            else:
+                base_kind = self._external_kind(target)
+            if base_kind == EMBEDDED:
+                kind = EMBEDDED
+                break
+            elif base_kind == FLOW:
+                kind = FLOW
+        self._kinds[class_id] = kind
+        return kind
+
+    def _resolve_local(self, module, dotted):
+        """Resolve name used in module to project class id (module, name)
+        or to dotted name outside of project
+        """
+        first, _, rest = dotted.partition('.')
+        summary = self.modules[module]
+        if first in summary['classes'] and not rest:
+            return module, first
+        if first not in summary['imports']:
+            return dotted  # builtin or unknown
+        target = self._import_target(summary['imports'][first])
+        return self._resolve(target + ('.' + rest if rest else ''))
+
+    def _import_target(self, entry):
+        """Prefer python 2 implicit relative import if it points to
+        project module
+        """
+        if entry['implicit_module'] in self.modules:
+            return entry['implicit']
+        return entry['absolute']
+
+    def _resolve(self, dotted, depth=0):
+        """Resolve absolute dotted name following re-exports of project
+        modules
+        """
+        if depth > 32:
+            return None
+        parts = dotted.split('.')
+        for n in range(len(parts) - 1, 0, -1):
+            module = '.'.join(parts[:n])
+            if module not in self.modules:
+                continue
+            rest = parts[n:]
+            summary = self.modules[module]
+            if len(rest) == 1 and rest[0] in summary['classes']:
+                return module, rest[0]
+            if rest[0] in summary['imports']:
+                target = self._import_target(summary['imports'][rest[0]])
+                return self._resolve('.'.join([target] + rest[1:]),
+                                     depth + 1)
+            return None
+        return dotted
+
+    @staticmethod
+    def _external_kind(dotted):
+        """Check classes of nagini itself, everything else is not a flow"""
+        if not dotted or not dotted.startswith('nagini'):
+            return None
+        module, _, name = dotted.rpartition('.')
+        try:
+            # names of cached summaries are unicode on python 2
+            item = getattr(__import__(str(module), fromlist=[str(name)]), name)
+        except (ImportError, AttributeError, ValueError):
+            return None
+        if not inspect.isclass(item) or not issubclass(item, BaseFlow):
+            return None
+        return EMBEDDED if issubclass(item, EmbeddedFlow) else FLOW
+
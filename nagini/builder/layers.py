@@ -0,0 +1,56 @@
+# -*- coding: utf8 -*-
+from __future__ import absolute_import, print_function
+
+import hashlib
+import os
+from os.path import exists, join
+
+from nagini.builder.archive import ZipMember, write_zip
+from nagini.builder.cache import file_digest
+
+
+class SharedLayer(object):
+    """Zip of shared packages stored once in a dir visible to executors.
+
+    Layers are content addressed (`<name>-<digest>.zip`), so projects
+    vendoring identical packages share one artifact and an unchanged
+    layer is never written again. Launchers put the layer on `sys.path`
+    and import its packages with zipimport.
+    """
+
+    def __init__(self, files, name='shared'):
+        """
+        :param list[(str,str)] files: (source path, path inside layer)
+        """
+        self.files = sorted(files, key=lambda f: f[1])
+        self.name = name
+        digest = hashlib.sha1()
+        for path, arcname in self.files:
+            digest.update(('%s %s\n' % (arcname, file_digest(path)))
+                          .encode('utf8'))
+        self.digest = digest.hexdigest()
+
+    @property
+    def filename(self):
+        return '%s-%s.zip' % (self.name, self.digest[:16])
+
+    @property
+    def size(self):
+        return sum(os.path.getsize(path) for path, _ in self.files)
+
+    def publish(self, layer_dir, compress_level=6):
+        """Write layer to layer_dir unless it is already there
+
+        :return: True if layer was written
+        """
+        target = join(layer_dir, self.filename)
+        if exists(target):
+            return False
+        if not exists(layer_dir):
+            os.makedirs(layer_dir)
+        tmp_path = '%s.%d.tmp' % (target, os.getpid())
+        write_zip(tmp_path, [ZipMember(arcname, path=path)
+                             for path, arcname in self.files],
+                  compress_level)
+        os.rename(tmp_path, target)
+        return True
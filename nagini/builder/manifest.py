@@ -0,0 +1,80 @@
+# -*- coding: utf8 -*-
+from __future__ import absolute_import, print_function
+
+from fnmatch import fnmatch
+from os.path import dirname, exists, join, relpath
+
+import yaml
+
+from nagini.builder.cache import walk_files
+
+
+def _matches(path, patterns):
+    """Check if path or any of its parent dirs matches any pattern"""
+    while path:
+        if any(fnmatch(path, pattern) for pattern in patterns):
+            return True
+        path = dirname(path)
+    return False
+
+
+class PackageManifest(object):
+    """Project files selection read from `package.yml` in project root::
+
+        include: ['*.py', 'sql']       # default: everything
+        exclude: ['tests', '*.ipynb']
+        shared: ['helpers']            # packages moved to the shared layer
+
+    Patterns are matched against paths relative to project root and
+    against all their parent dirs. Shared packages are imported as top
+    level packages (`import helpers`) and are only moved out of the
+    project zip when the package is built with a layer dir.
+    """
+    filename = 'package.yml'
+
+    def __init__(self, include=None, exclude=None, shared=None):
+        self.include = include or []
+        self.exclude = exclude or []
+        self.shared = [s.strip('/') for s in shared or []]
+
+    @classmethod
+    def load(cls, project_path):
+        path = join(project_path, cls.filename)
+        if not exists(path):
+            return cls()
+        with open(path) as fd:
+            data = yaml.safe_load(fd) or {}
+        return cls(include=data.get('include'), exclude=data.get('exclude'),
+                   shared=data.get('shared'))
+
+    def is_packaged(self, path):
+        if path == self.filename:
+            return False
+        if self.include and not _matches(path, self.include):
+            return False
+        return not _matches(path, self.exclude)
+
+    def shared_root(self, path):
+        """Return shared package containing path or None"""
+        for shared in self.shared:
+            if path == shared or path.startswith(shared + '/'):
+                return shared
+        return None
+
+    def files(self, project_path, with_shared=True):
+        """Return relative paths of packaged files
+
+        :param bool with_shared: include files of shared packages
+        """
+        return [path for path in walk_files(project_path)
+                if self.is_packaged(path) and
+                (with_shared or self.shared_root(path) is None)]
+
+    def shared_files(self, project_path):
+        """Return (relative path, path inside layer) of shared files"""
+        result = []
+        for path in self.files(project_path):
+            shared = self.shared_root(path)
+            if shared is not None:
+                result.append((path, relpath(path, dirname(shared) or '.')))
+        return result
@@ -0,0 +1,122 @@
+# -*- coding: utf8 -*-
+"""DAG optimization applied to built flow wrappers before rendering.
+
+Two passes are available:
+
+* transitive reduction removes dependencies which are reachable through
+  other dependencies of the same job. Order of execution is unchanged
+  and jobs still get outputs of all their requires via `input()`;
+* chain fusion merges linear chains of jobs marked `fusable = True` into
+  one Azkaban job. Its launcher runs the jobs of the chain one after
+  another in a single process, so properties are passed in memory
+  instead of through output property files.
+
+Job files are shared by all flows of a project, so a chain is fused only
+if it is linear in every flow: each job of the chain except the last one
+has exactly one dependent job in the whole project.
+"""
+from __future__ import absolute_import, print_function
+
+from collections import defaultdict
+
+from nagini.builder.wrappers import JobWrapper
+
+
+def flow_nodes(flow):
+    """Return all wrappers of flow including the flow itself"""
+    return list(flow.registry.values()) + [flow]
+
+
+def reduce_edges(flow):
+    """Remove transitively redundant dependencies of every job of flow
+
+    :return: number of removed edges
+    """
+    ancestors = {}
+
+    def collect(wrapper):
+        if wrapper not in ancestors:
+            result = set()
+            for dependency in wrapper.dependencies:
+                result.add(dependency)
+                result |= collect(dependency)
+            ancestors[wrapper] = result
+        return ancestors[wrapper]
+
+    nodes = flow_nodes(flow)
+    for wrapper in nodes:
+        collect(wrapper)
+
+    removed = 0
+    for wrapper in nodes:
+        kept = [d for d in wrapper.dependencies
+                if not any(d in ancestors[other]
+                           for other in wrapper.dependencies
+                           if other is not d)]
+        removed += len(wrapper.dependencies) - len(kept)
+        wrapper.dependencies = kept
+    return removed
+
+
+def _is_fusable(wrapper):
+    return type(wrapper) is JobWrapper and \
+        getattr(wrapper.class_obj, 'fusable', False)
+
+
+def _retries(wrapper):
+    return (getattr(wrapper.class_obj, 'retries', 0),
+            getattr(wrapper.class_obj, 'retry_backoff', 0))
+
+
+def fuse_chains(flows):
+    """Fuse linear chains of fusable jobs of all flows of project. The last
+    job of a chain keeps its name and runs the whole chain.
+
+    :param list[FlowWrapper] flows: all flows of project
+    :return: number of jobs fused into other ones
+    """
+    dependents = defaultdict(set)  # job name -> names of dependent jobs
+    for flow in flows:
+        for wrapper in flow_nodes(flow):
+            for dependency in wrapper.dependencies:
+                dependents[dependency._job_name()].add(wrapper._job_name())
+
+    def joins_parent(wrapper):
+        if not _is_fusable(wrapper) or len(wrapper.dependencies) != 1:
+            return False
+        parent = wrapper.dependencies[0]
+        return _is_fusable(parent) and \
+            dependents[parent._job_name()] == {wrapper._job_name()} and \
+            _retries(parent) == _retries(wrapper)
+
+    fused = set()
+    for flow in flows:
+        nodes = flow_nodes(flow)
+        joining = [w for w in nodes if joins_parent(w)]
+        parents = set(w.dependencies[0] for w in joining)
+        chains = []
+        for tail in joining:
+            if tail in parents:
+                continue  # middle of a longer chain
+            chain = [tail]
+            while joins_parent(chain[0]):
+                chain.insert(0, chain[0].dependencies[0])
+            chains.append(chain)
+
+        for chain in chains:
+            tail = chain[-1]
+            tail.chain = chain
+            tail.dependencies = chain[0].dependencies
+            for wrapper in chain[:-1]:
+                wrapper.fused_into = tail
+                fused.add(wrapper._job_name())
+    return len(fused)
+
+
+def optimize(flows):
+    """Apply all passes to flows of project
+
+    :return: (removed edges, fused jobs)
+    """
+    removed = sum(reduce_edges(flow) for flow in flows)
+    return removed, fuse_chains(flows)
@@ -1,44 +1,83 @@
 # -*- coding: utf8 -*-
-from os.path import join, basename, exists, abspath
-from nagini.loader import load_module, remove_ext, find_py
+from os.path import join, basename, exists, abspath, dirname, relpath
+from nagini.loader import load_module, find_py
+from nagini.builder.archive import ZipMember, write_zip
+from nagini.builder.cache import file_digest
+from nagini.builder.discovery import FlowFinder
+from nagini.builder.layers import SharedLayer
+from nagini.builder.manifest import PackageManifest
+from nagini.builder import optimizer
+from nagini.builder.templates import render_templates
 from nagini.builder.wrappers import FlowWrapper
 from nagini.flow import BaseFlow, EmbeddedFlow
+from contextlib import contextmanager
 from copy import deepcopy
-from os import remove
+from os import remove, symlink, walk
+import subprocess
 import tempfile
 import inspect
 import shutil
+import nagini
+import json
+import os
 import yaml
+import time
 import sys
 
 
-class PlainProjectPackage(object):
+def source_members(project_path, name, files):
+    """Return zip members for project files placed in `name` dir
+
+    :param list[str] files: paths relative to project root
+    """
+    return [ZipMember(join(name, path), path=join(project_path, path))
+            for path in files]
+
+
+class BasePackage(object):
+    """Project zip shared by plain and regular packages"""
+    zip_path = None
+    _digest = None
+
+    @property
+    def digest(self):
+        """sha1 of built zip. Zips are deterministic, so it changes only
+        with content of project
+        """
+        if self._digest is None:
+            self._digest = file_digest(self.zip_path)
+        return self._digest
+
+
+class PlainProjectPackage(BasePackage):
     base_dir = None
     _clean = False
-    zip_path = None
 
-    def __init__(self, project_path):
+    def __init__(self, project_path, quiet=False, compress_level=6):
         self.project_path = project_path
         self.name = basename(abspath(project_path))
         self.tmp_dir = tempfile.mkdtemp(prefix=self.name + '-')
+        self.quiet = quiet
+        self.compress_level = compress_level
 
     def build(self, zip_filename=None, config=None):
         self.base_dir = self.tmp_dir
-        shutil.copytree(self.project_path, join(self.tmp_dir, self.name))
 
         if zip_filename:
             self.zip_path = zip_filename
         else:
             _, self.zip_path = tempfile.mkstemp('.zip', self.name + '-')
 
-        shutil.make_archive(
-            remove_ext(self.zip_path),
-            'zip',
-            join(self.base_dir)
-        )
+        files = PackageManifest.load(self.project_path).files(
+            self.project_path)
+        write_zip(self.zip_path,
+                  source_members(self.project_path, self.name, files),
+                  self.compress_level)
 
-        sys.stdout.write('{name:<30}{progress:>30}'.format(name=self.name, progress='OK'))
-        sys.stdout.flush()
+        if not self.quiet:
+            sys.stdout.write('{name:<30}{progress:>30}'.format(name=self.name,
+                                                               progress='OK'))
+            sys.stdout.flush()
 
     def clear(self):
         if not self._clean:
@@ -49,59 +88,321 @@ class PlainProjectPackage(object):
             self._clean = True
 
 
-class ProjectPackage(object):
+class ProjectPackage(BasePackage):
     base_dir = None
     _clean = False
-    zip_path = None
+    fingerprint = None
+    from_cache = False
+    bytecode_stats = None
+    layer = None
 
-    def __init__(self, project_path):
+    def __init__(self, project_path, quiet=False, cache=None,
+                 compress_level=6, discovery='import', compile_python=None,
+                 layer_dir=None, layer_executor_dir=None, optimize=False):
+        """
+        :param str project_path: project root dir
+        :param bool quiet: don't draw progress
+        :param BuildCache cache: reuse zips and inspection results of
+        previous builds
+        :param int compress_level: zlib level of zip, 0 - no compression
+        :param str discovery: how to find flows: 'import' - import every
+        module, 'ast' - parse modules and import only ones with flows
+        :param str compile_python: interpreter of executors. If set, project
+        is compiled by it to hash checked bytecode (see `nagini.bytecode`)
+        and launchers load it instead of compiling modules on every start
+        :param str layer_dir: dir to publish shared packages of project
+        (see `PackageManifest`) to. If not set, shared packages stay in
+        project zip
+        :param str layer_executor_dir: path of layer_dir on executors if
+        it is mounted elsewhere
+        :param bool optimize: remove transitively redundant dependencies
+        and fuse chains of fusable jobs (see `nagini.builder.optimizer`)
+        """
         self.project_path = project_path
         self.name = basename(abspath(project_path))
         self.tmp_dir = tempfile.mkdtemp(prefix=self.name + '-')
+        self.quiet = quiet
+        self.cache = cache
+        self.compress_level = compress_level
+        self.discovery = discovery
+        self.compile_python = compile_python
+        self.layer_dir = layer_dir
+        self.layer_executor_dir = layer_executor_dir or layer_dir
+        self.manifest = PackageManifest.load(project_path)
+        self.optimize = optimize
+        self.optimize_stats = None  # (removed edges, fused jobs)
+        self.layers = []  # layer paths on executors
+        self.packaged = set()  # relative paths of files in project zip
         self.jobs = {}
+        self.dag_stats = {}  # flow name -> (nodes, edges)
+        self.dags = {}  # flow name -> {job name: dependency names}
+        self.timings = {}  # build phase -> seconds
+        self.generated = {}  # filename -> (template, context)
+        self._file_hashes = {}
+        self._modules = {}
+        self._imports = {}  # module path -> {imported module path: hash}
 
     def build(self, zip_filename=None, config=None):
-        sys.path.insert(0, self.tmp_dir)
-        self.base_dir = self.tmp_dir
-        shutil.copytree(self.project_path, join(self.tmp_dir, self.name))
-        for module_path, item in self._find_flows():
-            wrapper = FlowWrapper(item, self)
-            wrapper.build()
-
-        if exists(join(self.project_path, 'system.properties')):
-            shutil.copy(join(self.project_path, 'system.properties'),
-                        self.base_dir)
-
         if zip_filename:
             self.zip_path = zip_filename
         else:
             _, self.zip_path = tempfile.mkstemp('.zip', self.name + '-')
 
+        with self._phase('copy'):
+            files = self.manifest.files(self.project_path)
+            if self.layer_dir and self.manifest.shared:
+                self._publish_layer()
+                files = self.manifest.files(self.project_path,
+                                            with_shared=False)
+            self.packaged = set(files)
+
+        if self.cache:
+            with self._phase('fingerprint'):
+                self.fingerprint, self._file_hashes = self.cache.fingerprint(
+                    self.project_path, config, {
+                        'compress_level': self.compress_level,
+                        'compile_python': self.compile_python,
+                        'layers': self.layers,
+                        'optimize': self.optimize
+                    }, self.manifest.files(self.project_path))
+            if self.cache.restore_zip(self.name, self.fingerprint,
+                                      self.zip_path):
+                self.from_cache = True
+                if not self.quiet:
+                    print '{name:<30}{progress:>30}'.format(name=self.name,
+                                                            progress='CACHED')
+                return
+            self._modules = self.cache.load_modules(self.name)
+
+        # Project is imported through a symlink in tmp dir, so nothing is
+        # copied and nothing but the zip is written
+        with self._phase('copy'):
+            symlink(abspath(self.project_path), join(self.tmp_dir, self.name))
+            sys.path.insert(0, self.tmp_dir)
+            for shared in self.manifest.shared:
+                # shared packages are imported as top level ones
+                sys.path.insert(1, join(self.tmp_dir, self.name,
+                                        dirname(shared)).rstrip('/'))
+            self.base_dir = self.tmp_dir
+        inspected = {}
+        dont_write_bytecode = sys.dont_write_bytecode
+        sys.dont_write_bytecode = True
+        flows = []
+        try:
+            with self._phase('discovery'):
+                found = list(self._find_flows(inspected))
+            with self._phase('dag'):
+                for module_path, item in found:
+                    wrapper = FlowWrapper(item, self)
+                    wrapper.build()
+                    if wrapper.dependencies:
+                        flows.append(wrapper)
+        finally:
+            sys.dont_write_bytecode = dont_write_bytecode
+        with self._phase('dag'):
+            if self.optimize:
+                self.optimize_stats = optimizer.optimize(flows)
+            for wrapper in flows:
+                wrapper.make_files()
+                self.dags[wrapper.name] = wrapper.dag()
+                self.dag_stats[wrapper.name] = (wrapper.node_count,
+                                                wrapper.edge_count)
+        if not self.quiet:
+            for name, (nodes, edges) in sorted(self.dag_stats.items()):
+                print '    {0}: {1} jobs, {2} dependencies'.format(
+                    name, nodes, edges)
+            if self.optimize_stats:
+                print '    optimized: {0} redundant dependencies removed, ' \
+                      '{1} jobs fused'.format(*self.optimize_stats)
+
+        members = source_members(self.project_path, self.name,
+                                 sorted(self.packaged))
+        with self._phase('render'):
+            members += self._generated_members()
+        if self.compile_python:
+            with self._phase('bytecode'):
+                members += self._bytecode_members()
+
+        if exists(join(self.project_path, 'system.properties')):
+            members.append(ZipMember(
+                'system.properties',
+                path=join(self.project_path, 'system.properties')
+            ))
+
         if config:
             config = deepcopy(config)
             config['project'] = self.name
-            with open(join(self.base_dir, 'config.yml'), 'w') as fd:
-                yaml.dump(config, fd)
+            members.append(ZipMember('config.yml', data=yaml.dump(
+                config, encoding='utf-8')))
+
+        with self._phase('zip'):
+            write_zip(self.zip_path, members, self.compress_level)
+
+        if self.cache:
+            with self._phase('cache'):
+                self.cache.store_zip(self.name, self.fingerprint,
+                                     self.zip_path)
+                if inspected:  # ast discovery imports nothing
+                    self.cache.store_modules(self.name, inspected)
+
+    @contextmanager
+    def _phase(self, name):
+        """Add time spent in block to `timings` of build phase"""
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + \
+                time.time() - started
+
+    def _publish_layer(self):
+        self.layer = SharedLayer(
+            [(join(self.project_path, path), arcname)
+             for path, arcname in self.manifest.shared_files(
+                self.project_path)])
+        published = self.layer.publish(self.layer_dir, self.compress_level)
+        self.layers = [join(self.layer_executor_dir, self.layer.filename)]
+        if not self.quiet:
+            print '    shared layer: {0} ({1}), {2} bytes out of project ' \
+                  'zip'.format(self.layer.filename,
+                               'published' if published else 'reused',
+                               self.layer.size)
 
-        shutil.make_archive(
-            remove_ext(self.zip_path),
-            'zip',
-            join(self.base_dir)
+    def add_generated(self, filename, template, context):
+        """Schedule rendering of generated file in project root"""
+        self.generated[filename] = (template, context)
+
+    def _generated_members(self):
+        rendered = render_templates(
+            (name, template, context)
+            for name, (template, context) in self.generated.items()
+        )
+        return [ZipMember(name, data=content.encode('utf8'))
+                for name, content in rendered.items()]
+
+    def _bytecode_members(self):
+        """Compile project with target interpreter and return bytecode
+        members
+        """
+        out_dir = join(self.tmp_dir, 'bytecode')
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.pathsep.join(
+            [dirname(dirname(abspath(nagini.__file__)))] +
+            ([env['PYTHONPATH']] if env.get('PYTHONPATH') else [])
         )
+        output = subprocess.check_output(
+            [self.compile_python, '-m', 'nagini.bytecode',
+             abspath(self.project_path), out_dir, self.name],
+            env=env
+        )
+        self.bytecode_stats = json.loads(output.strip().splitlines()[-1])
+        if not self.quiet:
+            print '    bytecode: {0} modules, up to {1:.2f}s of compilation ' \
+                  'saved per job start'.format(self.bytecode_stats['modules'],
+                                               self.bytecode_stats['seconds'])
+
+        members = []
+        for dir_path, _, file_names in walk(out_dir):
+            for file_name in file_names:
+                path = join(dir_path, file_name)
+                rel_path = relpath(path, out_dir)
+                source = join(dirname(dirname(rel_path)),
+                              file_name[:-len('.pyc')] + '.py')
+                if source in self.packaged:
+                    members.append(ZipMember(join(self.name, rel_path),
+                                             path=path))
+        return members
 
-    def _find_flows(self):
-        modules = list(find_py(self.tmp_dir))
+    def _find_flows(self, inspected=None):
+        """Return iterator of (module path, flow class) for every flow
+        of project
+
+        :param dict inspected: filled with inspection results for cache
+        """
+        if inspected is None:
+            inspected = {}
+        if self.discovery == 'ast':
+            return self._find_flows_static()
+        return self._import_flows(inspected)
+
+    def _flow_finder(self):
+        summaries = self.cache.load_json(self.name, 'ast') if self.cache \
+            else {}
+        return FlowFinder(self.project_path, self.name, summaries,
+                          self._file_hashes)
+
+    def _store_summaries(self, finder):
+        if self.cache:
+            self.cache.store_json(self.name, 'ast', {
+                path: finder.summaries[path]
+                for path in finder.paths.values()
+            })
+
+    def _find_flows_static(self):
+        finder = self._flow_finder()
+        found = [(path, name) for path, name in finder.find()
+                 if path in self.packaged]
+        self._store_summaries(finder)
+
+        for n, (path, class_name) in enumerate(found):
+            if not self.quiet:
+                self.draw_progress(int(100.0 / len(found) * (n + 1)))
+            module_path = join(self.name, path)
+            yield module_path, getattr(load_module(module_path), class_name)
+        if not self.quiet:
+            print
+
+    def _import_flows(self, inspected):
+        if self.cache:
+            # cached results are valid while imported modules don't change
+            finder = self._flow_finder()
+            self._imports = dict(
+                (path, dict((d, finder.summaries[d]['hash']) for d in deps))
+                for path, deps in finder.dependencies().items())
+            self._store_summaries(finder)
+        modules = [relpath(path, self.project_path)
+                   for path in find_py(self.project_path)]
+        modules = [path for path in modules if path in self.packaged]
         for n, module_path in enumerate(modules):
-            self.draw_progress(int(100.0 / len(modules) * (n + 1)))
-            if module_path.startswith(self.tmp_dir):
-                module_path = module_path.replace(self.tmp_dir, '', 1)
-                module_path = module_path.strip('/')
-
-            for name, item in inspect.getmembers(load_module(module_path)):
-                if inspect.isclass(item) and issubclass(item, BaseFlow):
-                    if not issubclass(item, EmbeddedFlow):
-                        yield module_path, item
-        print
+            if not self.quiet:
+                self.draw_progress(int(100.0 / len(modules) * (n + 1)))
+            module_path = join(self.name, module_path)
+
+            for item in self._inspect_module(module_path, inspected):
+                yield module_path, item
+        if not self.quiet:
+            print
+
+    def _inspect_module(self, module_path, inspected):
+        """Return flow classes of module. Modules that didn't change and
+        import only unchanged project modules are not imported at all if
+        they have no flows and are not scanned otherwise.
+        """
+        key = module_path.split('/', 1)[-1]  # relative to project root
+        file_hash = self._file_hashes.get(key)
+        imports = self._imports.get(key, {})
+        cached = self._modules.get(key)
+        if file_hash and cached and cached['hash'] == file_hash and \
+                cached.get('imports') == imports:
+            flows = []
+            if cached['flows']:
+                module = load_module(module_path)
+                flows = [getattr(module, name, None)
+                         for name in cached['flows']]
+            if None not in flows:
+                inspected[key] = cached
+                return flows
+
+        flows = []
+        names = []
+        for name, item in inspect.getmembers(load_module(module_path)):
+            if inspect.isclass(item) and issubclass(item, BaseFlow):
+                if not issubclass(item, EmbeddedFlow):
+                    flows.append(item)
+                    names.append(name)
+        inspected[key] = {'hash': file_hash, 'flows': names,
+                          'imports': imports}
+        return flows
 
     def draw_progress(self, progress):
         """Width: 60"""
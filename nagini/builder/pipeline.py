@@ -0,0 +1,94 @@
+# -*- coding: utf8 -*-
+from __future__ import absolute_import, print_function
+
+import threading
+import traceback
+from multiprocessing import Pool
+
+from nagini.builder.cache import BuildCache
+from nagini.builder.package import PlainProjectPackage, ProjectPackage
+
+
+class BuildResult(object):
+    """Outcome of building one project in a worker process"""
+
+    def __init__(self, index, root_path, project=None, error=None):
+        self.index = index
+        self.root_path = root_path
+        self.project = project
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _build_project(task):
+    index, root_path, plain, config, options = task
+    project = None
+    try:
+        # loading package.yml may fail too
+        if plain:
+            project = PlainProjectPackage(root_path, quiet=True,
+                                          compress_level=options.get(
+                                              'compress_level', 6))
+        else:
+            project = ProjectPackage(root_path, quiet=True, **options)
+        project.build(config=config)
+    except Exception:
+        if project is not None:
+            project.clear()
+        return BuildResult(index, root_path, error=traceback.format_exc())
+    return BuildResult(index, root_path, project=project)
+
+
+def build_projects(paths, plain=False, config=None, processes=None,
+                   cache_dir=None, **options):
+    """Build projects in a process pool and yield `BuildResult` objects
+    as soon as they are ready (not in order of `paths`).
+
+    Every project is built in a fresh worker process, so module imports
+    and `sys.path` changes made by one project never leak into another.
+
+    :param list[str] paths: project root dirs
+    :param bool plain: build `PlainProjectPackage` instead of `ProjectPackage`
+    :param dict config: config passed to `build()`
+    :param int processes: pool size, cpu count by default
+    :param str cache_dir: `BuildCache` dir, no caching by default
+    :param options: other `ProjectPackage` arguments
+    """
+    if cache_dir:
+        options['cache'] = BuildCache(cache_dir)
+    tasks = [(n, path, plain, config, options)
+             for n, path in enumerate(paths)]
+    pool = Pool(processes=processes, maxtasksperchild=1)
+    try:
+        for result in pool.imap_unordered(_build_project, tasks):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+class OrderedReporter(object):
+    """Collect per-project status lines and print them in original order
+    while projects finish in arbitrary order. Safe to use from several
+    threads.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lines = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def report(self, index, line):
+        with self._lock:
+            self._lines[index] = line
+            while self._next in self._lines:
+                self.stream.write(self._lines.pop(self._next))
+                self.stream.flush()
+                self._next += 1
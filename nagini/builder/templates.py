@@ -1,14 +1,44 @@
 # -*- coding: utf8 -*-
 from os.path import dirname, abspath, join, exists
-from jinja2 import Template
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
 if exists(abspath(join(dirname(__file__), "../../data"))):
     _templates_dir = abspath(join(dirname(__file__), "../../data"))
 else:
     _templates_dir = "/usr/share/nagini"
 
+_environment = None
+
+
+def get_environment():
+    """Return shared jinja environment. Templates are compiled once per
+    process and compiled bytecode is cached on disk between builds.
+    """
+    global _environment
+    if _environment is None:
+        _environment = Environment(
+            loader=FileSystemLoader(_templates_dir),
+            bytecode_cache=FileSystemBytecodeCache()
+        )
+    return _environment
+
 
 def render_template(filename, **kwargs):
-    with open(join(_templates_dir, filename)) as fd:
-        template = Template(fd.read())
-    return template.render(**kwargs)
+    return get_environment().get_template(filename).render(**kwargs)
+
+
+def render_templates(items):
+    """Render many templates in one pass
+
+    :param items: iterable of (output name, template filename, context)
+    :return: output name -> rendered content
+    :rtype: dict[str,unicode]
+    """
+    env = get_environment()
+    templates = {}
+    result = {}
+    for name, filename, context in items:
+        if filename not in templates:
+            templates[filename] = env.get_template(filename)
+        result[name] = templates[filename].render(**context)
+    return result
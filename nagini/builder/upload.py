@@ -0,0 +1,129 @@
+# -*- coding: utf8 -*-
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import threading
+import traceback
+from multiprocessing.pool import ThreadPool
+from os.path import dirname, exists, expanduser
+
+DEFAULT_MANIFEST = '~/.cache/nagini/uploads.json'
+
+UPLOADED = 'OK'
+SKIPPED = 'SKIP'
+FAILED = 'FAIL'
+
+
+class UploadManifest(object):
+    """Digest of the last uploaded zip of every project per host::
+
+        {"<host>": {"<project>": "<digest>"}}
+
+    Projects whose zip digest equals the recorded one are not uploaded
+    again. The manifest only knows about uploads made from this machine,
+    use `force` of `Uploader` after changing projects by other means.
+    """
+
+    def __init__(self, path=DEFAULT_MANIFEST):
+        self.path = expanduser(path)
+        self._lock = threading.Lock()
+        self.digests = {}
+        if exists(self.path):
+            try:
+                with open(self.path) as fd:
+                    self.digests = json.load(fd)
+            except ValueError:
+                pass
+
+    def changed(self, host, project, digest):
+        with self._lock:
+            return self.digests.get(host, {}).get(project) != digest
+
+    def record(self, host, project, digest):
+        with self._lock:
+            self.digests.setdefault(host, {})[project] = digest
+
+    def save(self):
+        with self._lock:
+            if not exists(dirname(self.path)):
+                os.makedirs(dirname(self.path), 0o700)
+            with open(self.path + '.tmp', 'w') as fd:
+                json.dump(self.digests, fd, indent=2, sort_keys=True)
+            os.rename(self.path + '.tmp', self.path)
+
+
+class Uploader(object):
+    """Upload project zips in a thread pool, skipping projects whose zip
+    did not change since the last upload to the same host.
+
+    `AzkabanClient` keeps a connection pool, so threads share its
+    connections and session. Callbacks run in the thread calling
+    `poll()` and `close()`, never in pool threads.
+    """
+
+    def __init__(self, client, manifest=None, concurrency=4, force=False):
+        """
+        :param AzkabanClient client: logged in client
+        :param UploadManifest manifest: no skipping if not set
+        :param int concurrency: max simultaneous uploads
+        :param bool force: upload unchanged projects too
+        """
+        self.client = client
+        self.manifest = manifest
+        self.force = force
+        self.pool = ThreadPool(concurrency)
+        self._pending = []  # (async result, callback)
+
+    def submit(self, name, zip_path, digest, callback):
+        """Schedule upload of project zip
+
+        :param callback: called with (status, error traceback or None)
+        by `poll()` or `close()` after the upload, or right away for
+        skipped projects
+        """
+        if self.manifest and not self.force and \
+                not self.manifest.changed(self.client.host, name, digest):
+            callback(SKIPPED, None)
+            return
+        self._pending.append((self.pool.apply_async(
+            self._upload, (name, zip_path, digest)), callback))
+
+    def _upload(self, name, zip_path, digest):
+        try:
+            self.client.upload_project_zip(name, zip_path)
+        except Exception:
+            return FAILED, traceback.format_exc()
+        if self.manifest:
+            # saved right away, so uploads are known even if build dies
+            self.manifest.record(self.client.host, name, digest)
+            self.manifest.save()
+        return UPLOADED, None
+
+    @staticmethod
+    def _report(result, callback):
+        try:
+            status, error = result.get()
+        except Exception:
+            status, error = FAILED, traceback.format_exc()
+        callback(status, error)
+
+    def poll(self):
+        """Run callbacks of finished uploads in the calling thread"""
+        finished = [p for p in self._pending if p[0].ready()]
+        for pending in finished:
+            self._pending.remove(pending)
+            self._report(*pending)
+
+    def close(self):
+        """Wait for all uploads running their callbacks"""
+        self.pool.close()
+        try:
+            while self._pending:
+                result, callback = self._pending.pop(0)
+                while not result.ready():
+                    # timeout keeps main thread interruptible on python 2
+                    result.wait(1)
+                self._report(result, callback)
+        finally:
+            self.pool.join()
@@ -1,10 +1,8 @@
 # -*- coding: utf8 -*-
 from nagini.loader import load_module, path_to_import
 from nagini.flow import BaseFlow, EmbeddedFlow
-from templates import render_template
 from nagini.utility import flatten
 from nagini.job import BaseJob
-from os.path import join
 import inspect
 
 
@@ -14,6 +12,8 @@ class JobWrapper(object):
     dependencies = None
     class_obj = None
     flow = None  # main flow
+    chain = None  # wrappers of fused jobs run by this one, see optimizer
+    fused_into = None  # wrapper running this job if it was fused
     _job_type = "command"
 
     def __init__(self, class_obj, project):
@@ -36,24 +36,44 @@ class JobWrapper(object):
         except TypeError:
             # print "Error in class", self.class_obj
             return
+        registry = self.flow.registry
         for require in flatten(job.requires()):
-            if isinstance(require, EmbeddedFlow):
-                wrapper = EmbeddedFlowWrapper(require.__class__, self.project)
-            elif isinstance(require, BaseFlow):
-                wrapper = EmbeddedFlowWrapper(require.__class__, self.project)
-                wrapper._build_deps = False
-            elif isinstance(require, BaseJob):
-                wrapper = JobWrapper(require.__class__, self.project)
+            key = (require.__class__, require.__class__.name)
+            if key in registry:
+                wrapper = registry[key]
             else:
-                continue
-            wrapper.flow = self.flow
-            wrapper.build()
-            self.dependencies.append(wrapper)
+                if isinstance(require, EmbeddedFlow):
+                    wrapper = EmbeddedFlowWrapper(require.__class__,
+                                                  self.project)
+                elif isinstance(require, BaseFlow):
+                    wrapper = EmbeddedFlowWrapper(require.__class__,
+                                                  self.project)
+                    wrapper._build_deps = False
+                elif isinstance(require, BaseJob) and require.partitions:
+                    wrapper = PartitionedJobWrapper(require.__class__,
+                                                    self.project)
+                elif isinstance(require, BaseJob):
+                    wrapper = JobWrapper(require.__class__, self.project)
+                else:
+                    continue
+                wrapper.flow = self.flow
+                registry[key] = wrapper
+                wrapper.build()
+            if wrapper not in self.dependencies:
+                self.dependencies.append(wrapper)
 
     def build(self):
+        """Build DAG of job, files are made later by `make_files()`"""
         self.build_dependencies()
-        self._make_launcher_file()
-        self._make_job_file()
+
+    def make_files(self):
+        if self.fused_into is None:
+            self._make_launcher_file()
+            self._make_job_file()
+
+    def _dag(self):
+        """Return {job name: names of dependencies} of written jobs"""
+        return {self._job_name(): [d._job_name() for d in self.dependencies]}
 
     def _job_filename(self):
         return self.name + ".job"
@@ -62,33 +82,102 @@ class JobWrapper(object):
         return self.name
 
     def _make_job_file(self):
-        content = render_template(
-            filename="job-template.job.j2",
-            type=self._job_type,
-            dependencies=[d._job_name() for d in self.dependencies],
-            name=self.name,
-            retries=getattr(self.class_obj, "retries", 0),
-            retry_backoff=getattr(self.class_obj, "retry_backoff", 0)
-        )
-        filename = join(self.project.base_dir, self._job_filename())
-        with open(filename, "w") as fd:
-            fd.write(content)
+        context = {
+            "type": self._job_type,
+            "dependencies": [d._job_name() for d in self.dependencies],
+            "name": self.name,
+            "retries": getattr(self.class_obj, "retries", 0),
+            "retry_backoff": getattr(self.class_obj, "retry_backoff", 0)
+        }
+        self.project.add_generated(self._job_filename(),
+                                   "job-template.job.j2", context)
 
     def _make_launcher_file(self):
-        content = render_template(
-            filename="launcher.py.j2",
-            import_path=self.import_path,
-            name=self.name
-        )
-        filename = join(self.project.base_dir, self.name + "Launcher.py")
-        with open(filename, "w") as fd:
-            fd.write(content)
+        context = {
+            "chain": [{"import_path": w.import_path, "name": w.name}
+                      for w in self.chain or [self]],
+            "bytecode": bool(self.project.compile_python),
+            "layers": self.project.layers
+        }
+        self.project.add_generated(self.name + "Launcher.py",
+                                   "launcher.py.j2", context)
+
+
+class PartitionedJobWrapper(JobWrapper):
+    """Job run as one Azkaban job per partition (`<name>-<value>.job`
+    setting `partition_property` to the value) sharing one launcher. A
+    noop job with the name of the job joins partitions, so dependents
+    wait for all of them.
+    """
+
+    def partition_names(self):
+        return self.class_obj.partition_names()
+
+    def _dag(self):
+        dependencies = [d._job_name() for d in self.dependencies]
+        result = dict((name, dependencies) for name in self.partition_names())
+        result[self._job_name()] = self.partition_names()
+        return result
+
+    def _make_job_file(self):
+        names = self.partition_names()
+        for name, value in zip(names, self.class_obj.partitions):
+            context = {
+                "type": self._job_type,
+                "dependencies": [d._job_name() for d in self.dependencies],
+                "name": name,
+                "launcher": self.name,
+                "retries": getattr(self.class_obj, "retries", 0),
+                "retry_backoff": getattr(self.class_obj, "retry_backoff", 0),
+                "properties": [(self.class_obj.partition_property, value)]
+            }
+            self.project.add_generated(name + ".job", "job-template.job.j2",
+                                       context)
+        context = {
+            "type": "noop",
+            "dependencies": names,
+            "name": self.name,
+            "retries": 0
+        }
+        self.project.add_generated(self._job_filename(),
+                                   "job-template.job.j2", context)
 
 
 class FlowWrapper(JobWrapper):
-    def build(self):
-        self.build_dependencies()
+    """Root of generated DAG. Every job of flow is wrapped and written
+    exactly once, no matter how many paths lead to it.
+    """
+
+    def __init__(self, class_obj, project):
+        JobWrapper.__init__(self, class_obj, project)
+        self.registry = {}  # (job class, name) -> wrapper
+
+    @property
+    def nodes(self):
+        """Wrappers of jobs written to project except fused ones"""
+        return [w for w in self.registry.values() if w.fused_into is None]
+
+    @property
+    def node_count(self):
+        return len(self.dag())
+
+    @property
+    def edge_count(self):
+        return sum(len(deps) for deps in self.dag().values())
+
+    def dag(self):
+        """Return {job name: names of dependencies} of written jobs,
+        partitioned jobs contribute their partitions and the join
+        """
+        result = {}
+        for wrapper in self.nodes + [self]:
+            result.update(wrapper._dag())
+        return result
+
+    def make_files(self):
         if self.dependencies:
+            for wrapper in self.registry.values():
+                wrapper.make_files()
             self._make_launcher_file()
             self._make_job_file()
 
@@ -0,0 +1,161 @@
+# -*- coding: utf8 -*-
+"""Hash checked bytecode for project zips.
+
+Azkaban extracts project zips into a new execution dir with fresh
+timestamps, so ordinary .pyc files are never valid there and every job
+recompiles the modules it imports. Bytecode written here is validated by
+the hash of its source instead of timestamps:
+
+    <dir>/__nagini_pyc__/<module>.pyc = magic + sha1(source) + marshal(code)
+
+`install()` (called by generated launchers) adds an import hook that
+loads such bytecode when it matches both the interpreter and the source,
+falling back to the regular import otherwise.
+
+Compile a project with the target interpreter::
+
+    python -m nagini.bytecode <project dir> <output dir> <display prefix>
+"""
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import imp
+import json
+import marshal
+import os
+import sys
+import time
+from os.path import abspath, dirname, exists, join
+
+PYC_DIR = '__nagini_pyc__'
+MAGIC = imp.get_magic()
+_HEADER_SIZE = len(MAGIC) + 20
+
+
+def bytecode_path(source_path):
+    head, tail = os.path.split(source_path)
+    return join(head, PYC_DIR, tail[:-3] + '.pyc')
+
+
+def source_hash(source):
+    return hashlib.sha1(source).digest()
+
+
+def compile_tree(src_root, out_root, prefix=''):
+    """Compile every module of src_root to hash checked bytecode in
+    out_root (same relative layout)
+
+    :param str prefix: prefix of file names shown in tracebacks
+    :return: number of compiled modules and total compile time in seconds
+    :rtype: (int, float)
+    """
+    count = 0
+    spent = 0.0
+    for dir_path, dir_names, file_names in os.walk(src_root):
+        dir_names[:] = [d for d in dir_names
+                        if d not in ('__pycache__', PYC_DIR)]
+        for file_name in file_names:
+            if not file_name.endswith('.py'):
+                continue
+            path = join(dir_path, file_name)
+            rel_path = os.path.relpath(path, src_root)
+            with open(path, 'rb') as fd:
+                source = fd.read()
+            started = time.time()
+            try:
+                code = compile(source, join(prefix, rel_path), 'exec',
+                               0, True)
+            except SyntaxError:
+                continue
+            spent += time.time() - started
+
+            target = bytecode_path(join(out_root, rel_path))
+            if not exists(dirname(target)):
+                os.makedirs(dirname(target))
+            with open(target, 'wb') as fd:
+                fd.write(MAGIC + source_hash(source) + marshal.dumps(code))
+            count += 1
+    return count, spent
+
+
+class HashedBytecodeFinder(object):
+    """Import hook loading valid hash checked bytecode of modules placed
+    under `root`
+    """
+
+    def __init__(self, root):
+        self.root = abspath(root)
+
+    def find_module(self, fullname, path=None):
+        tail = fullname.rpartition('.')[2]
+        for entry in path or sys.path:
+            entry = abspath(entry or '.')
+            if entry != self.root and \
+                    not entry.startswith(self.root + os.sep):
+                continue
+            candidates = ((join(entry, tail, '__init__.py'), True),
+                          (join(entry, tail + '.py'), False))
+            for source, is_package in candidates:
+                if exists(source):
+                    code = self._load_code(source)
+                    if code is None:
+                        return None
+                    return HashedBytecodeLoader(source, code, is_package)
+        return None
+
+    @staticmethod
+    def _load_code(source):
+        pyc = bytecode_path(source)
+        if not exists(pyc):
+            return None
+        with open(pyc, 'rb') as fd:
+            data = fd.read()
+        if data[:len(MAGIC)] != MAGIC:
+            return None
+        with open(source, 'rb') as fd:
+            if data[len(MAGIC):_HEADER_SIZE] != source_hash(fd.read()):
+                return None
+        try:
+            return marshal.loads(data[_HEADER_SIZE:])
+        except (ValueError, EOFError, TypeError):
+            return None
+
+
+class HashedBytecodeLoader(object):
+    def __init__(self, source, code, is_package):
+        self.source = source
+        self.code = code
+        self.is_package = is_package
+
+    def load_module(self, fullname):
+        if fullname in sys.modules:
+            return sys.modules[fullname]
+        module = imp.new_module(fullname)
+        module.__file__ = self.source
+        module.__loader__ = self
+        if self.is_package:
+            module.__path__ = [dirname(self.source)]
+            module.__package__ = fullname
+        else:
+            module.__package__ = fullname.rpartition('.')[0]
+        sys.modules[fullname] = module
+        try:
+            exec(self.code, module.__dict__)
+        except BaseException:
+            del sys.modules[fullname]
+            raise
+        return sys.modules[fullname]
+
+
+def install(root):
+    """Load hash checked bytecode of modules under `root` if available"""
+    for finder in sys.meta_path:
+        if isinstance(finder, HashedBytecodeFinder) and \
+                finder.root == abspath(root):
+            return
+    sys.meta_path.insert(0, HashedBytecodeFinder(root))
+
+
+if __name__ == '__main__':
+    modules, seconds = compile_tree(*sys.argv[1:4])
+    print(json.dumps({'modules': modules, 'seconds': seconds}))
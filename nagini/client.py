@@ -2,27 +2,189 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import logging
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 from os.path import basename, join
 
 import requests
+from requests.adapters import HTTPAdapter
 from six import iteritems
 
+from nagini.execution import ExecutionState, FINISHED_STATUSES
+from nagini.multipart import MultipartEncoder
+
 logger = logging.getLogger(__name__)
 
+RETRY_STATUSES = (500, 502, 503, 504)
+LOG_PAGE_SIZE = 1 << 20
+POLL_TICK = 0.05  # seconds between checks of polls in flight
+
 
 class AzkabanClientError(Exception):
     pass
 
 
+class ExecutionTimeout(AzkabanClientError):
+    pass
+
+
+class AzkabanResponseError(AzkabanClientError):
+    """Api call answered with error status or not with json"""
+
+    def __init__(self, status_code, body, call=''):
+        AzkabanClientError.__init__(
+            self, 'Server returned %d to %s:\n%s'
+                  % (status_code, call, body[:1000]))
+        self.status_code = status_code
+        self.body = body
+
+
+class PendingResult(object):
+    """Result of call finished by another thread, has the interface of
+    `multiprocessing.pool.AsyncResult`
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def ready(self):
+        return self._event.is_set()
+
+    def successful(self):
+        if not self.ready():
+            raise ValueError('Result is not ready')
+        return self._error is None
+
+    def wait(self, timeout=None):
+        self._event.wait(timeout)
+
+    def get(self, timeout=None):
+        self.wait(timeout)
+        if not self.ready():
+            raise TimeoutError
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def resolve(self, value=None, error=None):
+        self._value = value
+        self._error = error
+        self._event.set()
+
+
+class ExecutionWait(PendingResult):
+    """Waiting for execution to finish, result is its final state"""
+
+    def __init__(self, exec_id, timeout=None, on_transition=None,
+                 min_interval=1, max_interval=30):
+        PendingResult.__init__(self)
+        self.exec_id = exec_id
+        self.timeout = timeout
+        self.deadline = time.time() + timeout if timeout is not None \
+            else None
+        self.on_transition = on_transition
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.state = None
+        self.due = 0  # time of next poll
+        self.poll = None  # AsyncResult of poll in flight
+
+    def step(self, state, transitions):
+        """Handle result of poll
+
+        :return: seconds to the next poll or None if execution finished
+        """
+        self.state = state
+        if self.on_transition:
+            for transition in transitions:
+                self.on_transition(*transition)
+        if state.finished:
+            return None
+        if transitions:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 1.5, self.max_interval)
+        if self.deadline is None:
+            return self.interval
+        left = self.deadline - time.time()
+        if left <= 0:
+            raise ExecutionTimeout('Execution %s is still %s after %ss'
+                                   % (self.exec_id, state.status,
+                                      self.timeout))
+        return min(self.interval, left)
+
+
 class AzkabanClient(object):
     session_id = None
+    _credentials = None
 
-    def __init__(self, host):
+    def __init__(self, host, timeout=(10, 300), retries=3, backoff=0.5,
+                 pool_size=10, session_cache=None):
+        """
+        :param str host: Azkaban url
+        :param (float,float) timeout: connect and read timeouts in seconds
+        :param int retries: retries of idempotent calls failed with
+        connection error, timeout or 5xx response
+        :param float backoff: delay before first retry, doubled every retry
+        :param int pool_size: max kept alive connections to host
+        :param nagini.sessions.SessionCache session_cache: reuse session
+        of previous logins of the same user
+        """
         self.host = host
+        self.session_cache = session_cache
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._login_lock = threading.Lock()
+
+    def _request(self, method, url, idempotent, **kwargs):
+        """Send request through pooled session, retrying idempotent ones
+        on transient errors with exponential backoff
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            try:
+                r = self.session.request(method, url, **kwargs)
+                if not idempotent or r.status_code not in RETRY_STATUSES or \
+                        attempt >= self.retries:
+                    return r
+                reason = 'status %d' % r.status_code
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not idempotent or attempt >= self.retries:
+                    raise
+                reason = repr(e)
+            delay = self.backoff * 2 ** attempt
+            attempt += 1
+            logger.warning('Retry %d of %s %s in %.1fs: %s', attempt,
+                           method.upper(), url, delay, reason)
+            time.sleep(delay)
 
     def login(self, username, password):
-        r = requests.post(
-            url=self.host,
+        """Login or take session from session cache. Cached session is
+        checked by the first api call and renewed if server rejects it.
+        """
+        self._credentials = (username, password)
+        if self.session_cache:
+            session_id = self.session_cache.get(self.host, username)
+            if session_id:
+                self.session_id = session_id
+                return
+        self._login(username, password)
+
+    def _login(self, username, password):
+        r = self._request(
+            'post', self.host, idempotent=True,
             data={
                 'action': 'login',
                 'username': username,
@@ -44,18 +206,50 @@ class AzkabanClient(object):
             raise Exception('Authentication fails. Server return: %s' % json_data)
         else:
             self.session_id = json_data['session.id']
+            self._credentials = (username, password)
+            if self.session_cache:
+                self.session_cache.set(self.host, username, self.session_id)
 
-    def _call_api(self, method, suffix, params, **kwargs):
-        params.update({'session.id': self.session_id})
-        r = requests.request(method, join(self.host, suffix), params=params, **kwargs)
+    def _call_api(self, method, suffix, params, idempotent=None, **kwargs):
+        """Call api and return parsed json. Expired session is renewed
+        once if client was logged in with `login()`
 
-        try:
-            return r.json()
-        except BaseException:
-            params_ = params.copy()
-            params_.pop('session.id')
-            logger.exception('Error while api "%s" call "%s", params: %s', method, suffix, params)
-            raise
+        :param bool idempotent: call may be retried, by default only GET
+        calls are retried
+        """
+        if idempotent is None:
+            idempotent = method.lower() == 'get'
+        relogin = self._credentials is not None
+        while True:
+            session_id = self.session_id
+            params.update({'session.id': session_id})
+            r = self._request(method, join(self.host, suffix),
+                              idempotent=idempotent, params=params, **kwargs)
+            call = '%s %s' % (method.upper(), suffix)
+            content_type = r.headers.get('Content-Type') or 'json'
+            if r.status_code >= 400 or 'json' not in content_type:
+                # e.g. html error page of 5xx after non-retried call
+                raise AzkabanResponseError(r.status_code, r.text, call)
+            try:
+                result = r.json()
+            except ValueError:
+                params_ = params.copy()
+                params_.pop('session.id')
+                logger.exception('Error while api "%s" call "%s", params: %s',
+                                 method, suffix, params_)
+                raise AzkabanResponseError(r.status_code, r.text, call)
+            if relogin and isinstance(result, dict) and \
+                    result.get('error') == 'session':
+                with self._login_lock:
+                    # other threads may have already renewed it
+                    if self.session_id == session_id:
+                        logger.info('Session expired, login again')
+                        self._login(*self._credentials)
+                relogin = False
+                if hasattr(kwargs.get('data'), 'seek'):
+                    kwargs['data'].seek(0)  # streamed body is sent again
+                continue
+            return result
 
     def delete_project(self, name):
         return self._call_api(method='get',
@@ -69,16 +263,20 @@ class AzkabanClient(object):
                                       'name': name,
                                       'description': description})
 
-    def upload_project_zip(self, project, filename):
-        r = self._call_api(
-            method='post', suffix='manager', params={},
-            data={'ajax': 'upload', 'project': project},
-            files={
-                'file': (basename(filename),
-                         open(filename, 'rb'),
-                         'application/zip')
-            }
-        )
+    def upload_project_zip(self, project, filename, progress=None):
+        """Upload zip streaming it from disk
+
+        :param progress: called with (sent bytes, total bytes)
+        """
+        with MultipartEncoder(
+            fields=[('ajax', 'upload'), ('project', project)],
+            files=[('file', basename(filename), filename, 'application/zip')],
+            callback=progress
+        ) as body:
+            r = self._call_api(
+                method='post', suffix='manager', params={}, data=body,
+                headers={'Content-Type': body.content_type}
+            )
         err = 'None' if r is None else r.get('error', 'empty')
         if not r or r.get('error'):
             raise AzkabanClientError('Fail to upload project zip: %s' % err)
@@ -93,7 +291,30 @@ class AzkabanClient(object):
             'project': project,
             'flow': flow
         })
-        return self._call_api(method='get', suffix='executor', params=kwargs)
+        return self._call_api(method='get', suffix='executor', params=kwargs,
+                              idempotent=False)
+
+    def get_project_flows(self, project):
+        """Return names of flows of project"""
+        result = self._call_api('get', 'manager', {
+            'ajax': 'fetchprojectflows',
+            'project': project
+        })
+        return [f['flowId'] for f in result.get('flows', [])]
+
+    def get_flow_executions(self, project, flow, start=0, length=100):
+        """Return page of executions of flow, newest first
+
+        :return: dict with `executions` (execId, status, submitTime,
+        startTime, endTime...) and `total`
+        """
+        return self._call_api('get', 'manager', {
+            'ajax': 'fetchFlowExecutions',
+            'project': project,
+            'flow': flow,
+            'start': start,
+            'length': length
+        })
 
     def get_running_executions(self, project, flow):
         """Return list of ids of current running executions
@@ -114,6 +335,58 @@ class AzkabanClient(object):
         return self._call_api('get', 'executor',
                               {'ajax': 'fetchexecflow', 'execid': exec_id})
 
+    def get_execution_options(self, exec_id):
+        """Return execution options, flow properties are in `flowParam`"""
+        return self._call_api('get', 'executor',
+                              {'ajax': 'flowInfo', 'execid': exec_id})
+
+    def get_execution_update(self, exec_id, last_update_time):
+        """Return execution fields and nodes changed after
+        `last_update_time` (ms)
+        """
+        return self._call_api('get', 'executor', {
+            'ajax': 'fetchexecflowupdate',
+            'execid': exec_id,
+            'lastUpdateTime': last_update_time
+        })
+
+    def poll_execution(self, exec_id, state=None):
+        """Fetch execution state, only changes are fetched for known one
+
+        :param ExecutionState state: state to update
+        :return: state and its transitions, see `ExecutionState.merge`
+        :rtype: (ExecutionState, list)
+        """
+        if state is None:
+            state = ExecutionState(exec_id)
+            payload = self.get_execution_info(exec_id)
+        else:
+            payload = self.get_execution_update(exec_id, state.update_time)
+        if 'error' in payload:
+            raise AzkabanClientError('Fail to poll execution %s: %s'
+                                     % (exec_id, payload['error']))
+        return state, state.merge(payload)
+
+    def wait_for_execution(self, exec_id, timeout=None, on_transition=None,
+                           min_interval=1, max_interval=30):
+        """Poll execution until it finishes and return its final state.
+        Interval grows from `min_interval` to `max_interval` while nothing
+        changes and drops back on every change.
+
+        :param float timeout: seconds to wait, raise `ExecutionTimeout`
+        after that
+        :param on_transition: called with (nested job id or None for flow,
+        old status, new status) for every status change
+        :rtype: ExecutionState
+        """
+        wait = ExecutionWait(exec_id, timeout, on_transition, min_interval,
+                             max_interval)
+        while True:
+            interval = wait.step(*self.poll_execution(exec_id, wait.state))
+            if interval is None:
+                return wait.state
+            time.sleep(interval)
+
     def get_job_logs(self, exec_id, job_name, offset=0, length=None):
         if length:
             return self._call_api('get', 'executor', {
@@ -124,21 +397,248 @@ class AzkabanClient(object):
                 'length': length
             })
         else:
-            result = {'data': '', 'length': None, 'offset': offset}
-            while True:
-                ret = self._call_api('get', 'executor', {
-                    'ajax': 'fetchExecJobLogs',
-                    'execid': exec_id,
-                    'jobId': job_name,
-                    'offset': offset,
-                    'length': 10000
-                })
-                result['data'] += ret['data']
-                if ret['length'] < 10000:
-                    break
-                offset += 10000
-            result['length'] = len(result['data'])
-            return result
+            data = ''.join(self.iter_job_logs(exec_id, job_name, offset))
+            return {'data': data, 'length': len(data), 'offset': offset}
+
+    def iter_job_logs(self, exec_id, job_name, offset=0,
+                      page_size=LOG_PAGE_SIZE, follow=False, poll_interval=5):
+        """Yield chunks of job log as soon as they are fetched
+
+        :param int page_size: max bytes fetched by one request
+        :param bool follow: keep polling log of a running job until it
+        finishes, like `tail -f`
+        :param float poll_interval: seconds between polls in follow mode
+        """
+        finished = False
+        while True:
+            ret = self._call_api('get', 'executor', {
+                'ajax': 'fetchExecJobLogs',
+                'execid': exec_id,
+                'jobId': job_name,
+                'offset': offset,
+                'length': page_size
+            })
+            if 'error' in ret and not follow:
+                raise AzkabanClientError('Fail to fetch log of %s: %s'
+                                         % (job_name, ret['error']))
+            length = ret.get('length') or 0
+            if length:
+                offset += length
+                yield ret['data']
+            if length >= page_size:
+                continue
+            if not follow or finished:
+                return
+            # one more read after job finished gets the rest of the log
+            finished = self.is_job_finished(exec_id, job_name)
+            if not finished:
+                time.sleep(poll_interval)
+
+    def write_job_logs(self, exec_id, job_name, sink, encoding='utf8',
+                       **kwargs):
+        """Write job log to file-like `sink` chunk by chunk
+
+        :param str encoding: encoding of chunks written to binary sink,
+        None for text sinks
+        :param kwargs: arguments of `iter_job_logs`
+        :return: number of written chunks
+        """
+        count = 0
+        for chunk in self.iter_job_logs(exec_id, job_name, **kwargs):
+            sink.write(chunk.encode(encoding) if encoding else chunk)
+            count += 1
+        return count
+
+    def is_job_finished(self, exec_id, job_name):
+        """Check if job of execution (or the whole execution) finished"""
+        info = self.get_execution_info(exec_id)
+        nodes = list(info.get('nodes', []))
+        while nodes:
+            node = nodes.pop()
+            if node.get('id') == job_name or \
+                    node.get('nestedId') == job_name:
+                return node.get('status') in FINISHED_STATUSES
+            nodes.extend(node.get('nodes', []))
+        return info.get('status') in FINISHED_STATUSES
 
     def reload_executors(self):
         return self._call_api('post', 'executor', {'ajax': 'reloadExecutors'})
+
+
+def _submit(name):
+    def method(self, *args, **kwargs):
+        return self.pool.apply_async(getattr(self.client, name), args,
+                                     kwargs)
+    method.__name__ = str(name)
+    method.__doc__ = 'Call `AzkabanClient.%s` in pool, return AsyncResult' \
+        % name
+    return method
+
+
+class ConcurrentAzkabanClient(object):
+    """`AzkabanClient` for tracking many executions at once.
+
+    API calls are run by a thread pool sharing one pooled session, so at
+    most `concurrency` requests are in flight. Every call returns
+    `multiprocessing.pool.AsyncResult`, use `.get()` to wait for result::
+
+        client = ConcurrentAzkabanClient(host, concurrency=50)
+        client.login(user, password)
+        infos = client.map('get_execution_info', exec_ids)
+
+    Waits for executions don't hold pool threads: one poller thread
+    tracks all of them and sends only polls that are due through the
+    pool. Followed job logs are written by threads of their own.
+    """
+
+    def __init__(self, host, concurrency=20, **kwargs):
+        """
+        :param int concurrency: max simultaneous requests
+        :param kwargs: other `AzkabanClient` arguments
+        """
+        self.client = AzkabanClient(host, pool_size=concurrency, **kwargs)
+        self.pool = ThreadPool(concurrency)
+        self._waits = []
+        self._waits_changed = threading.Condition()
+        self._poller = None
+        self._closed = False
+
+    @property
+    def host(self):
+        return self.client.host
+
+    def login(self, username, password):
+        """Login synchronously, session is shared by all calls"""
+        self.client.login(username, password)
+
+    delete_project = _submit('delete_project')
+    create_project = _submit('create_project')
+    upload_project_zip = _submit('upload_project_zip')
+    execute_flow = _submit('execute_flow')
+    get_running_executions = _submit('get_running_executions')
+    get_project_flows = _submit('get_project_flows')
+    get_flow_executions = _submit('get_flow_executions')
+    get_execution_info = _submit('get_execution_info')
+    get_execution_options = _submit('get_execution_options')
+    get_job_logs = _submit('get_job_logs')
+    is_job_finished = _submit('is_job_finished')
+    poll_execution = _submit('poll_execution')
+
+    def write_job_logs(self, exec_id, job_name, sink, encoding='utf8',
+                       **kwargs):
+        """Call `AzkabanClient.write_job_logs` in pool, or in a thread of
+        its own with `follow`, return AsyncResult
+        """
+        args = (exec_id, job_name, sink, encoding)
+        if not kwargs.get('follow'):
+            return self.pool.apply_async(self.client.write_job_logs, args,
+                                         kwargs)
+        result = PendingResult()
+
+        def follow():
+            try:
+                result.resolve(self.client.write_job_logs(*args, **kwargs))
+            except Exception as e:
+                result.resolve(error=e)
+
+        thread = threading.Thread(target=follow)
+        thread.daemon = True
+        thread.start()
+        return result
+
+    def wait_for_execution(self, exec_id, timeout=None, on_transition=None,
+                           min_interval=1, max_interval=30):
+        """Like `AzkabanClient.wait_for_execution`, but the execution is
+        polled by the poller thread, `on_transition` is called from it
+
+        :rtype: ExecutionWait
+        """
+        wait = ExecutionWait(exec_id, timeout, on_transition, min_interval,
+                             max_interval)
+        with self._waits_changed:
+            if self._closed:
+                raise AzkabanClientError('Client is closed')
+            self._waits.append(wait)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_waits)
+                self._poller.daemon = True
+                self._poller.start()
+            self._waits_changed.notify()
+        return wait
+
+    def _poll_waits(self):
+        """Poller thread: send due polls through pool, handle finished
+        ones and sleep until the next poll is due
+        """
+        while True:
+            with self._waits_changed:
+                if self._closed:
+                    waits, self._waits = self._waits, []
+                    for wait in waits:
+                        wait.resolve(error=AzkabanClientError(
+                            'Client closed while waiting for execution %s'
+                            % wait.exec_id))
+                    return
+                waits = list(self._waits)
+            now = time.time()
+            for wait in waits:
+                if wait.poll is None and wait.due <= now:
+                    wait.poll = self.pool.apply_async(
+                        self.client.poll_execution, (wait.exec_id, wait.state))
+                elif wait.poll is not None and wait.poll.ready():
+                    self._handle_poll(wait)
+            with self._waits_changed:
+                self._waits = [w for w in self._waits if not w.ready()]
+                polls = [w for w in self._waits if w.poll is not None]
+                dues = [w.due for w in self._waits if w.poll is None]
+                if polls:
+                    delay = POLL_TICK
+                elif dues:
+                    delay = max(0, min(dues) - time.time())
+                else:
+                    delay = None
+                if delay is None or delay > 0:
+                    self._waits_changed.wait(delay)
+
+    @staticmethod
+    def _handle_poll(wait):
+        poll, wait.poll = wait.poll, None
+        try:
+            interval = wait.step(*poll.get())
+        except Exception as e:
+            wait.resolve(error=e)
+            return
+        if interval is None:
+            wait.resolve(wait.state)
+        else:
+            wait.due = time.time() + interval
+
+    def map(self, method, items):
+        """Call method for every item (argument or tuple of arguments)
+        and return results in order of items
+        """
+        func = getattr(self.client, method)
+        return self.pool.map(
+            lambda item: func(*item) if isinstance(item, tuple)
+            else func(item),
+            items
+        )
+
+    def close(self):
+        """Stop poller, executions still waited for fail, and wait for
+        other calls
+        """
+        with self._waits_changed:
+            self._closed = True
+            self._waits_changed.notify()
+        if self._poller is not None:
+            self._poller.join()
+        self.pool.close()
+        self.pool.join()
+        self.client.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,329 @@
+# -*- coding: utf8 -*-
+"""Critical path and parallelism analysis of flows.
+
+A graph is built either from an execution (`get_execution_info` payload)
+using actual job timings, or from a flow DAG built by the builder with
+estimated durations, e.g. p50 of `ExecutionHistory.percentiles`::
+
+    python -m nagini.critical_path -H http://azkaban:8081 -u user \\
+        -P pass 12345
+    python -m nagini.critical_path --json execution.json
+
+Embedded flows are flattened: their jobs are keyed by nested id and
+inherit dependencies of the embedded flow node.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import json
+
+SKIPPED_STATUSES = ('SKIPPED', 'DISABLED', 'CANCELLED', 'READY')
+
+
+class Node(object):
+    """Job of analyzed graph, times are seconds from flow start"""
+
+    def __init__(self, name, dependencies=(), duration=0, start=None,
+                 end=None):
+        self.name = name
+        self.dependencies = list(dependencies)
+        self.duration = duration
+        self.start = start  # actual start, None for estimated graphs
+        self.end = end
+        # filled by `analyze`
+        self.earliest_start = self.latest_start = None
+        self.ready = None  # actual time all dependencies finished
+        self.finish = None  # actual end, ready time for jobs not run
+
+    @property
+    def earliest_finish(self):
+        return self.earliest_start + self.duration
+
+    @property
+    def slack(self):
+        return self.latest_start - self.earliest_start
+
+    @property
+    def queue_delay(self):
+        if self.start is None or self.ready is None:
+            return None
+        return max(self.start - self.ready, 0)
+
+
+def _seconds(value, origin):
+    if not value or value < 0:
+        return None
+    return (value - origin) / 1000.0
+
+
+def execution_graph(payload):
+    """Return {nested id: Node} of jobs of execution
+
+    :param dict payload: result of `AzkabanClient.get_execution_info`
+    """
+    origin = payload.get('startTime') or 0
+    graph = {}
+
+    def add(nodes, prefix, outer_dependencies):
+        # id in the embedded flow -> names of jobs finishing the node
+        sinks = {}
+        ids = set(node['id'] for node in nodes)
+        for node in _topological(nodes):
+            dependencies = []
+            for parent in node.get('in') or []:
+                dependencies.extend(sinks.get(parent, []))
+            if not node.get('in'):
+                dependencies = list(outer_dependencies)
+            key = prefix + node['id']
+            if node.get('nodes'):
+                sinks[node['id']] = add(node['nodes'], key + ':',
+                                        dependencies)
+                continue
+            start = _seconds(node.get('startTime'), origin)
+            end = _seconds(node.get('endTime'), origin)
+            duration = 0
+            if start is not None and end is not None and \
+                    node.get('status') not in SKIPPED_STATUSES:
+                duration = max(end - start, 0)
+            graph[key] = Node(key, dependencies, duration, start, end)
+            sinks[node['id']] = [key]
+        used = set(p for node in nodes for p in node.get('in') or [])
+        return [name for i in ids - used for name in sinks[i]]
+
+    add(payload.get('nodes', []), '', [])
+    return graph
+
+
+def _topological(nodes):
+    by_id = dict((node['id'], node) for node in nodes)
+    result, seen = [], set()
+
+    def visit(node):
+        if node['id'] in seen:
+            return
+        seen.add(node['id'])
+        for parent in node.get('in') or []:
+            if parent in by_id:
+                visit(by_id[parent])
+        result.append(node)
+
+    for node in nodes:
+        visit(node)
+    return result
+
+
+def flow_graph(dag, durations=None):
+    """Return {job name: Node} of flow DAG built by the builder
+
+    :param dict dag: `FlowWrapper.dag()`, also kept by `ProjectPackage` in
+    `dags` after build
+    :param dict durations: {job name: estimated seconds}, 0 for missing
+    jobs
+    """
+    durations = durations or {}
+    return dict((name, Node(name, dependencies, durations.get(name, 0)))
+                for name, dependencies in dag.items())
+
+
+class Analysis(object):
+    """Critical path of graph with per-job slack and parallelism.
+
+    Slack and the critical path use job durations only, as if every job
+    started as soon as its dependencies finished. For executions actual
+    times are used too: `queue_delay` of a job is the time between its
+    dependencies finishing and its start, `actual_path` is the chain of
+    jobs that finished last, queueing included.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.order = self._order()
+        self._schedule()
+        self.length = max([n.earliest_finish for n in self.graph.values()]
+                          or [0])
+        for node in reversed(self.order):
+            finish = min([self.graph[d].latest_start
+                          for d in self._dependents[node.name]] or
+                         [self.length])
+            node.latest_start = finish - node.duration
+        self.path = self._path(lambda n: n.earliest_finish)
+        self.actual_path = []
+        if self.wall_time is not None:
+            self.actual_path = self._path(lambda n: n.finish)
+
+    def _order(self):
+        self._dependents = dict((name, []) for name in self.graph)
+        for node in self.graph.values():
+            for dependency in node.dependencies:
+                self._dependents[dependency].append(node.name)
+        order, seen = [], set()
+        for name in sorted(self.graph):
+            stack = [(name, False)]
+            while stack:
+                name, expanded = stack.pop()
+                if expanded:
+                    order.append(self.graph[name])
+                elif name not in seen:
+                    seen.add(name)
+                    stack.append((name, True))
+                    stack.extend((d, False) for d in
+                                 reversed(self.graph[name].dependencies))
+        return order
+
+    def _schedule(self):
+        for node in self.order:
+            parents = [self.graph[d] for d in node.dependencies]
+            node.earliest_start = max([p.earliest_finish for p in parents]
+                                      or [0])
+            node.ready = max([p.finish for p in parents] or [0])
+            node.finish = node.ready if node.end is None else node.end
+
+    def _path(self, finish):
+        """Walk back from the node finishing last through the dependency
+        that finished last
+        """
+        if not self.graph:
+            return []
+        # the last node in topological order wins ties, so path ends at
+        # the flow rather than at its last job
+        node = max(reversed(self.order), key=finish)
+        path = [node]
+        while node.dependencies:
+            node = max((self.graph[d] for d in node.dependencies),
+                       key=finish)
+            path.append(node)
+        return [n.name for n in reversed(path)]
+
+    @property
+    def work(self):
+        """Sum of job durations"""
+        return sum(n.duration for n in self.graph.values())
+
+    @property
+    def wall_time(self):
+        """Actual time from flow start to the last job end or None"""
+        ends = [n.end for n in self.graph.values() if n.end is not None]
+        return max(ends) if ends else None
+
+    @property
+    def possible_parallelism(self):
+        """Average parallelism with unlimited executor slots"""
+        return self.work / self.length if self.length else 0
+
+    @property
+    def achieved_parallelism(self):
+        wall_time = self.wall_time
+        return self.work / wall_time if wall_time else None
+
+    @property
+    def queue_delay(self):
+        """Sum of queue delays of jobs on the actual path"""
+        return sum(self.graph[name].queue_delay or 0
+                   for name in self.actual_path)
+
+    def to_dict(self):
+        return {
+            'critical_path': self.path,
+            'critical_path_length': self.length,
+            'actual_path': self.actual_path,
+            'actual_path_queue_delay': self.queue_delay,
+            'work': self.work,
+            'wall_time': self.wall_time,
+            'possible_parallelism': self.possible_parallelism,
+            'achieved_parallelism': self.achieved_parallelism,
+            'jobs': dict((n.name, {
+                'duration': n.duration,
+                'earliest_start': n.earliest_start,
+                'slack': n.slack,
+                'start': n.start,
+                'queue_delay': n.queue_delay,
+                'dependencies': n.dependencies
+            }) for n in self.order)
+        }
+
+    def report(self, top=10):
+        """Return human readable report"""
+        lines = ['Work: %s, critical path: %s, possible parallelism: %.2f'
+                 % (_duration(self.work), _duration(self.length),
+                    self.possible_parallelism)]
+        if self.wall_time is not None:
+            lines.append('Wall time: %s, achieved parallelism: %.2f, queue '
+                         'delay on actual path: %s'
+                         % (_duration(self.wall_time),
+                            self.achieved_parallelism or 0,
+                            _duration(self.queue_delay)))
+        lines.append('')
+        lines.append('Critical path (speed up or split these jobs):')
+        for name in self.path:
+            lines.append('  %-40s %10s' % (name, _duration(
+                self.graph[name].duration)))
+        if self.actual_path and self.actual_path != self.path:
+            lines.append('')
+            lines.append('Actual path:')
+            for name in self.actual_path:
+                node = self.graph[name]
+                lines.append('  %-40s %10s  queued %s' % (
+                    name, _duration(node.duration),
+                    _duration(node.queue_delay or 0)))
+        delayed = sorted((n for n in self.order if n.queue_delay),
+                         key=lambda n: -n.queue_delay)[:top]
+        if delayed:
+            lines.append('')
+            lines.append('Longest queue delays:')
+            for node in delayed:
+                lines.append('  %-40s %10s' % (node.name,
+                                               _duration(node.queue_delay)))
+        lines.append('')
+        lines.append('Slack of jobs off the critical path:')
+        for node in sorted((n for n in self.order if n.name not in self.path),
+                           key=lambda n: (n.slack, n.name))[:top]:
+            lines.append('  %-40s %10s' % (node.name, _duration(node.slack)))
+        return '\n'.join(lines)
+
+
+def _duration(seconds):
+    seconds = int(round(seconds))
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60,
+                             seconds % 60)
+
+
+def analyze(payload):
+    """Analyze execution payload of `AzkabanClient.get_execution_info`"""
+    return Analysis(execution_graph(payload))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Critical path of Azkaban flow execution')
+    parser.add_argument('execution',
+                        help='Execution id or path to json execution info')
+    parser.add_argument('-H', '--host')
+    parser.add_argument('-u', '--user')
+    parser.add_argument('-P', '--password')
+    parser.add_argument('--json', action='store_true', default=False,
+                        help='Print analysis as json')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of jobs in slack and delay lists')
+    args = parser.parse_args(argv)
+
+    if args.execution.isdigit():
+        from nagini.client import AzkabanClient
+
+        if not args.host:
+            parser.error('--host is required to fetch execution')
+        client = AzkabanClient(args.host)
+        client.login(args.user, args.password)
+        payload = client.get_execution_info(int(args.execution))
+    else:
+        with open(args.execution) as fd:
+            payload = json.load(fd)
+
+    analysis = analyze(payload)
+    if args.json:
+        print(json.dumps(analysis.to_dict(), indent=2, sort_keys=True))
+    else:
+        print(analysis.report(args.top))
+
+
+if __name__ == '__main__':
+    main()
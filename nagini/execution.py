@@ -0,0 +1,60 @@
+# -*- coding: utf8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+FINISHED_STATUSES = ('SUCCEEDED', 'FAILED', 'KILLED', 'CANCELLED', 'SKIPPED',
+                     'FAILED_SUCCEEDED')
+
+
+class ExecutionState(object):
+    """Local copy of flow execution kept up to date with incremental
+    updates (`fetchexecflowupdate`) that contain only changed nodes.
+
+    Nodes of embedded flows are keyed by their nested id
+    (`<embedded flow>:<job>`).
+    """
+
+    def __init__(self, exec_id):
+        self.exec_id = exec_id
+        self.status = None
+        self.update_time = 0
+        self.info = {}  # flow level fields of the last payload
+        self.nodes = {}  # nested id -> node without children
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def merge(self, payload):
+        """Merge full or incremental payload
+
+        :return: (nested id or None for flow, old status, new status) of
+        every changed status, flow goes last
+        :rtype: list[(str,str,str)]
+        """
+        transitions = []
+        self._merge_nodes(payload.get('nodes', []), '', transitions)
+        self.info.update((k, v) for k, v in payload.items() if k != 'nodes')
+        if payload.get('status') and payload['status'] != self.status:
+            transitions.append((None, self.status, payload['status']))
+            self.status = payload['status']
+        self.update_time = max(self.update_time,
+                               payload.get('updateTime') or 0)
+        return transitions
+
+    def _merge_nodes(self, nodes, prefix, transitions):
+        for node in nodes:
+            key = node.get('nestedId') or prefix + node['id']
+            known = self.nodes.setdefault(key, {})
+            old = known.get('status')
+            known.update((k, v) for k, v in node.items() if k != 'nodes')
+            if node.get('status') and node['status'] != old:
+                transitions.append((key, old, node['status']))
+            self.update_time = max(self.update_time,
+                                   node.get('updateTime') or 0)
+            if node.get('nodes'):
+                self._merge_nodes(node['nodes'], key + ':', transitions)
+
+    def statuses(self):
+        """Return {nested id: status} of all known nodes"""
+        return dict((key, node.get('status'))
+                    for key, node in self.nodes.items())
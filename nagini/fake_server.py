@@ -0,0 +1,431 @@
+# -*- coding: utf8 -*-
+"""Local stand-in for Azkaban web server to test and benchmark clients.
+
+Implements the endpoints used by `AzkabanClient`: login, project
+create/delete/upload, flow listing, executeFlow, getRunning,
+fetchexecflow, fetchexecflowupdate, flowInfo, fetchExecJobLogs and
+reloadExecutors::
+
+    with FakeAzkabanServer(latency=0.05, failure_rate=0.01) as server:
+        client = AzkabanClient(server.host)
+        client.login('user', 'password')
+        client.create_project('p')
+        client.upload_project_zip('p', 'p.zip')
+        exec_id = client.execute_flow('p', 'MainFlow')['execid']
+
+Uploaded zips are parsed like Azkaban does: every `.job` file no other
+job depends on is a flow. Executions are simulated in real time with
+unlimited executor slots: every job runs `job_duration` seconds after
+its dependencies finished and succeeds, its log grows linearly while it
+runs.
+
+Any login is accepted. Sessions are dropped by `expire_sessions()`.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import cgi
+import io
+import json
+import random
+import threading
+import time
+import uuid
+import zipfile
+from os.path import basename, splitext
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import parse_qs, urlparse
+
+
+LOG_LINE = 64  # bytes of every line of fake job logs
+
+
+def _log_line(n):
+    return ('%08d INFO - fake job output line' % n).ljust(LOG_LINE - 1) + \
+        '\n'
+
+
+def _now():
+    return int(time.time() * 1000)
+
+
+def parse_project_zip(content):
+    """Return {flow name: {job name: dependency names}} of project zip"""
+    jobs = {}
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        for name in archive.namelist():
+            if not name.endswith('.job'):
+                continue
+            dependencies = []
+            for line in archive.read(name).decode('utf8').splitlines():
+                key, _, value = line.partition('=')
+                if key.strip() == 'dependencies':
+                    dependencies = [d.strip() for d in value.split(',')
+                                    if d.strip()]
+            jobs[splitext(basename(name))[0]] = dependencies
+    used = set(d for dependencies in jobs.values() for d in dependencies)
+    flows = {}
+    for flow in set(jobs) - used:
+        dag, stack = {}, [flow]
+        while stack:
+            job = stack.pop()
+            if job not in dag and job in jobs:
+                dag[job] = jobs[job]
+                stack.extend(jobs[job])
+        flows[flow] = dag
+    return flows
+
+
+class FakeExecution(object):
+    """Flow execution with precomputed job schedule"""
+
+    def __init__(self, exec_id, project, flow, dag, job_duration,
+                 properties):
+        self.exec_id = exec_id
+        self.project = project
+        self.flow = flow
+        self.properties = properties
+        self.submit_time = _now()
+        self.schedule = {}  # job -> (start ms, end ms)
+
+        def schedule(job):
+            if job not in self.schedule:
+                start = max([schedule(d)[1] for d in dag[job]] or
+                            [self.submit_time])
+                self.schedule[job] = (start,
+                                      start + int(job_duration * 1000))
+            return self.schedule[job]
+
+        for job in dag:
+            schedule(job)
+        self.dag = dag
+        self.end_time = max(end for _, end in self.schedule.values())
+
+    def _node(self, job, now):
+        start, end = self.schedule[job]
+        if now < start:
+            status, update_time = 'READY', self.submit_time
+        elif now < end:
+            status, update_time = 'RUNNING', start
+        else:
+            status, update_time = 'SUCCEEDED', end
+        return {
+            'id': job,
+            'nestedId': job,
+            'type': 'command',
+            'in': self.dag[job],
+            'status': status,
+            'startTime': start if now >= start else -1,
+            'endTime': end if now >= end else -1,
+            'updateTime': update_time,
+            'attempt': 0
+        }
+
+    def running(self, now=None):
+        return (now or _now()) < self.end_time
+
+    def summary(self, now=None):
+        now = now or _now()
+        running = self.running(now)
+        return {
+            'execId': self.exec_id,
+            'projectName': self.project,
+            'flowId': self.flow,
+            'status': 'RUNNING' if running else 'SUCCEEDED',
+            'submitTime': self.submit_time,
+            'startTime': self.submit_time,
+            'endTime': -1 if running else self.end_time
+        }
+
+    def info(self, last_update_time=None):
+        """fetchexecflow payload, only changed nodes if `last_update_time`
+        is set (fetchexecflowupdate)
+        """
+        now = _now()
+        nodes = [self._node(job, now) for job in sorted(self.dag)]
+        if last_update_time is not None:
+            nodes = [n for n in nodes if n['updateTime'] > last_update_time]
+        summary = self.summary(now)
+        return {
+            'execid': self.exec_id,
+            'project': self.project,
+            'flow': self.flow,
+            'flowId': self.flow,
+            'id': self.flow,
+            'status': summary['status'],
+            'submitTime': self.submit_time,
+            'startTime': self.submit_time,
+            'endTime': summary['endTime'],
+            'updateTime': min(now, self.end_time),
+            'nodes': nodes
+        }
+
+
+class FakeAzkabanServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0, jitter=0, failure_rate=0,
+                 failure_status=503, job_duration=1, log_size=1 << 16,
+                 seed=None):
+        """
+        :param int port: random free port by default
+        :param float latency: seconds added to every response
+        :param float jitter: max random seconds added to latency
+        :param float failure_rate: probability of answering with
+        `failure_status` instead of handling request
+        :param float job_duration: seconds every job of execution runs
+        :param int log_size: bytes of log of every job
+        """
+        HTTPServer.__init__(self, ('127.0.0.1', port), FakeAzkabanHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.job_duration = job_duration
+        self.log_size = log_size
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.projects = {}  # name -> {flow: dag}, empty before upload
+        self.executions = {}  # exec id -> FakeExecution
+        self.requests = 0
+        self.failures = 0
+        self._thread = None
+
+    @property
+    def host(self):
+        return 'http://127.0.0.1:%d' % self.server_port
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def expire_sessions(self):
+        with self.lock:
+            self.sessions.clear()
+
+    def add_project(self, name, flows):
+        """Register project without uploading zip
+
+        :param dict flows: {flow name: {job name: dependency names}}
+        """
+        with self.lock:
+            self.projects[name] = flows
+
+    def job_log(self, execution, job, offset, length):
+        start, end = execution.schedule[job]
+        now = _now()
+        if now < start:
+            available = 0
+        elif now >= end or end == start:
+            available = self.log_size
+        else:
+            available = self.log_size * (now - start) // (end - start)
+        length = max(0, min(length, available - offset))
+        data = ''.join(_log_line(n) for n in range(
+            offset // LOG_LINE, (offset + length) // LOG_LINE + 1))
+        data = data[offset % LOG_LINE:offset % LOG_LINE + length]
+        return {'data': data, 'offset': offset, 'length': length}
+
+    def handle_api(self, path, params, form):
+        """Return json response of api call"""
+        if path == '/' and params.get('action') == 'login':
+            session_id = uuid.uuid4().hex
+            with self.lock:
+                self.sessions.add(session_id)
+            return {'status': 'success', 'session.id': session_id}
+        if params.get('session.id') not in self.sessions:
+            return {'error': 'session'}
+        handler = getattr(self, '_api_%s' % (params.get('ajax') or
+                                              params.get('action') or
+                                              'delete' in params and
+                                              'delete'), None)
+        if path not in ('/manager', '/executor') or handler is None:
+            return {'error': 'Unknown call %s %s' % (path, params)}
+        return handler(params, form)
+
+    def _api_create(self, params, form):
+        with self.lock:
+            if params['name'] in self.projects:
+                return {'status': 'error',
+                        'message': 'Project already exists.'}
+            self.projects[params['name']] = {}
+        return {'status': 'success', 'path': 'manager?project=%s'
+                                             % params['name']}
+
+    def _api_delete(self, params, form):
+        with self.lock:
+            self.projects.pop(params['project'], None)
+        return {}
+
+    def _api_upload(self, params, form):
+        project = params['project']
+        if project not in self.projects:
+            return {'error': 'Installation Failed. Project \'%s\' doesn\'t '
+                             'exist.' % project}
+        try:
+            flows = parse_project_zip(form['file'].file.read())
+        except zipfile.BadZipfile as e:
+            return {'error': 'Installation Failed. %s' % e}
+        with self.lock:
+            self.projects[project] = flows
+        return {'projectId': sorted(self.projects).index(project) + 1,
+                'version': 1}
+
+    def _api_fetchprojectflows(self, params, form):
+        flows = self.projects.get(params['project'])
+        if flows is None:
+            return {'error': 'Project %s doesn\'t exist.' % params['project']}
+        return {'project': params['project'],
+                'flows': [{'flowId': f} for f in sorted(flows)]}
+
+    def _api_fetchFlowExecutions(self, params, form):
+        start, length = int(params['start']), int(params['length'])
+        with self.lock:
+            executions = [e for e in self.executions.values()
+                          if e.project == params['project'] and
+                          e.flow == params['flow']]
+        executions.sort(key=lambda e: -e.exec_id)
+        return {'project': params['project'], 'flow': params['flow'],
+                'from': start, 'length': length, 'total': len(executions),
+                'executions': [e.summary() for e in
+                               executions[start:start + length]]}
+
+    def _api_executeFlow(self, params, form):
+        project, flow = params['project'], params['flow']
+        dag = (self.projects.get(project) or {}).get(flow)
+        if dag is None:
+            return {'error': 'Flow %s not found in project %s'
+                             % (flow, project)}
+        properties = dict((key[len('flowOverride['):-1], value)
+                          for key, value in params.items()
+                          if key.startswith('flowOverride['))
+        with self.lock:
+            exec_id = len(self.executions) + 1
+            self.executions[exec_id] = FakeExecution(
+                exec_id, project, flow, dag, self.job_duration, properties)
+        return {'project': project, 'flow': flow, 'execid': exec_id,
+                'message': 'Execution submitted successfully with exec id %d'
+                           % exec_id}
+
+    def _api_getRunning(self, params, form):
+        with self.lock:
+            executions = list(self.executions.values())
+        exec_ids = [e.exec_id for e in executions
+                    if e.project == params['project'] and
+                    e.flow == params['flow'] and e.running()]
+        return {'execIds': exec_ids} if exec_ids else {}
+
+    def _execution(self, params):
+        return self.executions.get(int(params['execid']))
+
+    def _api_fetchexecflow(self, params, form):
+        execution = self._execution(params)
+        if execution is None:
+            return {'error': 'Cannot find execution \'%s\''
+                             % params['execid']}
+        return execution.info()
+
+    def _api_fetchexecflowupdate(self, params, form):
+        execution = self._execution(params)
+        if execution is None:
+            return {'error': 'Cannot find execution \'%s\''
+                             % params['execid']}
+        return execution.info(int(params['lastUpdateTime']))
+
+    def _api_flowInfo(self, params, form):
+        execution = self._execution(params)
+        if execution is None:
+            return {'error': 'Cannot find execution \'%s\''
+                             % params['execid']}
+        return {'successEmails': [], 'failureEmails': [],
+                'successEmailsOverride': False,
+                'failureEmailsOverride': False,
+                'notifyFailureFirst': False, 'notifyFailureLast': False,
+                'failureAction': 'FINISH_CURRENTLY_RUNNING',
+                'flowParam': execution.properties,
+                'concurrentOptions': 'ignore', 'pipelineLevel': None,
+                'pipelineExecution': None, 'queueLevel': 0,
+                'nodeStatus': dict((n['id'], n['status'])
+                                   for n in execution.info()['nodes']),
+                'disabled': []}
+
+    def _api_fetchExecJobLogs(self, params, form):
+        execution = self._execution(params)
+        if execution is None or params['jobId'] not in execution.schedule:
+            return {'error': 'Job %s not found' % params['jobId']}
+        return self.job_log(execution, params['jobId'],
+                            int(params['offset']), int(params['length']))
+
+    def _api_reloadExecutors(self, params, form):
+        return {'status': 'success'}
+
+
+class FakeAzkabanHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        url = urlparse(self.path)
+        params = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        form = None
+        if self.command == 'POST':
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('multipart/form-data'):
+                form = cgi.FieldStorage(fp=self.rfile, headers=self.headers,
+                                        environ={
+                                            'REQUEST_METHOD': 'POST',
+                                            'CONTENT_TYPE': content_type
+                                        })
+                params.update((k, form.getvalue(k)) for k in form.keys()
+                              if not form[k].filename)
+            else:
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode('utf8')
+                params.update((k, v[0]) for k, v in parse_qs(body).items())
+
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            delay = server.latency + server.random.random() * server.jitter
+            failed = server.random.random() < server.failure_rate
+            if failed:
+                server.failures += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            self._send(server.failure_status, 'Service Unavailable',
+                       'text/plain')
+            return
+        result = server.handle_api(url.path, params, form)
+        self._send(200, json.dumps(result), 'application/json')
+
+    def _send(self, status, body, content_type):
+        body = body.encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
@@ -2,14 +2,108 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import abc
+import threading
+from multiprocessing.pool import ThreadPool
 from os.path import join
 
 import yaml
 
-from nagini.client import AzkabanClient
+from nagini.client import AzkabanClient, AzkabanClientError
 from nagini.properties import props
+from nagini.sessions import SessionCache
 from nagini.utility import flatten
 
+_configs = {}  # config path -> config
+_clients = {}  # (host, username) -> logged in client
+_clients_lock = threading.Lock()
+
+
+def load_config(path=None):
+    """Return config.yml of project, parsed once per process"""
+    path = path or join(props['working.dir'], 'config.yml')
+    if path not in _configs:
+        with open(path) as fd:
+            _configs[path] = yaml.load(fd)
+    return _configs[path]
+
+
+def get_client(config):
+    """Return logged in client for server of config, one per process"""
+    server = config['server']
+    key = (server['host'], server['username'])
+    with _clients_lock:
+        if key not in _clients:
+            session_cache = server.get('session_cache')
+            if session_cache:  # true or path of cache file
+                session_cache = SessionCache() if session_cache is True \
+                    else SessionCache(session_cache)
+            client = AzkabanClient(server['host'],
+                                   session_cache=session_cache)
+            client.login(server['username'], server['password'])
+            _clients[key] = client
+        return _clients[key]
+
+
+def start_flows(flows, concurrency=4, skip_running=True,
+                concurrent_option='skip', config=None):
+    """Start many flows of project with one client
+
+    :param list[(type,dict)] flows: (flow class, properties) pairs,
+    duplicates are started once
+    :param int concurrency: max simultaneous requests
+    :param bool skip_running: don't start flow if it is already running
+    with the same properties
+    :param str concurrent_option: Azkaban option for flows running with
+    other properties, like in `BaseFlow.start`. With 'skip' Azkaban
+    refuses to start them, pass 'ignore' to run them concurrently
+    :return: exec id of every started or already running flow, in order
+    of `flows`
+    :rtype: list[int]
+    """
+    config = config or load_config()
+    client = get_client(config)
+    project = config['project']
+    items = [(cls.name or cls.__name__,
+              dict((k, '%s' % v) for k, v in (properties or {}).items()))
+             for cls, properties in flows]
+    unique = []
+    for item in items:
+        if item not in unique:
+            unique.append(item)
+    pool = ThreadPool(concurrency)
+    try:
+        running = {}  # flow name -> [(exec id, properties)]
+        if skip_running:
+            names = sorted(set(name for name, _ in unique))
+            for name, exec_ids in zip(names, pool.map(
+                    lambda n: client.get_running_executions(project, n),
+                    names)):
+                # fetchexecflow has no properties, flowInfo has them
+                infos = pool.map(client.get_execution_options, exec_ids)
+                running[name] = [(exec_id, info.get('flowParam') or {})
+                                 for exec_id, info in zip(exec_ids, infos)]
+
+        def trigger(item):
+            name, properties = item
+            for exec_id, params in running.get(name, []):
+                if params == properties:
+                    return exec_id, None
+            ret = client.execute_flow(project, name, properties,
+                                      concurrentOption=concurrent_option)
+            if 'execid' not in ret:
+                return None, '%s: %s' % (name, ret.get('error', ret))
+            return ret['execid'], None
+
+        results = pool.map(trigger, unique)
+    finally:
+        pool.close()
+        pool.join()
+    errors = [error for _, error in results if error]
+    if errors:
+        raise AzkabanClientError('Fail to start flows:\n' +
+                                 '\n'.join(errors))
+    return [results[unique.index(item)][0] for item in items]
+
 
 class BaseFlow(object):
     __metaclass__ = abc.ABCMeta
@@ -36,16 +130,11 @@ class BaseFlow(object):
         pipeline, queue
         :rtype:
         """
-        # LOAD CONFIG
-        with open(join(props['working.dir'], 'config.yml')) as fd:
-            config = yaml.load(fd)
-
-        client = AzkabanClient(config['server']['host'])
-        client.login(config['server']['username'],
-                     config['server']['password'])
-        return client.execute_flow(config['project'], cls.name or cls.__name__,
-                                   properties,
-                                   concurrentOption=concurrent_option)
+        config = load_config()
+        return get_client(config).execute_flow(
+            config['project'], cls.name or cls.__name__, properties,
+            concurrentOption=concurrent_option
+        )
 
     def get_start_jobs(self):
         return list(BaseFlow._get_start_jobs(self))
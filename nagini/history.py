@@ -0,0 +1,316 @@
+# -*- coding: utf8 -*-
+"""Local cache of Azkaban execution history with duration analytics.
+
+Executions of project flows and timings of all their jobs are pulled
+into a SQLite database. Sync is incremental: executions are listed newest
+first and listing stops at the first one already stored, executions
+stored before they finished are fetched again::
+
+    python -m nagini.history --db history.db sync -H http://azkaban:8081 \\
+        -u user -P pass my_project
+    python -m nagini.history --db history.db percentiles --kind job \\
+        --period 86400
+    python -m nagini.history --db history.db regressions \\
+        --baseline-days 28 --current-days 7
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import json
+import logging
+import math
+import sqlite3
+import time
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+from nagini.execution import ExecutionState, FINISHED_STATUSES
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS executions (
+    exec_id INTEGER PRIMARY KEY,
+    project TEXT NOT NULL,
+    flow TEXT NOT NULL,
+    status TEXT,
+    submit_time INTEGER,
+    start_time INTEGER,
+    end_time INTEGER
+);
+CREATE INDEX IF NOT EXISTS executions_flow
+    ON executions (project, flow, start_time);
+CREATE TABLE IF NOT EXISTS jobs (
+    exec_id INTEGER NOT NULL REFERENCES executions (exec_id),
+    job TEXT NOT NULL,
+    status TEXT,
+    start_time INTEGER,
+    end_time INTEGER,
+    attempt INTEGER,
+    PRIMARY KEY (exec_id, job)
+);
+CREATE INDEX IF NOT EXISTS jobs_job ON jobs (job, start_time);
+'''
+
+
+def percentile(values, point):
+    """Nearest-rank percentile of values, None for empty values"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = int(math.ceil(point / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+class ExecutionHistory(object):
+    """SQLite database of finished executions and their job timings.
+    Times are stored in milliseconds as returned by Azkaban, durations are
+    returned in seconds.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def known(self, exec_ids):
+        """Return exec ids already stored"""
+        exec_ids = list(exec_ids)
+        known = set()
+        for n in range(0, len(exec_ids), 500):
+            chunk = exec_ids[n:n + 500]
+            known.update(row[0] for row in self.db.execute(
+                'SELECT exec_id FROM executions WHERE exec_id IN (%s)'
+                % ','.join('?' * len(chunk)), chunk))
+        return known
+
+    def sync(self, client, project, flows=None, page_size=100,
+             concurrency=4):
+        """Fetch executions of project not seen before and refresh stored
+        executions that were not finished during the last sync
+
+        :param AzkabanClient client: logged in client
+        :param list[str] flows: all flows of project by default
+        :param int concurrency: simultaneous requests of execution details
+        :return: number of stored executions, executions Azkaban
+        answers with error for are skipped
+        """
+        if flows is None:
+            flows = client.get_project_flows(project)
+        exec_ids = []
+        for flow in flows:
+            exec_ids.extend(self._new_executions(client, project, flow,
+                                                 page_size))
+        exec_ids.extend(self._unfinished(project, flows))
+
+        stored = 0
+        pool = ThreadPool(concurrency)
+        try:
+            for exec_id, info in zip(exec_ids, pool.imap(
+                    client.get_execution_info, exec_ids)):
+                if 'error' in info:
+                    logger.warning('Skip execution %s: %s', exec_id,
+                                   info['error'])
+                    continue
+                self._store(project, info)
+                stored += 1
+        finally:
+            pool.close()
+            pool.join()
+        self.db.commit()
+        return stored
+
+    def _new_executions(self, client, project, flow, page_size):
+        """Yield ids of unseen executions of flow, newest first"""
+        start = 0
+        while True:
+            page = client.get_flow_executions(project, flow, start,
+                                              page_size)
+            executions = page.get('executions') or []
+            known = self.known(e['execId'] for e in executions)
+            for execution in executions:
+                if execution['execId'] in known:
+                    return
+                yield execution['execId']
+            start += len(executions)
+            if not executions or start >= page.get('total', 0):
+                return
+
+    def _unfinished(self, project, flows):
+        rows = self.db.execute(
+            'SELECT exec_id, flow FROM executions WHERE project = ? AND '
+            'status NOT IN (%s)' % ','.join('?' * len(FINISHED_STATUSES)),
+            (project,) + FINISHED_STATUSES)
+        return [exec_id for exec_id, flow in rows if flow in flows]
+
+    def _store(self, project, info):
+        state = ExecutionState(info['execid'])
+        state.merge(info)
+        self.db.execute(
+            'INSERT OR REPLACE INTO executions VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (state.exec_id, project, info.get('flowId') or info.get('flow'),
+             state.status, info.get('submitTime'), info.get('startTime'),
+             info.get('endTime'))
+        )
+        self.db.executemany(
+            'INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?)',
+            [(state.exec_id, job, node.get('status'), node.get('startTime'),
+              node.get('endTime'), node.get('attempt'))
+             for job, node in state.nodes.items()]
+        )
+
+    def durations(self, kind='job', since=None, until=None, name=None,
+                  status='SUCCEEDED'):
+        """Return (name, start time ms, duration s) of finished runs.
+        Flows are named 'project.flow' and jobs 'project.flow:job'.
+
+        :param str kind: 'job' or 'flow'
+        :param int since: start time in ms, inclusive
+        :param int until: start time in ms, exclusive
+        """
+        if kind == 'job':
+            name_column = "e.project || '.' || e.flow || ':' || t.job"
+            source = 'jobs t JOIN executions e ON e.exec_id = t.exec_id'
+        else:
+            name_column = "t.project || '.' || t.flow"
+            source = 'executions t'
+        query = 'SELECT %s, t.start_time, t.end_time FROM %s' % (
+            name_column, source)
+        conditions = ['t.start_time > 0', 't.end_time >= t.start_time']
+        args = []
+        for condition, value in (('t.start_time >= ?', since),
+                                 ('t.start_time < ?', until),
+                                 (name_column + ' = ?', name),
+                                 ('t.status = ?', status)):
+            if value is not None:
+                conditions.append(condition)
+                args.append(value)
+        query += ' WHERE ' + ' AND '.join(conditions)
+        return [(row[0], row[1], (row[2] - row[1]) / 1000.0)
+                for row in self.db.execute(query, args)]
+
+    def percentiles(self, kind='job', points=(50, 95), period=None,
+                    **filters):
+        """Return duration percentiles per job or flow and time period
+
+        :param int period: length of period in seconds, whole range if
+        not set
+        :param filters: arguments of `durations`
+        :return: (name, period start ms or None, runs, percentile...)
+        rows sorted by name and period
+        :rtype: list[tuple]
+        """
+        groups = defaultdict(list)
+        for name, start_time, duration in self.durations(kind, **filters):
+            bucket = None
+            if period:
+                bucket = start_time - start_time % int(period * 1000)
+            groups[(name, bucket)].append(duration)
+        return [(name, bucket, len(values)) +
+                tuple(percentile(values, p) for p in points)
+                for (name, bucket), values in sorted(groups.items())]
+
+    def regressions(self, baseline, current, kind='job', point=95,
+                    threshold=1.5, min_runs=3):
+        """Find jobs or flows whose duration percentile grew in `current`
+        window compared with `baseline` window
+
+        :param (int,int) baseline: (since, until) in ms
+        :param (int,int) current: (since, until) in ms
+        :param float threshold: min ratio of current to baseline
+        :param int min_runs: min runs in each window
+        :return: (name, baseline s, current s, ratio) sorted by ratio
+        :rtype: list[tuple]
+        """
+        windows = []
+        for since, until in (baseline, current):
+            groups = defaultdict(list)
+            for name, _, duration in self.durations(kind, since, until):
+                groups[name].append(duration)
+            windows.append(groups)
+        result = []
+        for name, values in windows[1].items():
+            before = windows[0].get(name, [])
+            if len(before) < min_runs or len(values) < min_runs:
+                continue
+            old, new = percentile(before, point), percentile(values, point)
+            ratio = new / old if old else float('inf')
+            if ratio >= threshold:
+                result.append((name, old, new, ratio))
+        return sorted(result, key=lambda r: -r[3])
+
+
+def main(argv=None):
+    from nagini.client import AzkabanClient
+
+    parser = argparse.ArgumentParser(
+        description='Sync and analyze Azkaban execution history')
+    parser.add_argument('--db', default='nagini-history.db')
+    parser.add_argument('--json', action='store_true', default=False,
+                        help='Print results as json')
+    commands = parser.add_subparsers(dest='command')
+
+    sync = commands.add_parser('sync', help='Fetch new executions')
+    sync.add_argument('projects', nargs='+')
+    sync.add_argument('-H', '--host', required=True)
+    sync.add_argument('-u', '--user', required=True)
+    sync.add_argument('-P', '--password', required=True)
+    sync.add_argument('-j', '--concurrency', type=int, default=4)
+
+    report = commands.add_parser('percentiles', help='Duration percentiles')
+    report.add_argument('--kind', choices=('job', 'flow'), default='job')
+    report.add_argument('--period', type=int, default=None,
+                        help='Group by periods of N seconds')
+    report.add_argument('--days', type=int, default=None,
+                        help='Only runs of last N days')
+
+    regressions = commands.add_parser('regressions',
+                                      help='Jobs that became slower')
+    regressions.add_argument('--kind', choices=('job', 'flow'),
+                             default='job')
+    regressions.add_argument('--baseline-days', type=int, default=28)
+    regressions.add_argument('--current-days', type=int, default=7)
+    regressions.add_argument('--point', type=int, default=95)
+    regressions.add_argument('--threshold', type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    history = ExecutionHistory(args.db)
+    now = int(time.time() * 1000)
+    day = 24 * 3600 * 1000
+    try:
+        if args.command == 'sync':
+            client = AzkabanClient(args.host, pool_size=args.concurrency)
+            client.login(args.user, args.password)
+            for project in args.projects:
+                count = history.sync(client, project,
+                                     concurrency=args.concurrency)
+                print('%s: %d new executions' % (project, count))
+            return
+        if args.command == 'percentiles':
+            since = now - args.days * day if args.days else None
+            header = ('name', 'period', 'runs', 'p50', 'p95')
+            rows = history.percentiles(args.kind, period=args.period,
+                                       since=since)
+        else:
+            current = (now - args.current_days * day, now)
+            baseline = (current[0] - args.baseline_days * day, current[0])
+            header = ('name', 'baseline', 'current', 'ratio')
+            rows = history.regressions(baseline, current, args.kind,
+                                       args.point, args.threshold)
+        if args.json:
+            print(json.dumps([dict(zip(header, row)) for row in rows],
+                             indent=2))
+        else:
+            for row in rows:
+                print('\t'.join('-' if v is None else
+                                '%.2f' % v if isinstance(v, float) else
+                                '%s' % v for v in row))
+    finally:
+        history.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 import json
 import logging
+import re
 import shutil
 import sys
 from abc import ABCMeta, abstractmethod
@@ -14,9 +15,11 @@ from os import environ, mkdir
 from os.path import exists, join
 
 import yaml
-from six import iteritems, itervalues, reraise
+from six import get_unbound_function, iteritems, reraise
 
+from nagini.client import AzkabanClientError
 from nagini.fields import BaseField
+from nagini.flow import start_flows
 from nagini.properties import props
 from nagini.target import Target
 from nagini.utility import flatten
@@ -55,6 +58,13 @@ class BaseJob(object):
     name = None
     retries = 0
     retry_backoff = 0
+    # may be run in one process with neighbours of a linear chain of jobs
+    # when project is built with DAG optimization
+    fusable = False
+    # partition axis: the builder generates one Azkaban job per value of
+    # `partitions` with `partition_property` set to it, plus a join job
+    partition_property = None
+    partitions = None
     config = None
 
     def __init__(self):
@@ -90,16 +100,12 @@ class BaseJob(object):
         """
         requires = self.requires()
         if isinstance(requires, (tuple, list, set)):
-            for job in requires:
-                job.configure()
-            outputs = [r.output() for r in requires]
+            outputs = [r.configured_output() for r in requires]
         elif isinstance(requires, BaseJob):
-            requires.configure()
-            outputs = requires.output()
+            outputs = requires.configured_output()
         elif isinstance(requires, dict):
-            for item in itervalues(requires):
-                item.configure()
-            outputs = {k: v.output() for k, v in iteritems(requires)}
+            outputs = {k: v.configured_output()
+                       for k, v in iteritems(requires)}
         else:
             raise ValueError('requires() must return BaseJob, list[BaseJob] '
                              'or dict[str, BaseJob]')
@@ -109,6 +115,30 @@ class BaseJob(object):
             output.output_flag = True
         return outputs
 
+    def configured_output(self):
+        """Configure job and return its output. Partitioned jobs return
+        list of outputs of all partitions in order of `partitions`
+        """
+        if not self.partitions:
+            self.configure()
+            return self.output()
+
+        name = self.partition_property
+        missing = object()
+        saved = props.get(name, missing)
+        outputs = []
+        try:
+            for value in self.partitions:
+                props[name] = '%s' % value
+                self.configure()
+                outputs.append(self.output())
+        finally:
+            if saved is missing:
+                props.pop(name, None)
+            else:
+                props[name] = saved
+        return outputs
+
     def is_complete(self):
         return False
 
@@ -155,6 +185,20 @@ class BaseJob(object):
             self.on_failure()
             reraise(*sys.exc_info())
 
+    @classmethod
+    def partition_names(cls):
+        """Names of jobs run per value of `partitions`, `<name>-<value>`"""
+        name = cls.name or cls.__name__
+        if not cls.partition_property:
+            raise ValueError('%s has partitions but no partition_property' %
+                             name)
+        names = ['%s-%s' % (name, re.sub(r'[^\w-]', '_', '%s' % value))
+                 for value in cls.partitions]
+        if len(set(names)) != len(names):
+            raise ValueError('Partitions of %s have clashing names: %s' %
+                             (name, ', '.join(names)))
+        return names
+
     def rupdate_props(self, other):
         """Like self.props.update but not override existing props"""
         props.update_not_override(other)
@@ -231,10 +275,12 @@ class IntervalDataChecker(BaseJob):
     prepared_data_pattern = None
     work_flow = None
     work_flow_params = None
+    start_concurrency = 4  # max simultaneous requests to Azkaban
 
     def run(self):
         end = None
         start = None
+        intervals = []
 
         if self.type == MONTHLY:
             end = datetime.now() - relativedelta(months=1, day=1, hour=0,
@@ -261,7 +307,9 @@ class IntervalDataChecker(BaseJob):
                 print('Prepared data not exists for', s, e)
                 if self.src_data_exists(s, e):
                     print('Start prepare data. Start: %s, End: %s' % (s, e))
-                    self.start_work_flow(s, e)
+                    intervals.append((s, e))
+        if intervals:
+            self.start_work_flows(intervals)
 
     @abstractmethod
     def src_data_exists(self, s, e):
@@ -273,7 +321,31 @@ class IntervalDataChecker(BaseJob):
         raise NotImplementedError('You must implement '
                                   '"dst_data_exists" method')
 
+    def start_work_flows(self, intervals):
+        """Start work flow for all intervals with one client, skipping
+        intervals already being prepared
+        """
+        if get_unbound_function(type(self).start_work_flow) is not \
+                get_unbound_function(IntervalDataChecker.start_work_flow):
+            # start of single interval is customized by subclass
+            for s, e in intervals:
+                self.start_work_flow(s, e)
+            return
+        flows = [(self.work_flow, self.get_work_flow_params(s, e))
+                 for s, e in intervals]
+        try:
+            exec_ids = start_flows(flows, concurrency=self.start_concurrency)
+        except AzkabanClientError as e:
+            # like single starts, flows refused by Azkaban (e.g. already
+            # running with concurrent option 'skip') don't fail the job
+            self.logger.warning('%s', e)
+        else:
+            print('Executions: %s' % ', '.join('%s' % i for i in exec_ids))
+
     def start_work_flow(self, s, e):
+        self.work_flow.start(self.get_work_flow_params(s, e))
+
+    def get_work_flow_params(self, s, e):
         params = deepcopy(self.work_flow_params) or {}
 
         if self.type == MONTHLY:
@@ -284,5 +356,4 @@ class IntervalDataChecker(BaseJob):
                            'end': e.strftime('%Y-%m-%d')})
         elif self.type == DAILY:
             params['day'] = s.strftime('%Y-%m-%d')
-
-        self.work_flow.start(params)
+        return params
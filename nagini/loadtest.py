@@ -0,0 +1,239 @@
+# -*- coding: utf8 -*-
+"""Load test of `AzkabanClient` against the fake server or real Azkaban.
+
+Measures throughput and latency percentiles of polling executions,
+fetching job logs and uploading project zips from many threads sharing
+one client::
+
+    python -m nagini.loadtest poll logs upload --requests 500 \\
+        --concurrency 20 --latency 0.02 --failure-rate 0.01
+    python -m nagini.loadtest poll -H http://azkaban:8081 -u user \\
+        -P pass --project nagini-loadtest
+
+The fake server (`nagini.fake_server`) is started unless `--host` is set.
+On a real server the project is created, used and deleted, so pick a
+name no one uses.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import json
+import os
+import shutil
+import time
+import zipfile
+from multiprocessing.pool import ThreadPool
+from os.path import join
+from tempfile import mkdtemp
+
+from nagini.client import AzkabanClient
+from nagini.fake_server import FakeAzkabanServer
+from nagini.history import percentile
+
+SCENARIOS = ('poll', 'logs', 'upload')
+
+
+def make_project_zip(path, jobs=10, padding=0):
+    """Write zip of one flow `Flow` of `jobs` jobs in a chain
+
+    :param int padding: bytes of random data added to zip
+    """
+    with zipfile.ZipFile(path, 'w') as archive:
+        for n in range(jobs):
+            lines = ['type=command', 'command=echo job%d' % n]
+            if n:
+                lines.append('dependencies=job%d' % (n - 1))
+            archive.writestr('job%d.job' % n, '\n'.join(lines) + '\n')
+        archive.writestr('Flow.job', 'type=noop\ndependencies=job%d\n'
+                         % (jobs - 1))
+        if padding:
+            archive.writestr('padding.bin', os.urandom(padding))
+    return path
+
+
+def measure(call, items, concurrency):
+    """Call `call(item)` for every item from `concurrency` threads
+
+    :return: calls, errors, seconds, calls per second and latency
+    percentiles in seconds
+    :rtype: dict
+    """
+    def timed(item):
+        started = time.time()
+        try:
+            call(item)
+            error = None
+        except Exception as e:
+            error = repr(e)
+        return time.time() - started, error
+
+    pool = ThreadPool(concurrency)
+    started = time.time()
+    try:
+        results = pool.map(timed, items)
+    finally:
+        pool.close()
+        pool.join()
+    seconds = time.time() - started
+    latencies = [latency for latency, _ in results]
+    errors = [error for _, error in results if error]
+    return {
+        'calls': len(results),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'seconds': seconds,
+        'throughput': len(results) / seconds if seconds else 0,
+        'latency': dict(('p%d' % p, percentile(latencies, p))
+                        for p in (50, 95, 99, 100))
+    }
+
+
+class LoadTest(object):
+    """Scenarios run against one project with flow `Flow`"""
+
+    def __init__(self, client, project, root, jobs=10, upload_size=0,
+                 concurrency=10, log_page_size=None):
+        self.client = client
+        self.project = project
+        self.concurrency = concurrency
+        self.log_page_size = log_page_size
+        self.zip_path = make_project_zip(join(root, project + '.zip'), jobs,
+                                         upload_size)
+        self.jobs = ['job%d' % n for n in range(jobs)]
+        self.exec_ids = []
+        self.finished_exec_id = None
+
+    def setup(self, scenarios):
+        """Create project and executions used by scenarios"""
+        self.client.create_project(self.project)
+        self.client.upload_project_zip(self.project, self.zip_path)
+        if 'poll' in scenarios:
+            self.exec_ids = [self._execute() for _ in range(10)]
+        if 'logs' in scenarios:
+            self.finished_exec_id = self._execute()
+            self.client.wait_for_execution(self.finished_exec_id,
+                                           min_interval=0.2, max_interval=2)
+
+    def teardown(self):
+        self.client.delete_project(self.project)
+
+    def _execute(self):
+        return self.client.execute_flow(self.project, 'Flow')['execid']
+
+    def poll(self, requests):
+        return measure(self.client.get_execution_info,
+                       [self.exec_ids[n % len(self.exec_ids)]
+                        for n in range(requests)],
+                       self.concurrency)
+
+    def logs(self, requests):
+        kwargs = {'page_size': self.log_page_size} \
+            if self.log_page_size else {}
+        return measure(lambda job: ''.join(self.client.iter_job_logs(
+            self.finished_exec_id, job, **kwargs)),
+            [self.jobs[n % len(self.jobs)] for n in range(requests)],
+            self.concurrency)
+
+    def upload(self, requests):
+        return measure(lambda _: self.client.upload_project_zip(
+            self.project, self.zip_path), range(requests), self.concurrency)
+
+
+def report(results):
+    print('%-8s %7s %7s %9s %9s %9s %9s %9s' % (
+        'scenario', 'calls', 'errors', 'calls/s', 'p50 ms', 'p95 ms',
+        'p99 ms', 'max ms'))
+    for name in SCENARIOS:
+        if name not in results:
+            continue
+        result = results[name]
+        print('%-8s %7d %7d %9.1f %9.1f %9.1f %9.1f %9.1f' % (
+            (name, result['calls'], result['errors'], result['throughput']) +
+            tuple(result['latency'][p] * 1000
+                  for p in ('p50', 'p95', 'p99', 'p100'))))
+        if result['first_error']:
+            print('    first error: %s' % result['first_error'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test Azkaban client')
+    parser.add_argument('scenarios', nargs='*',
+                        help='Some of %s, all by default'
+                        % ', '.join(SCENARIOS))
+    parser.add_argument('-n', '--requests', type=int, default=200,
+                        help='Calls per scenario')
+    parser.add_argument('-c', '--concurrency', type=int, default=10)
+    parser.add_argument('-H', '--host', default=None,
+                        help='Real server, fake one is started if not set')
+    parser.add_argument('-u', '--user', default='loadtest')
+    parser.add_argument('-P', '--password', default='loadtest')
+    parser.add_argument('--project', default='loadtest')
+    parser.add_argument('--jobs', type=int, default=10,
+                        help='Jobs in flow of test project')
+    parser.add_argument('--upload-size', type=int, default=1 << 20,
+                        help='Bytes of padding in uploaded zip')
+    parser.add_argument('--log-page-size', type=int, default=None)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--backoff', type=float, default=0.1)
+    fake = parser.add_argument_group('fake server')
+    fake.add_argument('--latency', type=float, default=0.01)
+    fake.add_argument('--jitter', type=float, default=0.01)
+    fake.add_argument('--failure-rate', type=float, default=0)
+    fake.add_argument('--job-duration', type=float, default=0.1)
+    fake.add_argument('--log-size', type=int, default=1 << 20)
+    fake.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', action='store_true', default=False,
+                        help='Print results as json')
+    args = parser.parse_args(argv)
+    scenarios = args.scenarios or SCENARIOS
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario %s' % name)
+
+    server = None
+    if args.host is None:
+        # failures are injected only while scenarios run, setup calls
+        # like executeFlow are not retried by client
+        server = FakeAzkabanServer(
+            latency=args.latency, jitter=args.jitter,
+            job_duration=args.job_duration, log_size=args.log_size,
+            seed=args.seed).start()
+    root = mkdtemp(prefix='nagini-loadtest-')
+    client = AzkabanClient(args.host or server.host, retries=args.retries,
+                           backoff=args.backoff, pool_size=args.concurrency)
+    results = {}
+    try:
+        client.login(args.user, args.password)
+        test = LoadTest(client, args.project, root, args.jobs,
+                        args.upload_size, args.concurrency,
+                        args.log_page_size)
+        test.setup(scenarios)
+        try:
+            for name in scenarios:
+                if server:
+                    server.failure_rate = args.failure_rate
+                results[name] = getattr(test, name)(args.requests)
+                if server:
+                    server.failure_rate = 0
+        finally:
+            test.teardown()
+        if server:
+            results['server'] = {'requests': server.requests,
+                                 'failures': server.failures}
+    finally:
+        client.session.close()
+        if server:
+            server.stop()
+        shutil.rmtree(root)
+
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        report(results)
+        if server:
+            print('fake server: %(requests)d requests, %(failures)d '
+                  'injected failures' % results['server'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import binascii
+import os
+from os.path import getsize
+
+from six import binary_type, text_type
+
+CRLF = b'\r\n'
+
+
+def _to_bytes(value):
+    if isinstance(value, binary_type):
+        return value
+    return text_type(value).encode('utf8')
+
+
+class MultipartEncoder(object):
+    """multipart/form-data body read in chunks, so files are streamed to
+    server instead of being loaded into memory.
+
+    Use it as `data` of requests call with `content_type` header::
+
+        with MultipartEncoder([('ajax', 'upload')],
+                              [('file', 'p.zip', path, 'application/zip')],
+                              callback=print) as body:
+            session.post(url, data=body,
+                         headers={'Content-Type': body.content_type})
+
+    Files are opened when their part is reached and closed as soon as they
+    are sent or the encoder is closed.
+    """
+
+    def __init__(self, fields=(), files=(), callback=None,
+                 chunk_size=1 << 16, boundary=None):
+        """
+        :param list[(str,str)] fields: form fields
+        :param list[(str,str,str,str)] files: (field name, file name,
+        path, content type) of uploaded files
+        :param callback: called with (sent bytes, total bytes) after every
+        read chunk
+        :param int chunk_size: max size of chunk returned by `read()`
+        """
+        self.boundary = boundary or \
+            binascii.hexlify(os.urandom(16)).decode('ascii')
+        self.callback = callback
+        self.chunk_size = chunk_size
+        self._parts = []  # bytes or (path, size)
+        delimiter = b'--' + _to_bytes(self.boundary)
+        for name, value in fields:
+            self._parts.append(
+                delimiter + CRLF +
+                b'Content-Disposition: form-data; name="' + _to_bytes(name) +
+                b'"' + CRLF + CRLF + _to_bytes(value) + CRLF
+            )
+        for name, filename, path, content_type in files:
+            self._parts.append(
+                delimiter + CRLF +
+                b'Content-Disposition: form-data; name="' + _to_bytes(name) +
+                b'"; filename="' + _to_bytes(filename) + b'"' + CRLF +
+                b'Content-Type: ' + _to_bytes(content_type) + CRLF + CRLF
+            )
+            self._parts.append((path, getsize(path)))
+            self._parts.append(CRLF)
+        self._parts.append(delimiter + b'--' + CRLF)
+        self.length = sum(len(p) if isinstance(p, binary_type) else p[1]
+                          for p in self._parts)
+        self._position = 0
+        self._part = 0
+        self._offset = 0  # position in current bytes part
+        self._fd = None
+
+    @property
+    def content_type(self):
+        return 'multipart/form-data; boundary=%s' % self.boundary
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        """Only rewinding to start is supported (used to resend body)"""
+        if offset != 0 or whence != 0:
+            raise IOError('MultipartEncoder can only seek to start')
+        self.close()
+        self._position = self._part = self._offset = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        chunk = b''
+        while len(chunk) < size and self._part < len(self._parts):
+            part = self._parts[self._part]
+            if isinstance(part, binary_type):
+                data = part[self._offset:self._offset + size - len(chunk)]
+                self._offset += len(data)
+                done = self._offset >= len(part)
+            else:
+                if self._fd is None:
+                    self._fd = open(part[0], 'rb')
+                data = self._fd.read(size - len(chunk))
+                done = not data
+                if done:
+                    self._fd.close()
+                    self._fd = None
+            chunk += data
+            if done:
+                self._part += 1
+                self._offset = 0
+        self._position += len(chunk)
+        if chunk and self.callback:
+            self.callback(self._position, self.length)
+        return chunk
+
+    def close(self):
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
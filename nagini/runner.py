@@ -0,0 +1,460 @@
+# -*- coding: utf8 -*-
+"""Local runner of job DAGs, used by nagini-run.py.
+
+Every job reachable from the root job through `requires()` runs exactly
+once, after all of its requires. Like on Azkaban, input properties of a
+job are the base properties updated with output properties of its
+requires in order of `requires()`. Property values are handed over as
+strings like on Azkaban.
+
+By default jobs run one by one in the current process and properties
+are handed over in memory. With `processes` > 1 independent jobs run
+concurrently, each in a fresh worker process, and are run like their
+launchers do: properties are loaded from `JOB_PROP_FILE` and dumped to
+`JOB_OUTPUT_PROP_FILE`, temporary files are removed as soon as the job
+finishes. A failed job stops only the jobs depending on it, jobs calling
+`sys.exit()` or whose worker died fail too.
+
+Every succeeded job is recorded in `Checkpoints` with its output props
+and fingerprint of its field values and output targets. A resumed run
+skips jobs whose fingerprint did not change, whose outputs exist and
+whose requires were resumed too, so a failed run continues from the
+failed job. By default every working dir has its own checkpoints file,
+so runs in different dirs don't overwrite each other's checkpoints.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import time
+import traceback
+from codecs import open
+from multiprocessing import Pool
+from os.path import abspath, dirname, exists, expanduser, join
+from tempfile import mkdtemp
+
+from six import iteritems
+
+from nagini.properties import props
+from nagini.utility import flatten
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+SKIPPED = 'SKIPPED'  # some of requires failed
+
+CHECKPOINTS_DIR = '~/.cache/nagini/checkpoints'
+
+POLL_INTERVAL = 0.1  # seconds between checks of jobs run by pool
+
+
+class JobNode(object):
+    """Job of local run"""
+
+    def __init__(self, job, name=None, partition=None, join=False):
+        """
+        :param partition: `partition_property` value of partition job
+        :param bool join: node joining partitions, not run
+        """
+        self.job_class = job.__class__
+        self.name = name or job.name or job.__class__.__name__
+        self.partition = partition
+        self.join = join
+        self.dependencies = []
+        self.dependents = []
+        self.status = PENDING
+        self.output_props = None
+        self.error = None  # traceback of failure
+        self.fingerprint = None
+        self.resumed = False  # output props taken from checkpoint
+
+    @property
+    def key(self):
+        """Checkpoint key"""
+        return '%s:%s' % (self.job_class.__module__, self.name)
+
+    def __repr__(self):
+        return '<JobNode %s %s>' % (self.name, self.status)
+
+
+def build_dag(root_job):
+    """Return nodes of all jobs required by root job in topological order,
+    requires first. Jobs are identified by class and name like in the
+    builder, so a job required by several jobs is run once. Like in the
+    builder, partitioned jobs run as one `<name>-<value>` job per
+    partition joined by a node named after the job. Like noop jobs on
+    Azkaban, joins pass no props of partitions on.
+
+    :rtype: list[JobNode]
+    """
+    nodes = {}
+    order = []
+
+    def link(node, parent_node):
+        if parent_node not in node.dependencies:
+            node.dependencies.append(parent_node)
+            parent_node.dependents.append(node)
+
+    def visit(job):
+        key = (job.__class__, job.name)
+        if key not in nodes:
+            node = nodes[key] = JobNode(job, join=bool(job.partitions))
+            parent_nodes = [visit(parent)
+                            for parent in flatten(job.requires())]
+            if node.join:
+                for name, value in zip(job.partition_names(), job.partitions):
+                    partition = JobNode(job, name, partition='%s' % value)
+                    for parent_node in parent_nodes:
+                        link(partition, parent_node)
+                    order.append(partition)
+                    link(node, partition)
+            else:
+                for parent_node in parent_nodes:
+                    link(node, parent_node)
+            order.append(node)
+        return nodes[key]
+
+    visit(root_job)
+    return order
+
+
+def _describe(target):
+    attributes = dict((k, v) for k, v in iteritems(vars(target))
+                      if not k.startswith('_') and k != 'output_flag')
+    return [target.__class__.__name__, attributes]
+
+
+def job_fingerprint(job_class, values, check_outputs=False):
+    """Return fingerprint of job run with input props `values` and
+    whether all its output targets exist (None unless `check_outputs`).
+    Fingerprint covers values of job fields and output targets, None if
+    job can't be configured.
+
+    :rtype: (str, bool)
+    """
+    saved = dict(props)
+    props.clear()
+    props.update(values)
+    try:
+        job = job_class()
+        job.configure()
+        fields = dict((field.name, props.get(field.name))
+                      for field in getattr(job, '_nagini_fields', []))
+        outputs = flatten(job.output())
+        state = json.dumps({'job': '%s.%s' % (job_class.__module__,
+                                              job_class.__name__),
+                            'fields': fields,
+                            'outputs': [_describe(t) for t in outputs]},
+                           sort_keys=True, default=repr)
+        digest = hashlib.sha1(state.encode('utf8')).hexdigest()
+        if not check_outputs:
+            return digest, None
+        return digest, all(t.exists() for t in outputs)
+    except Exception:
+        return None, False
+    finally:
+        props.clear()
+        props.update(saved)
+
+
+class Checkpoints(object):
+    """Output props and fingerprints of succeeded jobs::
+
+        {"<module>:<job name>": {"fingerprint": "...", "props": {...},
+                                 "finished": <timestamp>}}
+
+    The file is rewritten after every job, so progress of interrupted
+    runs is kept. Concurrent runs must not share the file, the last
+    writer wins.
+    """
+
+    def __init__(self, path):
+        self.path = expanduser(path)
+        self.entries = {}
+        if exists(self.path):
+            try:
+                with open(self.path, encoding='utf8') as fd:
+                    self.entries = json.load(fd)
+            except ValueError:
+                pass
+
+    @classmethod
+    def for_working_dir(cls, working_dir):
+        """Checkpoints of runs in `working_dir`, kept in `CHECKPOINTS_DIR`"""
+        name = hashlib.sha1(abspath(working_dir).encode('utf8')).hexdigest()
+        return cls(join(CHECKPOINTS_DIR, name + '.json'))
+
+    def get(self, key, fingerprint):
+        """Return output props of valid checkpoint or None"""
+        entry = self.entries.get(key)
+        if fingerprint is None or not entry or \
+                entry['fingerprint'] != fingerprint:
+            return None
+        return entry['props']
+
+    def record(self, key, fingerprint, output_props):
+        if fingerprint is None:
+            self.discard(key)
+            return
+        self.entries[key] = {'fingerprint': fingerprint,
+                             'props': output_props,
+                             'finished': time.time()}
+        self.save()
+
+    def discard(self, key):
+        if self.entries.pop(key, None) is not None:
+            self.save()
+
+    def save(self):
+        if not exists(dirname(self.path)):
+            os.makedirs(dirname(self.path), 0o700)
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf8') as fd:
+            fd.write(json.dumps(self.entries, indent=2, sort_keys=True))
+        os.rename(tmp_path, self.path)
+
+
+def _as_text(values):
+    """Return props as `Properties.load` would read them from file"""
+    return dict((name, '{0}'.format(value))
+                for name, value in iteritems(values))
+
+
+def write_input_props(path, values):
+    with open(path, 'w', encoding='utf8') as fd:
+        for name, value in iteritems(values):
+            fd.write('{0}={1}\n'.format(name, value))
+
+
+def run_job(job_class, values):
+    """Run job in current process handing props in memory
+
+    :return: (output props, traceback of failure or None)
+    """
+    props.clear()
+    props.update(values)
+    try:
+        job_class().execute()
+    except (Exception, SystemExit):
+        return None, traceback.format_exc()
+    return _as_text(props), None
+
+
+def run_job_with_files(job_class, input_path, output_path):
+    """Run job like Azkaban launcher does
+
+    :return: traceback of failure or None
+    """
+    os.environ['JOB_PROP_FILE'] = input_path
+    os.environ['JOB_OUTPUT_PROP_FILE'] = output_path
+    try:
+        props.load()
+        job_class().execute()
+        props.dump()
+    except BaseException:
+        # sys.exit() of job must not kill pool worker without result
+        return traceback.format_exc()
+    return None
+
+
+def _run_in_worker(job_class, input_path, output_path, pid_path):
+    """Pool task: run job with files, leave pid of worker in `pid_path`
+    so the runner notices if the worker dies
+
+    :return: (status, traceback of failure or None)
+    """
+    with open(pid_path, 'w', encoding='utf8') as fd:
+        fd.write('%d' % os.getpid())
+    error = run_job_with_files(job_class, input_path, output_path)
+    return (SUCCEEDED, None) if error is None else (FAILED, error)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class LocalRunner(object):
+    def __init__(self, root_job, processes=1, base_props=None,
+                 callback=None, checkpoints=None, resume=False):
+        """
+        :param int processes: max jobs run at once in worker processes,
+        jobs are run one by one in the current process if 1
+        :param dict base_props: properties of flow, e.g. `working.dir`
+        :param callback: called with `JobNode` every time a job finishes,
+        is skipped or resumed
+        :param Checkpoints checkpoints: record succeeded jobs if set
+        :param bool resume: skip jobs with valid checkpoints
+        """
+        self.nodes = build_dag(root_job)
+        self.processes = processes
+        self.base_props = base_props or {}
+        self.callback = callback
+        self.checkpoints = checkpoints
+        self.resume = resume and checkpoints is not None
+
+    def run(self):
+        """Run all jobs
+
+        :return: True if all jobs succeeded
+        """
+        if self.processes > 1:
+            self._run_pool()
+        else:
+            self._run_serial()
+        return all(n.status == SUCCEEDED for n in self.nodes)
+
+    def input_props(self, node):
+        values = _as_text(self.base_props)
+        for parent in node.dependencies:
+            values.update(parent.output_props or {})
+        if node.partition is not None:
+            values[node.job_class.partition_property] = node.partition
+        return values
+
+    def _start(self, node):
+        """Resume job from checkpoint or mark it as running
+
+        :return: input props of job to run or None if job was resumed
+        or is a join
+        """
+        if node.join:
+            # like the generated noop job on Azkaban, the join outputs
+            # no props, its dependents get base props only
+            node.output_props = {}
+            node.status = SUCCEEDED
+            node.resumed = all(d.resumed for d in node.dependencies)
+            self._report(node)
+            return None
+        values = self.input_props(node)
+        if self.checkpoints is not None:
+            # taken before the run, the job may change what it depends on
+            node.fingerprint, outputs_exist = job_fingerprint(
+                node.job_class, values, check_outputs=self.resume)
+            output_props = self.checkpoints.get(node.key, node.fingerprint)
+            if self.resume and output_props is not None and outputs_exist \
+                    and all(d.resumed for d in node.dependencies):
+                node.output_props = output_props
+                node.status = SUCCEEDED
+                node.resumed = True
+                self._report(node)
+                return None
+        node.status = RUNNING
+        return values
+
+    def _finish(self, node, output_props, error):
+        if error is None:
+            node.output_props = output_props
+            node.status = SUCCEEDED
+        else:
+            node.status = FAILED
+            node.error = error
+        if self.checkpoints is not None:
+            if node.status == SUCCEEDED:
+                self.checkpoints.record(node.key, node.fingerprint,
+                                        node.output_props)
+            else:
+                self.checkpoints.discard(node.key)
+        self._report(node)
+        if node.status == FAILED:
+            self._skip_dependents(node)
+
+    def _skip_dependents(self, node):
+        for dependent in node.dependents:
+            if dependent.status == PENDING:
+                dependent.status = SKIPPED
+                self._report(dependent)
+                self._skip_dependents(dependent)
+
+    def _report(self, node):
+        if self.callback:
+            self.callback(node)
+
+    def _ready(self):
+        return [n for n in self.nodes if n.status == PENDING and
+                all(d.status == SUCCEEDED for d in n.dependencies)]
+
+    def _run_serial(self):
+        for node in self.nodes:
+            if node.status != PENDING:
+                continue
+            values = self._start(node)
+            if values is not None:
+                self._finish(node, *run_job(node.job_class, values))
+
+    def _run_pool(self):
+        # a fresh process for every job, so jobs don't share props and
+        # module state like they don't on Azkaban
+        pool = Pool(self.processes, maxtasksperchild=1)
+        tmp_dir = mkdtemp(prefix='nagini-run-')
+        tasks = []  # (node, async result, paths)
+        try:
+            while True:
+                ready = self._ready()
+                while ready:
+                    resumed = False
+                    for node in ready:
+                        values = self._start(node)
+                        if values is None:
+                            resumed = True  # or joined
+                            continue
+                        index = self.nodes.index(node)
+                        paths = tuple(join(tmp_dir, '%d.%s' % (index, ext))
+                                      for ext in ('input', 'output', 'pid'))
+                        write_input_props(paths[0], values)
+                        tasks.append((node, pool.apply_async(
+                            _run_in_worker, (node.job_class,) + paths),
+                            paths))
+                    # jobs requiring resumed ones may be ready now
+                    ready = self._ready() if resumed else []
+                if not tasks:
+                    break
+                finished = [t for t in tasks if t[1].ready() or self._lost(t)]
+                if not finished:
+                    time.sleep(POLL_INTERVAL)
+                for task in finished:
+                    tasks.remove(task)
+                    self._collect(*task)
+        finally:
+            pool.terminate()
+            pool.join()
+            shutil.rmtree(tmp_dir)
+
+    @staticmethod
+    def _lost(task):
+        """Whether worker running the task died without result"""
+        result, pid_path = task[1], task[2][2]
+        try:
+            with open(pid_path, encoding='utf8') as fd:
+                pid = int(fd.read())
+        except (IOError, ValueError):
+            return False  # not started yet
+        if _alive(pid):
+            return False
+        # worker exits after sending result, give it time to arrive
+        result.wait(1)
+        return not result.ready()
+
+    def _collect(self, node, result, paths):
+        if result.ready():
+            try:
+                status, error = result.get()
+            except Exception:
+                status, error = FAILED, traceback.format_exc()
+        else:
+            status, error = FAILED, 'Worker process of job died\n'
+        output_props = None
+        if status == SUCCEEDED:
+            with open(paths[1], encoding='utf8') as fd:
+                output_props = _as_text(json.load(fd))
+        for path in paths:
+            if exists(path):
+                os.remove(path)
+        self._finish(node, output_props, error)
@@ -0,0 +1,64 @@
+# -*- coding: utf8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import json
+import os
+import time
+from os.path import dirname, exists, expanduser
+
+DEFAULT_SESSION_CACHE = '~/.cache/nagini/sessions.json'
+
+
+class SessionCache(object):
+    """Azkaban session ids stored on disk per host and user, so clients
+    skip authentication while the session is alive::
+
+        {"<host> <user>": {"session.id": "...", "created": <timestamp>}}
+
+    The file is readable by owner only. Entries older than `max_age` are
+    ignored; a cached session rejected by server is replaced by the
+    client after a fresh login.
+    """
+
+    def __init__(self, path=DEFAULT_SESSION_CACHE, max_age=24 * 3600):
+        """
+        :param float max_age: seconds, Azkaban sessions live one day by
+        default (`session.time.to.live`)
+        """
+        self.path = expanduser(path)
+        self.max_age = max_age
+
+    @staticmethod
+    def _key(host, user):
+        return '%s %s' % (host.rstrip('/'), user)
+
+    def _load(self):
+        if not exists(self.path):
+            return {}
+        try:
+            with open(self.path) as fd:
+                return json.load(fd)
+        except (IOError, ValueError):
+            return {}
+
+    def get(self, host, user):
+        """Return cached session id or None"""
+        entry = self._load().get(self._key(host, user))
+        if not entry or time.time() - entry['created'] > self.max_age:
+            return None
+        return entry['session.id']
+
+    def set(self, host, user, session_id):
+        sessions = self._load()
+        now = time.time()
+        sessions = dict((k, v) for k, v in sessions.items()
+                        if now - v['created'] <= self.max_age)
+        sessions[self._key(host, user)] = {'session.id': session_id,
+                                           'created': now}
+        if not exists(dirname(self.path)):
+            os.makedirs(dirname(self.path), 0o700)
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(sessions, fp)
+        os.rename(tmp_path, self.path)
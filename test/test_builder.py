@@ -0,0 +1,611 @@
+# -*- coding: utf8 -*-
+import os
+import shutil
+import sys
+import threading
+import unittest
+from io import BytesIO
+from os.path import join
+from tempfile import mkdtemp
+from textwrap import dedent
+from zipfile import ZipFile
+
+from nagini.builder import archive
+from nagini.builder import benchmark
+from nagini.builder.archive import ZipMember, write_zip
+from nagini.builder.cache import BuildCache
+from nagini.builder.discovery import FlowFinder
+from nagini.builder.package import ProjectPackage
+from nagini.builder.pipeline import build_projects, OrderedReporter
+from nagini.builder.upload import UploadManifest, Uploader
+
+FLOWS_MODULE = dedent('''\
+    from nagini import BaseJob, BaseFlow
+
+
+    class A(BaseJob):
+        pass
+
+
+    class B(BaseJob):
+        def requires(self):
+            return A()
+
+
+    class C(BaseJob):
+        def requires(self):
+            return A()
+
+
+    class D(BaseJob):
+        def requires(self):
+            return [B(), C()]
+
+
+    class MainFlow(BaseFlow):
+        def requires(self):
+            return D()
+    ''')
+
+
+def make_project(root, name, modules=None):
+    """Create project dir `name` in `root` with given modules
+
+    :param dict[str,str] modules: relative module path -> source
+    """
+    path = join(root, name)
+    os.makedirs(path)
+    open(join(path, '__init__.py'), 'w').close()
+    for module_path, source in (modules or {'flows.py': FLOWS_MODULE}).items():
+        with open(join(path, module_path), 'w') as fd:
+            fd.write(source)
+    return path
+
+
+class BuilderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = mkdtemp(prefix='nagini-test-')
+        os.environ['NAGINI_BUILDING'] = 'true'
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+
+class PipelineTest(BuilderTestCase):
+    def test_build_projects_reports_errors_per_project(self):
+        paths = [make_project(self.root, 'good_one'),
+                 make_project(self.root, 'broken',
+                              {'mod.py': 'raise ValueError("boom")\n'}),
+                 make_project(self.root, 'good_two'),
+                 make_project(self.root, 'bad_manifest',
+                              {'package.yml': 'exclude: [tests\n'})]
+
+        results = sorted(build_projects(paths, processes=2),
+                         key=lambda r: r.index)
+        try:
+            self.assertEqual([r.ok for r in results],
+                             [True, False, True, False])
+            self.assertIn('boom', results[1].error)
+            self.assertIn('package.yml', results[3].error)
+            for result in (results[0], results[2]):
+                self.assertTrue(os.path.exists(result.project.zip_path))
+        finally:
+            for result in results:
+                if result.ok:
+                    result.project.clear()
+
+    def test_ordered_reporter(self):
+        stream = BytesIO()
+        reporter = OrderedReporter(stream)
+        reporter.report(1, b'second\n')
+        self.assertEqual(stream.getvalue(), b'')
+        reporter.report(0, b'first\n')
+        reporter.report(2, b'third\n')
+        self.assertEqual(stream.getvalue(), b'first\nsecond\nthird\n')
+
+
+class BuildCacheTest(BuilderTestCase):
+    def build(self, path, config=None):
+        result, = build_projects([path], config=config, processes=1,
+                                 cache_dir=join(self.root, 'cache'))
+        result.project.clear()
+        return result.project
+
+    def test_unchanged_project_reuses_zip(self):
+        path = make_project(self.root, 'cached',
+                            {'flows.py': FLOWS_MODULE, 'empty.py': ''})
+        first = self.build(path)
+        self.assertFalse(first.from_cache)
+        second = self.build(path)
+        self.assertTrue(second.from_cache)
+        self.assertEqual(first.fingerprint, second.fingerprint)
+
+        modules = BuildCache(join(self.root, 'cache')).load_modules('cached')
+        self.assertIn('MainFlow', modules['flows.py']['flows'])
+        self.assertEqual(modules['empty.py']['flows'], [])
+
+    def test_flows_of_unchanged_module_follow_imported_modules(self):
+        path = make_project(self.root, 'rebased', {
+            'base.py': 'class Base(object):\n    pass\n',
+            'flows.py': 'from .base import Base\n\n\n'
+                        'class MainFlow(Base):\n    pass\n'})
+        self.assertEqual(self.build(path).dag_stats, {})
+        with open(join(path, 'base.py'), 'w') as fd:
+            fd.write(FLOWS_MODULE.replace('MainFlow', 'Base'))
+        # flows.py didn't change, but its MainFlow is a flow now
+        self.assertIn('MainFlow', self.build(path).dag_stats)
+
+    def test_changed_module_does_not_reimport_others(self):
+        log = join(self.root, 'imports.log')
+        path = make_project(self.root, 'partly_changed', {
+            'flows.py': FLOWS_MODULE,
+            'other.py': 'with open(%r, "a") as fd:\n'
+                        '    fd.write("other\\n")\n' % log})
+        self.build(path)
+        with open(join(path, 'flows.py'), 'a') as fd:
+            fd.write('# changed\n')
+        self.assertIn('MainFlow', self.build(path).dag_stats)
+        with open(log) as fd:
+            self.assertEqual(fd.read(), 'other\n')
+
+    def test_ast_build_keeps_module_cache(self):
+        path = make_project(self.root, 'mixed_discovery')
+        for discovery in ('import', 'ast'):
+            result, = build_projects([path], config={'d': discovery},
+                                     processes=1, discovery=discovery,
+                                     cache_dir=join(self.root, 'cache'))
+            result.project.clear()
+        modules = BuildCache(join(self.root, 'cache')).load_modules(
+            'mixed_discovery')
+        self.assertIn('MainFlow', modules['flows.py']['flows'])
+
+    def test_changes_invalidate_zip(self):
+        path = make_project(self.root, 'changed')
+        first = self.build(path)
+        self.assertFalse(self.build(path, config={'a': 1}).from_cache)
+        with open(join(path, 'system.properties'), 'w') as fd:
+            fd.write('key=value\n')
+        third = self.build(path)
+        self.assertFalse(third.from_cache)
+        self.assertNotEqual(first.fingerprint, third.fingerprint)
+
+
+class WrappersTest(BuilderTestCase):
+    def test_diamond_jobs_are_built_once(self):
+        generated = []
+        project = ProjectPackage(make_project(self.root, 'diamond'),
+                                 quiet=True)
+        add_generated = project.add_generated
+
+        def counting_add(filename, template, context):
+            generated.append(filename)
+            add_generated(filename, template, context)
+
+        project.add_generated = counting_add
+        try:
+            project.build()
+            with ZipFile(project.zip_path) as archive:
+                self.assertIn(b'dependencies=B, C', archive.read('D.job'))
+        finally:
+            project.clear()
+
+        self.assertEqual(project.dag_stats, {'MainFlow': (5, 5)})
+        self.assertEqual(len(generated), len(set(generated)))
+        self.assertEqual(len(generated), 10)
+
+
+class OptimizerTest(BuilderTestCase):
+    module = dedent('''\
+        from nagini import BaseJob, BaseFlow
+
+
+        class A(BaseJob):
+            fusable = True
+
+
+        class B(BaseJob):
+            fusable = True
+
+            def requires(self):
+                return A()
+
+
+        class C(BaseJob):
+            fusable = True
+
+            def requires(self):
+                return B()
+
+
+        class D(BaseJob):
+            def requires(self):
+                return [C(), A()]
+
+
+        class MainFlow(BaseFlow):
+            def requires(self):
+                return D()
+        ''')
+
+    def test_reduce_and_fuse(self):
+        project = ProjectPackage(
+            make_project(self.root, 'chain', {'flows.py': self.module}),
+            quiet=True, optimize=True)
+        try:
+            project.build()
+            with ZipFile(project.zip_path) as archive:
+                names = archive.namelist()
+                d_job = archive.read('D.job')
+                c_job = archive.read('C.job')
+                launcher = archive.read('CLauncher.py')
+        finally:
+            project.clear()
+
+        self.assertEqual(project.optimize_stats, (1, 2))
+        self.assertEqual(project.dag_stats, {'MainFlow': (3, 2)})
+        self.assertNotIn('A.job', names)
+        self.assertNotIn('BLauncher.py', names)
+        self.assertIn(b'dependencies=C\n', d_job)
+        self.assertNotIn(b'dependencies', c_job)
+        compile(launcher, 'CLauncher.py', 'exec')
+        positions = [launcher.index(b'module.%s()' % name)
+                     for name in (b'A', b'B', b'C')]
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(launcher.count(b'props.load()'), 1)
+        self.assertEqual(launcher.count(b'props.dump()'), 1)
+
+
+class PartitionTest(BuilderTestCase):
+    module = dedent('''\
+        from nagini import BaseJob, BaseFlow
+
+
+        class A(BaseJob):
+            pass
+
+
+        class Monthly(BaseJob):
+            partition_property = 'month'
+            partitions = ['2020-01', '2020-02']
+
+            def requires(self):
+                return A()
+
+
+        class Report(BaseJob):
+            def requires(self):
+                return Monthly()
+
+
+        class MainFlow(BaseFlow):
+            def requires(self):
+                return Report()
+        ''')
+
+    def test_partitions_are_joined(self):
+        project = ProjectPackage(
+            make_project(self.root, 'parts', {'flows.py': self.module}),
+            quiet=True)
+        try:
+            project.build()
+            with ZipFile(project.zip_path) as archive:
+                names = archive.namelist()
+                partition = archive.read('Monthly-2020-02.job')
+                join = archive.read('Monthly.job')
+                report = archive.read('Report.job')
+        finally:
+            project.clear()
+
+        self.assertIn('Monthly-2020-01.job', names)
+        self.assertIn('MonthlyLauncher.py', names)
+        self.assertNotIn('Monthly-2020-01Launcher.py', names)
+        self.assertIn(b'dependencies=A\n', partition)
+        self.assertIn(b'command=python MonthlyLauncher.py', partition)
+        self.assertIn(b'month=2020-02\n', partition)
+        self.assertIn(b'type=noop', join)
+        self.assertIn(b'dependencies=Monthly-2020-01, Monthly-2020-02', join)
+        self.assertIn(b'dependencies=Monthly\n', report)
+
+        months = ['Monthly-2020-01', 'Monthly-2020-02']
+        self.assertEqual(project.dags['MainFlow'], {
+            'A': [], 'Monthly-2020-01': ['A'], 'Monthly-2020-02': ['A'],
+            'Monthly': months, 'Report': ['Monthly'],
+            'MainFlow': ['Report']})
+        jobs = [n for n in names if n.endswith('.job')]
+        self.assertEqual(project.dag_stats, {'MainFlow': (len(jobs), 6)})
+
+
+class ArchiveTest(BuilderTestCase):
+    def setUp(self):
+        super(ArchiveTest, self).setUp()
+        with open(join(self.root, 'big.bin'), 'wb') as fd:
+            fd.write(os.urandom(1 << 12) * 64)
+
+    def make_members(self):
+        big = join(self.root, 'big.bin')
+        return [ZipMember('proj/big.bin', path=big),
+                ZipMember('proj/pkg/mod.py', data=b'x = 1\n' * 100),
+                ZipMember(u'Задача.job', data=b'type=command\n'),
+                ZipMember('A.job', data=b'')]
+
+    def test_zip_is_deterministic(self):
+        threshold = archive.STREAM_THRESHOLD
+        archive.STREAM_THRESHOLD = 1 << 16  # stream big.bin
+        try:
+            first = join(self.root, 'first.zip')
+            second = join(self.root, 'second.zip')
+            write_zip(first, self.make_members(), compress_level=9)
+            write_zip(second, list(reversed(self.make_members())),
+                      compress_level=9, threads=1)
+        finally:
+            archive.STREAM_THRESHOLD = threshold
+
+        with open(first, 'rb') as fd1, open(second, 'rb') as fd2:
+            self.assertEqual(fd1.read(), fd2.read())
+        with ZipFile(first) as result:
+            self.assertIsNone(result.testzip())
+            self.assertEqual(result.namelist(),
+                             ['A.job', 'proj/', 'proj/big.bin', 'proj/pkg/',
+                              'proj/pkg/mod.py', u'Задача.job'])
+            self.assertEqual(result.read('proj/pkg/mod.py'), b'x = 1\n' * 100)
+
+    def test_stored_zip(self):
+        path = join(self.root, 'stored.zip')
+        write_zip(path, self.make_members(), compress_level=0)
+        with ZipFile(path) as result:
+            self.assertIsNone(result.testzip())
+            info = result.getinfo('proj/pkg/mod.py')
+            self.assertEqual(info.compress_size, info.file_size)
+
+    def test_zip64_fallback_streams_deterministically(self):
+        limit = archive.ZIP32_LIMIT
+        archive.ZIP32_LIMIT = 1 << 16  # big.bin goes to zip64 fallback
+        try:
+            first = join(self.root, 'first.zip')
+            second = join(self.root, 'second.zip')
+            write_zip(first, self.make_members())
+            os.utime(join(self.root, 'big.bin'), (1e9, 1e9))
+            write_zip(second, self.make_members())
+        finally:
+            archive.ZIP32_LIMIT = limit
+
+        with open(first, 'rb') as fd1, open(second, 'rb') as fd2:
+            self.assertEqual(fd1.read(), fd2.read())
+        with ZipFile(first) as result:
+            self.assertIsNone(result.testzip())
+            info = result.getinfo('proj/big.bin')
+            self.assertEqual(info.date_time, (1980, 1, 1, 0, 0, 0))
+            self.assertEqual(info.external_attr >> 16, 0o100644)
+            with open(join(self.root, 'big.bin'), 'rb') as fd:
+                self.assertEqual(result.read('proj/big.bin'), fd.read())
+
+    def test_project_build_keeps_source_tree(self):
+        path = make_project(self.root, 'untouched')
+        before = sorted(os.listdir(path))
+        project = ProjectPackage(path, quiet=True)
+        project.build(config={'server': {}})
+        project.clear()
+        self.assertEqual(sorted(os.listdir(path)), before)
+
+
+class DiscoveryTest(BuilderTestCase):
+    modules = {
+        'base.py': dedent('''\
+            import nagini.flow
+            from nagini import EmbeddedFlow as Embedded
+
+
+            class ProjectFlow(nagini.flow.BaseFlow):
+                pass
+
+
+            class ProjectEmbedded(Embedded):
+                pass
+            '''),
+        'heavy.py': dedent('''\
+            raise ImportError('heavy module must not be imported')
+
+
+            class NotFlow(object):
+                pass
+            '''),
+        'flows/__init__.py': 'from ..base import ProjectFlow\n',
+        'flows/main.py': dedent('''\
+            from . import ProjectFlow
+            from ..base import ProjectEmbedded
+            from ..flows_jobs import Job
+
+
+            class MainFlow(ProjectFlow):
+                def requires(self):
+                    return Job()
+
+
+            class Embedded(ProjectEmbedded):
+                pass
+
+
+            if True:
+                class Legacy(ProjectFlow):
+                    def requires(self):
+                        return Job()
+            '''),
+        'flows_jobs.py': dedent('''\
+            from nagini import BaseJob
+
+
+            class Job(BaseJob):
+                pass
+            '''),
+    }
+
+    def make_project(self, name):
+        path = make_project(self.root, name, {'base.py': ''})
+        os.makedirs(join(path, 'flows'))
+        for module_path, source in self.modules.items():
+            with open(join(path, module_path), 'w') as fd:
+                fd.write(source)
+        return path
+
+    def test_find_flows(self):
+        path = self.make_project('static')
+        finder = FlowFinder(path, 'static')
+        self.assertEqual(list(finder.find()),
+                         [('base.py', 'ProjectFlow'),
+                          ('flows/main.py', 'Legacy'),
+                          ('flows/main.py', 'MainFlow')])
+
+    def test_build_imports_only_flow_modules(self):
+        cache = BuildCache(join(self.root, 'cache'))
+        project = ProjectPackage(self.make_project('static_build'),
+                                 quiet=True, discovery='ast', cache=cache)
+        try:
+            project.build()
+            with ZipFile(project.zip_path) as archive:
+                self.assertIn('MainFlow.job', archive.namelist())
+                self.assertIn('Legacy.job', archive.namelist())
+        finally:
+            project.clear()
+        self.assertIn('heavy.py', cache.load_json('static_build', 'ast'))
+
+
+class BytecodeBuildTest(BuilderTestCase):
+    def test_zip_contains_bytecode_and_launchers_load_it(self):
+        project = ProjectPackage(make_project(self.root, 'compiled'),
+                                 quiet=True, compile_python=sys.executable)
+        try:
+            project.build()
+            with ZipFile(project.zip_path) as archive:
+                names = archive.namelist()
+                launcher = archive.read('MainFlowLauncher.py')
+        finally:
+            project.clear()
+        self.assertIn('compiled/__nagini_pyc__/flows.pyc', names)
+        self.assertIn(b'from nagini.bytecode import install', launcher)
+        self.assertEqual(project.bytecode_stats['modules'], 2)
+
+
+class ManifestTest(BuilderTestCase):
+    def make_project(self, name):
+        path = make_project(self.root, name, {
+            'flows.py': 'import helpers\n' + FLOWS_MODULE,
+            'package.yml': 'exclude: [tests, "*.ipynb"]\nshared: [helpers]\n',
+            'notes.ipynb': '{}',
+        })
+        for package in ('tests', 'helpers'):
+            os.makedirs(join(path, package))
+            with open(join(path, package, '__init__.py'), 'w') as fd:
+                fd.write('VALUE = 1\n')
+        return path
+
+    def build(self, path, **kwargs):
+        project = ProjectPackage(path, quiet=True, **kwargs)
+        try:
+            project.build()
+            with ZipFile(project.zip_path) as archive:
+                return project, archive.namelist(), \
+                    archive.read('MainFlowLauncher.py')
+        finally:
+            project.clear()
+
+    def test_excluded_files_are_not_packaged(self):
+        _, names, launcher = self.build(self.make_project('plain'))
+        self.assertIn('plain/flows.py', names)
+        self.assertIn('plain/helpers/__init__.py', names)
+        for name in ('plain/tests/__init__.py', 'plain/notes.ipynb',
+                     'plain/package.yml'):
+            self.assertNotIn(name, names)
+        self.assertNotIn(b'sys.path.insert', launcher)
+
+    def test_shared_packages_are_published_once(self):
+        layer_dir = join(self.root, 'layers')
+        first, names, launcher = self.build(self.make_project('first'),
+                                            layer_dir=layer_dir,
+                                            layer_executor_dir='/mnt/layers')
+        second, _, _ = self.build(self.make_project('second'),
+                                  layer_dir=layer_dir)
+
+        self.assertNotIn('first/helpers/__init__.py', names)
+        self.assertEqual(os.listdir(layer_dir), [first.layer.filename])
+        self.assertEqual(first.layer.digest, second.layer.digest)
+        self.assertIn(('/mnt/layers/' + first.layer.filename).encode('utf8'),
+                      launcher)
+        with ZipFile(join(layer_dir, first.layer.filename)) as archive:
+            self.assertIn('helpers/__init__.py', archive.namelist())
+
+
+class BenchmarkTest(BuilderTestCase):
+    def test_phases_are_timed(self):
+        path = benchmark.generate_project(self.root, 'bench_small',
+                                          modules=3, jobs=10, flows=2)
+        result = benchmark.run(path, repeat=1)
+        run, = result['runs']
+        self.assertEqual(run['dag'], {'Flow0': (11, 18), 'Flow1': (10, 16)})
+        for phase in ('copy', 'discovery', 'dag', 'render', 'zip', 'total'):
+            self.assertIn(phase, result['summary'])
+
+
+class FakeClient(object):
+    host = 'http://azkaban'
+
+    def __init__(self):
+        self.uploaded = []
+
+    def upload_project_zip(self, project, filename):
+        if project == 'broken':
+            raise ValueError('upload failed')
+        self.uploaded.append(project)
+
+
+class UploaderTest(BuilderTestCase):
+    def upload(self, projects, force=False):
+        client = FakeClient()
+        uploader = Uploader(client, UploadManifest(
+            join(self.root, 'uploads.json')), concurrency=2, force=force)
+        results = {}
+        for name, digest in projects:
+            uploader.submit(name, None, digest,
+                            lambda status, error, name=name:
+                            results.__setitem__(name, status))
+        uploader.close()
+        return sorted(client.uploaded), results
+
+    def test_unchanged_projects_are_skipped(self):
+        projects = [('a', '1'), ('b', '2'), ('broken', '3')]
+        uploaded, results = self.upload(projects)
+        self.assertEqual(uploaded, ['a', 'b'])
+        self.assertEqual(results, {'a': 'OK', 'b': 'OK', 'broken': 'FAIL'})
+
+        uploaded, results = self.upload([('a', '1'), ('b', '4')])
+        self.assertEqual(uploaded, ['b'])
+        self.assertEqual(results, {'a': 'SKIP', 'b': 'OK'})
+        self.assertEqual(self.upload([('a', '1')], force=True)[0], ['a'])
+
+    def test_callbacks_run_in_calling_thread(self):
+        path = join(self.root, 'uploads.json')
+        uploader = Uploader(FakeClient(), UploadManifest(path),
+                            concurrency=2)
+        threads = []
+
+        def callback(status, error):
+            threads.append(threading.current_thread())
+            raise ValueError('callback failed')
+
+        uploader.submit('a', None, '1', callback)
+        uploader.submit('b', None, '2', callback)
+        self.assertRaises(ValueError, uploader.close)
+        self.assertEqual(threads, [threading.current_thread()])
+        # manifest is saved by uploads, not by close()
+        self.assertEqual(UploadManifest(path).digests,
+                         {'http://azkaban': {'a': '1', 'b': '2'}})
+
+    def test_digest_follows_content(self):
+        paths = [make_project(self.root, 'digest_a'),
+                 make_project(self.root, 'digest_b')]
+        results = sorted(build_projects(paths + paths[:1], processes=1),
+                         key=lambda r: r.index)
+        digests = [r.project.digest for r in results]
+        for result in results:
+            result.project.clear()
+        self.assertNotEqual(digests[0], digests[1])
+        self.assertEqual(digests[0], digests[2])
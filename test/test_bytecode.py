@@ -0,0 +1,60 @@
+# -*- coding: utf8 -*-
+import os
+import shutil
+import sys
+import unittest
+from os.path import join
+from tempfile import mkdtemp
+
+from nagini.bytecode import (HashedBytecodeFinder, HashedBytecodeLoader,
+                             bytecode_path, compile_tree, install)
+
+
+class BytecodeTest(unittest.TestCase):
+    def setUp(self):
+        self.root = mkdtemp(prefix='nagini-test-')
+        os.makedirs(join(self.root, 'bc_project', 'pkg'))
+        for path, source in (('bc_project/__init__.py', ''),
+                             ('bc_project/pkg/__init__.py', ''),
+                             ('bc_project/pkg/mod.py', 'VALUE = 42\n')):
+            with open(join(self.root, path), 'w') as fd:
+                fd.write(source)
+        sys.path.insert(0, self.root)
+
+    def tearDown(self):
+        sys.path.remove(self.root)
+        sys.meta_path[:] = [f for f in sys.meta_path
+                            if not isinstance(f, HashedBytecodeFinder)]
+        for name in list(sys.modules):
+            if name.startswith('bc_project'):
+                del sys.modules[name]
+        shutil.rmtree(self.root)
+
+    def test_compile_tree(self):
+        modules, seconds = compile_tree(join(self.root, 'bc_project'),
+                                        join(self.root, 'bc_project'))
+        self.assertEqual(modules, 3)
+        self.assertTrue(os.path.exists(bytecode_path(
+            join(self.root, 'bc_project', 'pkg', 'mod.py'))))
+
+    def test_valid_bytecode_is_loaded(self):
+        compile_tree(self.root, self.root)
+        install(self.root)
+        install(self.root)
+        self.assertEqual(sum(isinstance(f, HashedBytecodeFinder)
+                             for f in sys.meta_path), 1)
+
+        from bc_project.pkg import mod
+        self.assertIsInstance(mod.__loader__, HashedBytecodeLoader)
+        self.assertEqual(mod.VALUE, 42)
+
+    def test_changed_source_is_not_loaded_from_bytecode(self):
+        compile_tree(self.root, self.root)
+        with open(join(self.root, 'bc_project', 'pkg', 'mod.py'), 'w') as fd:
+            fd.write('VALUE = 17\n')
+        install(self.root)
+
+        from bc_project.pkg import mod
+        self.assertNotIsInstance(getattr(mod, '__loader__', None),
+                                 HashedBytecodeLoader)
+        self.assertEqual(mod.VALUE, 17)
@@ -0,0 +1,384 @@
+# -*- coding: utf8 -*-
+import cgi
+import json
+import os
+import shutil
+import threading
+import time
+import unittest
+from io import BytesIO
+from os.path import join
+from tempfile import mkdtemp
+
+import requests
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from nagini import client as client_module
+from nagini.client import AzkabanClient, AzkabanClientError, \
+    AzkabanResponseError, ConcurrentAzkabanClient, ExecutionTimeout
+from nagini.fake_server import FakeAzkabanServer
+from nagini.loadtest import make_project_zip
+from nagini.multipart import MultipartEncoder
+from nagini.sessions import SessionCache
+
+
+class FakeResponse(object):
+    def __init__(self, status=200, data=None, text=None,
+                 content_type='application/json'):
+        self.status_code = status
+        self.data = data if data is not None else {}
+        self.text = json.dumps(self.data) if text is None else text
+        self.headers = {'Content-Type': content_type}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def response(status=200, data=None, **kwargs):
+    return FakeResponse(status, data, **kwargs)
+
+
+class FakeRequest(object):
+    """Replacement of `Session.request` returning or raising queued
+    results
+    """
+
+    def __init__(self):
+        self.side_effect = []
+        self.calls = []
+
+    def __call__(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        if isinstance(self.side_effect, Exception):
+            raise self.side_effect
+        result = self.side_effect.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    @property
+    def call_count(self):
+        return len(self.calls)
+
+    @property
+    def last_kwargs(self):
+        return self.calls[-1][2]
+
+
+class ClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = AzkabanClient('http://azkaban', backoff=0)
+        self.request = self.client.session.request = FakeRequest()
+
+
+class SessionTest(ClientTestCase):
+    def test_idempotent_calls_are_retried(self):
+        self.request.side_effect = [requests.ConnectionError(),
+                                    response(503),
+                                    response(data={'execIds': [1]})]
+        self.assertEqual(self.client.get_running_executions('p', 'f'), [1])
+        self.assertEqual(self.request.call_count, 3)
+        self.assertEqual(self.request.last_kwargs['timeout'], (10, 300))
+
+    def test_retries_are_bounded(self):
+        self.request.side_effect = requests.Timeout()
+        with self.assertRaises(requests.Timeout):
+            self.client.get_execution_info(1)
+        self.assertEqual(self.request.call_count, 4)
+
+    def test_execute_flow_is_not_retried(self):
+        self.request.side_effect = requests.ConnectionError()
+        with self.assertRaises(requests.ConnectionError):
+            self.client.execute_flow('p', 'f')
+        self.assertEqual(self.request.call_count, 1)
+
+    def test_error_pages_raise_client_error(self):
+        self.request.side_effect = [
+            response(502, text='<html>Bad Gateway</html>',
+                     content_type='text/html')]
+        with self.assertRaises(AzkabanResponseError) as context:
+            self.client.execute_flow('p', 'f')
+        self.assertEqual(context.exception.status_code, 502)
+        self.assertIn('Bad Gateway', context.exception.body)
+        self.assertEqual(self.request.call_count, 1)
+
+        self.request.side_effect = [response(text='not json')]
+        with self.assertRaises(AzkabanResponseError):
+            self.client.get_execution_info(1)
+
+    def test_expired_session_is_renewed(self):
+        self.request.side_effect = [
+            response(data={'status': 'success', 'session.id': 'old'}),
+            response(data={'error': 'session'}),
+            response(data={'status': 'success', 'session.id': 'new'}),
+            response(data={'execIds': []})
+        ]
+        self.client.login('user', 'secret')
+        self.assertEqual(self.client.get_running_executions('p', 'f'), [])
+        self.assertEqual(self.client.session_id, 'new')
+        self.assertEqual(self.request.last_kwargs['params']['session.id'],
+                         'new')
+
+    def test_backoff_doubles(self):
+        delays = []
+        sleep = client_module.time.sleep
+        client_module.time.sleep = delays.append
+        try:
+            self.client.backoff = 0.5
+            self.request.side_effect = [response(502), response(502),
+                                        response(data={})]
+            self.client.get_execution_info(1)
+        finally:
+            client_module.time.sleep = sleep
+        self.assertEqual(delays, [0.5, 1.0])
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        form = cgi.FieldStorage(fp=self.rfile, headers=self.headers, environ={
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': self.headers['Content-Type']
+        })
+        self.server.uploads.append({
+            'project': form.getvalue('project'),
+            'filename': form['file'].filename,
+            'content': form['file'].file.read()
+        })
+        body = json.dumps({'projectId': 1, 'version': 1}).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class UploadTest(unittest.TestCase):
+    def setUp(self):
+        self.root = mkdtemp(prefix='nagini-test-')
+        self.zip_path = join(self.root, 'project.zip')
+        self.content = os.urandom(300000)
+        with open(self.zip_path, 'wb') as fd:
+            fd.write(self.content)
+        self.server = HTTPServer(('127.0.0.1', 0), UploadHandler)
+        self.server.uploads = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root)
+
+    def test_zip_is_streamed(self):
+        client = AzkabanClient('http://127.0.0.1:%d' % self.server.server_port)
+        progress = []
+        client.upload_project_zip('project', self.zip_path,
+                                  progress=lambda *p: progress.append(p))
+        upload, = self.server.uploads
+        self.assertEqual(upload['project'], 'project')
+        self.assertEqual(upload['filename'], 'project.zip')
+        self.assertEqual(upload['content'], self.content)
+        sent, total = progress[-1]
+        self.assertEqual(sent, total)
+        self.assertTrue(len(progress) > total // (1 << 16))
+
+    def test_encoder_reads_bounded_chunks_and_rewinds(self):
+        encoder = MultipartEncoder([('a', 'b')],
+                                   [('file', 'p.zip', self.zip_path,
+                                     'application/zip')],
+                                   chunk_size=1000)
+        with encoder:
+            first = b''.join(encoder)
+            self.assertEqual(len(first), len(encoder))
+            encoder.seek(0)
+            self.assertEqual(encoder.read(10 ** 6), first[:1000])
+        self.assertIsNone(encoder._fd)
+
+
+class JobLogsTest(ClientTestCase):
+    def page(self, data):
+        return response(data={'data': data, 'length': len(data)})
+
+    def test_pages_are_joined(self):
+        self.request.side_effect = [self.page('ab'), self.page('cd'),
+                                    self.page('e')]
+        chunks = list(self.client.iter_job_logs(1, 'job', page_size=2))
+        self.assertEqual(chunks, ['ab', 'cd', 'e'])
+        self.assertEqual([c[2]['params']['offset'] for c in
+                          self.request.calls], [0, 2, 4])
+
+    def test_follow_running_job(self):
+        running = response(data={'nodes': [{'id': 'job',
+                                            'status': 'RUNNING'}]})
+        done = response(data={'nodes': [{'id': 'job',
+                                         'status': 'SUCCEEDED'}]})
+        self.request.side_effect = [self.page('a'), running,
+                                    self.page(''), running,
+                                    self.page('b'), done,
+                                    self.page('c')]
+        sink = BytesIO()
+        count = self.client.write_job_logs(1, 'job', sink, follow=True,
+                                           poll_interval=0)
+        self.assertEqual(sink.getvalue(), b'abc')
+        self.assertEqual(count, 3)
+
+    def test_error_without_follow(self):
+        self.request.side_effect = [response(data={'error': 'no job'})]
+        with self.assertRaises(AzkabanClientError):
+            list(self.client.iter_job_logs(1, 'job'))
+
+
+class ConcurrentClientTest(unittest.TestCase):
+    def test_concurrency_is_limited(self):
+        lock = threading.Lock()
+        state = {'active': 0, 'max': 0, 'logins': 0}
+
+        def request(method, url, **kwargs):
+            with lock:
+                state['active'] += 1
+                state['max'] = max(state['max'], state['active'])
+            time.sleep(0.01)
+            with lock:
+                state['active'] -= 1
+                if kwargs.get('data', {}).get('action') == 'login':
+                    state['logins'] += 1
+                    return response(data={'status': 'success',
+                                           'session.id': str(state['logins'])})
+            if kwargs['params']['session.id'] == '1':
+                return response(data={'error': 'session'})
+            return response(data={'id': kwargs['params']['execid']})
+
+        with ConcurrentAzkabanClient('http://azkaban', concurrency=4) as client:
+            client.client.session.request = request
+            client.login('user', 'secret')
+            infos = client.map('get_execution_info', range(40))
+            single = client.get_execution_info(100).get()
+        self.assertEqual([i['id'] for i in infos], list(range(40)))
+        self.assertEqual(single, {'id': 100})
+        self.assertLessEqual(state['max'], 4)
+        self.assertEqual(state['logins'], 2)
+
+    def test_waits_dont_block_other_calls(self):
+        root = mkdtemp(prefix='nagini-test-')
+        server = FakeAzkabanServer(job_duration=0.3, log_size=1000).start()
+        client = ConcurrentAzkabanClient(server.host, concurrency=2)
+        try:
+            client.login('user', 'secret')
+            client.create_project('p').get()
+            client.upload_project_zip('p', make_project_zip(
+                join(root, 'p.zip'), jobs=3)).get()
+            exec_ids = [client.execute_flow('p', 'Flow').get()['execid']
+                        for _ in range(6)]
+            transitions = []
+            waits = [client.wait_for_execution(
+                exec_id, min_interval=0.05, max_interval=0.1,
+                on_transition=lambda *t: transitions.append(t))
+                for exec_id in exec_ids]
+            sinks = [BytesIO() for _ in range(3)]
+            follows = [client.write_job_logs(exec_ids[0], 'job2', sink,
+                                             follow=True, poll_interval=0.05)
+                       for sink in sinks]
+            # 6 waits and 3 followed logs with 2 pool threads
+            self.assertEqual(client.get_project_flows('p').get(timeout=0.5),
+                             ['Flow'])
+            self.assertFalse(any(w.ready() for w in waits))
+            states = [w.get(timeout=5) for w in waits]
+            self.assertEqual([s.status for s in states], ['SUCCEEDED'] * 6)
+            self.assertIn((None, 'RUNNING', 'SUCCEEDED'), transitions)
+            for follow, sink in zip(follows, sinks):
+                follow.get(timeout=5)
+                self.assertEqual(len(sink.getvalue()), 1000)
+        finally:
+            client.close()
+            server.stop()
+            shutil.rmtree(root)
+
+
+class WaitForExecutionTest(ClientTestCase):
+    def setUp(self):
+        ClientTestCase.setUp(self)
+        self.delays = []
+        self.sleep = client_module.time.sleep
+        client_module.time.sleep = self.delays.append
+
+    def tearDown(self):
+        client_module.time.sleep = self.sleep
+
+    def test_updates_are_merged(self):
+        full = {'status': 'RUNNING', 'updateTime': 10, 'nodes': [
+            {'id': 'a', 'status': 'RUNNING', 'updateTime': 10},
+            {'id': 'sub', 'status': 'READY', 'updateTime': 5, 'nodes': [
+                {'id': 'b', 'status': 'READY', 'updateTime': 5}]}]}
+        self.request.side_effect = [
+            response(data=full),
+            response(data={'status': 'RUNNING', 'updateTime': 10}),
+            response(data={'updateTime': 20, 'nodes': [
+                {'id': 'a', 'status': 'SUCCEEDED', 'updateTime': 20},
+                {'id': 'sub', 'status': 'RUNNING', 'updateTime': 20,
+                 'nodes': [{'id': 'b', 'status': 'RUNNING',
+                            'updateTime': 20}]}]}),
+            response(data={'status': 'SUCCEEDED', 'updateTime': 30,
+                           'nodes': [{'id': 'sub', 'status': 'SUCCEEDED',
+                                      'updateTime': 30,
+                                      'nodes': [{'id': 'b', 'updateTime': 30,
+                                                 'status': 'SUCCEEDED'}]}]})
+        ]
+        transitions = []
+        state = self.client.wait_for_execution(
+            7, on_transition=lambda *t: transitions.append(t))
+
+        self.assertEqual(state.statuses(), {'a': 'SUCCEEDED',
+                                            'sub': 'SUCCEEDED',
+                                            'sub:b': 'SUCCEEDED'})
+        self.assertIn(('sub:b', 'RUNNING', 'SUCCEEDED'), transitions)
+        self.assertEqual(transitions[-1], (None, 'RUNNING', 'SUCCEEDED'))
+        self.assertEqual([c[2]['params'].get('lastUpdateTime')
+                          for c in self.request.calls], [None, 10, 10, 20])
+        self.assertEqual(self.delays, [1, 1.5, 1])
+
+    def test_timeout(self):
+        running = {'status': 'RUNNING', 'updateTime': 1}
+        self.request.side_effect = [response(data=running)
+                                    for _ in range(100)]
+        with self.assertRaises(ExecutionTimeout):
+            self.client.wait_for_execution(7, timeout=0)
+
+
+class SessionCacheTest(ClientTestCase):
+    def setUp(self):
+        ClientTestCase.setUp(self)
+        self.root = mkdtemp(prefix='nagini-test-')
+        self.cache = SessionCache(join(self.root, 'cache', 'sessions.json'))
+        self.client.session_cache = self.cache
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_cached_session_skips_login(self):
+        self.request.side_effect = [
+            response(data={'status': 'success', 'session.id': 'first'})]
+        self.client.login('user', 'secret')
+        self.assertEqual(os.stat(self.cache.path).st_mode & 0o777, 0o600)
+
+        client = AzkabanClient('http://azkaban', session_cache=self.cache)
+        client.session.request = self.request
+        self.request.side_effect = [response(data={'execIds': [1]})]
+        client.login('user', 'secret')
+        self.assertEqual(client.get_running_executions('p', 'f'), [1])
+        self.assertEqual(self.request.last_kwargs['params']['session.id'],
+                         'first')
+        self.assertIsNone(self.cache.get('http://azkaban', 'other'))
+
+    def test_rejected_session_is_replaced(self):
+        self.cache.set('http://azkaban', 'user', 'stale')
+        self.request.side_effect = [
+            response(data={'error': 'session'}),
+            response(data={'status': 'success', 'session.id': 'fresh'}),
+            response(data={'execIds': []})
+        ]
+        self.client.login('user', 'secret')
+        self.assertEqual(self.client.get_running_executions('p', 'f'), [])
+        self.assertEqual(self.cache.get('http://azkaban', 'user'), 'fresh')
@@ -0,0 +1,75 @@
+# -*- coding: utf8 -*-
+import json
+import unittest
+
+from nagini.builder.package import ProjectPackage
+from nagini.critical_path import Analysis, analyze, flow_graph
+
+from .test_builder import BuilderTestCase, make_project
+
+
+def exec_node(node_id, start, end, parents=(), **kwargs):
+    node = {'id': node_id, 'in': list(parents), 'status': 'SUCCEEDED',
+            'startTime': 1000000 + start * 1000,
+            'endTime': 1000000 + end * 1000}
+    node.update(kwargs)
+    return node
+
+
+class CriticalPathTest(unittest.TestCase):
+    payload = {'startTime': 1000000, 'nodes': [
+        exec_node('a', 0, 10),
+        exec_node('b', 10, 40, ['a']),
+        exec_node('c', 15, 20, ['a']),
+        exec_node('sub', 20, 45, ['c'], nodes=[
+            exec_node('x', 20, 30),
+            exec_node('y', 35, 45, ['x'])
+        ]),
+        exec_node('d', 45, 50, ['b', 'sub'])
+    ]}
+
+    def test_embedded_flows_are_flattened(self):
+        analysis = analyze(self.payload)
+        self.assertEqual(analysis.graph['sub:x'].dependencies, ['c'])
+        self.assertEqual(sorted(analysis.graph['d'].dependencies),
+                         ['b', 'sub:y'])
+
+    def test_critical_path_and_slack(self):
+        analysis = analyze(self.payload)
+        self.assertEqual(analysis.path, ['a', 'b', 'd'])
+        self.assertEqual(analysis.length, 45)
+        self.assertEqual(analysis.graph['c'].slack, 5)
+        self.assertEqual(analysis.graph['b'].slack, 0)
+        self.assertEqual(analysis.work, 70)
+        self.assertEqual(analysis.wall_time, 50)
+        self.assertAlmostEqual(analysis.possible_parallelism, 70 / 45.0)
+        self.assertAlmostEqual(analysis.achieved_parallelism, 1.4)
+
+    def test_queue_delay_on_actual_path(self):
+        analysis = analyze(self.payload)
+        self.assertEqual(analysis.actual_path,
+                         ['a', 'c', 'sub:x', 'sub:y', 'd'])
+        self.assertEqual(analysis.graph['c'].queue_delay, 5)
+        self.assertEqual(analysis.queue_delay, 10)
+        result = json.loads(json.dumps(analysis.to_dict()))
+        self.assertEqual(result['jobs']['sub:y']['queue_delay'], 5)
+        self.assertIn('Longest queue delays', analysis.report())
+
+
+class BuiltFlowTest(BuilderTestCase):
+    def test_critical_path_of_built_flow(self):
+        project = ProjectPackage(make_project(self.root, 'critical'),
+                                 quiet=True)
+        try:
+            project.build()
+        finally:
+            project.clear()
+
+        graph = flow_graph(project.dags['MainFlow'],
+                           {'A': 10, 'B': 30, 'C': 5, 'D': 5})
+        analysis = Analysis(graph)
+        self.assertEqual(analysis.path, ['A', 'B', 'D', 'MainFlow'])
+        self.assertEqual(analysis.length, 45)
+        self.assertEqual(analysis.graph['C'].slack, 25)
+        self.assertIsNone(analysis.wall_time)
+        self.assertEqual(analysis.actual_path, [])
@@ -0,0 +1,72 @@
+# -*- coding: utf8 -*-
+import shutil
+import unittest
+from os.path import join
+from tempfile import mkdtemp
+
+from nagini.client import AzkabanClient
+from nagini.fake_server import FakeAzkabanServer
+from nagini.loadtest import LoadTest, make_project_zip
+
+
+class FakeServerTest(unittest.TestCase):
+    def setUp(self):
+        self.root = mkdtemp(prefix='nagini-test-')
+        self.server = FakeAzkabanServer(job_duration=0.05, log_size=1000,
+                                        seed=1).start()
+        self.client = AzkabanClient(self.server.host, backoff=0.01)
+        self.client.login('user', 'secret')
+        self.client.create_project('p')
+        self.client.upload_project_zip('p', make_project_zip(
+            join(self.root, 'p.zip'), jobs=3))
+
+    def tearDown(self):
+        self.client.session.close()
+        self.server.stop()
+        shutil.rmtree(self.root)
+
+    def test_flow_runs_and_logs_grow(self):
+        self.assertEqual(self.client.get_project_flows('p'), ['Flow'])
+        exec_id = self.client.execute_flow('p', 'Flow',
+                                           {'day': '2020-01-01'})['execid']
+        self.assertEqual(self.client.get_running_executions('p', 'Flow'),
+                         [exec_id])
+        transitions = []
+        state = self.client.wait_for_execution(
+            exec_id, timeout=5, min_interval=0.01, max_interval=0.05,
+            on_transition=lambda *t: transitions.append(t))
+        self.assertEqual(state.statuses(), dict.fromkeys(
+            ['job0', 'job1', 'job2', 'Flow'], 'SUCCEEDED'))
+        self.assertEqual(transitions[-1], (None, 'RUNNING', 'SUCCEEDED'))
+        self.assertEqual(self.client.get_running_executions('p', 'Flow'), [])
+        log = ''.join(self.client.iter_job_logs(exec_id, 'job1',
+                                                page_size=300))
+        self.assertEqual(len(log), 1000)
+        self.assertTrue(log.startswith('00000000 INFO'))
+        self.assertNotIn('flowParam',
+                         self.client.get_execution_info(exec_id))
+        options = self.client.get_execution_options(exec_id)
+        self.assertEqual(options['flowParam'], {'day': '2020-01-01'})
+
+    def test_injected_failures_are_retried(self):
+        self.server.failure_rate = 0.25
+        for _ in range(10):
+            self.assertEqual(self.client.get_project_flows('p'), ['Flow'])
+        self.assertTrue(self.server.failures > 0)
+
+    def test_expired_session_is_renewed(self):
+        self.server.expire_sessions()
+        self.assertEqual(self.client.get_project_flows('p'), ['Flow'])
+
+    def test_load_test_scenarios(self):
+        test = LoadTest(self.client, 'load', self.root, jobs=2,
+                        concurrency=4)
+        test.setup(('poll', 'logs'))
+        try:
+            for name in ('poll', 'logs'):
+                result = getattr(test, name)(8)
+                self.assertEqual((result['calls'], result['errors']), (8, 0))
+                self.assertTrue(result['latency']['p50'] <=
+                                result['latency']['p100'])
+        finally:
+            test.teardown()
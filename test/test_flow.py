@@ -0,0 +1,50 @@
+# -*- coding: utf8 -*-
+import threading
+import unittest
+
+from nagini import flow as flow_module
+from nagini.flow import start_flows
+
+
+class FakeFlowClient(object):
+    """Client with one running execution of Flow(month=2020-01)"""
+
+    def __init__(self):
+        self.started = []
+        self.lock = threading.Lock()
+
+    def get_running_executions(self, project, flow):
+        return [5] if flow == 'Flow' else []
+
+    def get_execution_options(self, exec_id):
+        return {'flowParam': {'month': '2020-01'}, 'concurrentOptions': 'skip'}
+
+    def execute_flow(self, project, flow, properties=None, **kwargs):
+        with self.lock:
+            self.started.append((flow, properties, kwargs))
+            return {'execid': 100 + len(self.started)}
+
+
+class StartFlowsTest(unittest.TestCase):
+    config = {'project': 'p', 'server': {'host': 'http://azkaban',
+                                         'username': 'u', 'password': 'p'}}
+
+    def setUp(self):
+        self.client = flow_module._clients[('http://azkaban', 'u')] = \
+            FakeFlowClient()
+
+    def tearDown(self):
+        flow_module._clients.clear()
+
+    def test_running_and_duplicate_flows_are_started_once(self):
+        class Flow(object):
+            name = None
+
+        exec_ids = start_flows([(Flow, {'month': '2020-01'}),
+                                (Flow, {'month': '2020-02'}),
+                                (Flow, {'month': '2020-02'})],
+                               config=self.config)
+        self.assertEqual(exec_ids, [5, 101, 101])
+        self.assertEqual(self.client.started,
+                         [('Flow', {'month': '2020-02'},
+                           {'concurrentOption': 'skip'})])
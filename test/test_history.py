@@ -0,0 +1,95 @@
+# -*- coding: utf8 -*-
+import unittest
+
+from nagini.history import ExecutionHistory, percentile
+
+
+class FakeHistoryClient(object):
+    """Executions of `Flow` with ids 1..n (shifted by `first`), `a` job
+    takes exec id seconds
+    """
+
+    def __init__(self, count, first=0):
+        self.count = count
+        self.first = first
+        self.running = set()
+        self.missing = set()
+        self.pages = []
+
+    def get_project_flows(self, project):
+        return ['Flow']
+
+    def get_flow_executions(self, project, flow, start=0, length=100):
+        self.pages.append(start)
+        ids = list(range(self.first + self.count, self.first,
+                         -1))[start:start + length]
+        return {'total': self.count,
+                'executions': [{'execId': i} for i in ids]}
+
+    def get_execution_info(self, exec_id):
+        if exec_id in self.missing:
+            return {'error': 'Cannot find execution \'%d\'' % exec_id}
+        status = 'RUNNING' if exec_id in self.running else 'SUCCEEDED'
+        start = exec_id * 100000
+        return {'execid': exec_id, 'flowId': 'Flow', 'status': status,
+                'startTime': start, 'endTime': start + 10000,
+                'nodes': [{'id': 'a', 'status': status, 'startTime': start,
+                           'endTime': start + exec_id * 1000}]}
+
+
+class ExecutionHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.history = ExecutionHistory(':memory:')
+
+    def tearDown(self):
+        self.history.close()
+
+    def test_percentile(self):
+        self.assertEqual(percentile([3, 1, 2, 4], 50), 2)
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        self.assertIsNone(percentile([], 50))
+
+    def test_sync_is_incremental(self):
+        client = FakeHistoryClient(5)
+        client.running.add(5)
+        self.assertEqual(self.history.sync(client, 'p', page_size=2), 5)
+        self.assertEqual(client.pages, [0, 2, 4])
+
+        client.count = 7
+        client.running.clear()
+        client.pages = []
+        # 7 and 6 are new, 5 was running during the last sync
+        self.assertEqual(self.history.sync(client, 'p', page_size=2), 3)
+        self.assertEqual(client.pages, [0, 2])
+        rows = self.history.percentiles('job', points=(50, 100))
+        self.assertEqual(rows, [('p.Flow:a', None, 7, 4.0, 7.0)])
+
+    def test_error_payloads_are_skipped(self):
+        client = FakeHistoryClient(3)
+        client.missing.add(2)
+        self.assertEqual(self.history.sync(client, 'p'), 2)
+        self.assertEqual(self.history.known([1, 2, 3]), set([1, 3]))
+
+    def test_percentiles_per_period_and_regressions(self):
+        self.history.sync(FakeHistoryClient(8), 'p')
+        rows = self.history.percentiles('job', points=(50,), period=400)
+        self.assertEqual([r[2:] for r in rows],
+                         [(3, 2.0), (4, 5.0), (1, 8.0)])
+        self.assertEqual(self.history.percentiles('flow', points=(95,)),
+                         [('p.Flow', None, 8, 10.0)])
+
+        result = self.history.regressions((0, 400000), (400000, 900000),
+                                          point=50, threshold=2)
+        self.assertEqual(result, [('p.Flow:a', 2.0, 6.0, 3.0)])
+        self.assertEqual(self.history.regressions(
+            (0, 400000), (400000, 900000), kind='flow'), [])
+
+    def test_jobs_of_projects_are_separate(self):
+        self.history.sync(FakeHistoryClient(2), 'p')
+        self.history.sync(FakeHistoryClient(3, first=10), 'q')
+        rows = self.history.percentiles('job', points=(100,))
+        self.assertEqual(rows, [('p.Flow:a', None, 2, 2.0),
+                                ('q.Flow:a', None, 3, 13.0)])
+        self.assertEqual(
+            [r[0] for r in self.history.durations(name='q.Flow:a')],
+            ['q.Flow:a'] * 3)
@@ -0,0 +1,38 @@
+# -*- coding: utf8 -*-
+import unittest
+
+from nagini.job import BaseJob
+from nagini.properties import props
+from nagini.target import LocalTarget
+
+
+class Monthly(BaseJob):
+    partition_property = 'month'
+    partitions = ['2020-01', '2020-02']
+
+    def output(self):
+        return LocalTarget('/data/%s.csv' % props['month'])
+
+
+class Single(BaseJob):
+    def output(self):
+        return LocalTarget('/data/single.csv')
+
+
+class Report(BaseJob):
+    def requires(self):
+        return {'monthly': Monthly(), 'single': Single()}
+
+
+class InputTest(unittest.TestCase):
+    def tearDown(self):
+        props.clear()
+
+    def test_partitioned_require_gives_all_outputs(self):
+        props['month'] = '2019-12'
+        inputs = Report().input()
+        self.assertEqual([t.path for t in inputs['monthly']],
+                         ['/data/2020-01.csv', '/data/2020-02.csv'])
+        self.assertEqual(inputs['single'].path, '/data/single.csv')
+        self.assertTrue(inputs['monthly'][0].output_flag)
+        self.assertEqual(props['month'], '2019-12')
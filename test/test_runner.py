@@ -0,0 +1,273 @@
+# -*- coding: utf8 -*-
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from os.path import join
+from tempfile import mkdtemp
+
+from nagini import BaseJob
+from nagini.fields import StringField
+from nagini.properties import props
+from nagini.runner import Checkpoints, job_fingerprint, LocalRunner, \
+    FAILED, SKIPPED, SUCCEEDED
+from nagini.target import LocalTarget
+
+
+class RecordingJob(BaseJob):
+    """Append name to runs.log of working dir, set `<name>` and `last`
+    props and `<name>.input` to input value of `last`
+    """
+
+    def run(self):
+        name = self.__class__.__name__
+        with open(join(props['working.dir'], 'runs.log'), 'a') as fd:
+            fd.write(name + '\n')
+        props[name + '.input'] = props.get('last')
+        props[name] = '1'
+        props['last'] = name
+
+
+class A(RecordingJob):
+    def run(self):
+        RecordingJob.run(self)
+        props['number'] = 5
+
+
+class B(RecordingJob):
+    def requires(self):
+        return A()
+
+
+class C(RecordingJob):
+    def requires(self):
+        return A()
+
+
+class D(RecordingJob):
+    def requires(self):
+        return [B(), C()]
+
+
+class Failing(RecordingJob):
+    def requires(self):
+        return A()
+
+    def run(self):
+        raise ValueError('boom')
+
+
+class AfterFailing(RecordingJob):
+    def requires(self):
+        return Failing()
+
+
+class Exiting(RecordingJob):
+    def run(self):
+        sys.exit(1)
+
+
+class Dying(RecordingJob):
+    def run(self):
+        os._exit(1)
+
+
+class AfterExits(RecordingJob):
+    def requires(self):
+        return [A(), Exiting(), Dying()]
+
+
+class Partitioned(RecordingJob):
+    partition_property = 'part'
+    partitions = ['x', 'y']
+
+    def requires(self):
+        return A()
+
+    def run(self):
+        RecordingJob.run(self)
+        props['part.' + props['part']] = '1'
+
+
+class AfterPartitions(RecordingJob):
+    def requires(self):
+        return Partitioned()
+
+
+class Root(RecordingJob):
+    def requires(self):
+        return [D(), AfterFailing()]
+
+
+class Export(RecordingJob):
+    day = StringField(default='2020-01-01')
+
+    def output(self):
+        return LocalTarget(join(props['working.dir'], 'export-%s' % self.day))
+
+    def run(self):
+        RecordingJob.run(self)
+        with self.output().open('w') as fd:
+            fd.write('data')
+
+
+class Report(RecordingJob):
+    """Fails while `fail` file exists in working dir"""
+
+    def requires(self):
+        return Export()
+
+    def run(self):
+        if os.path.exists(join(props['working.dir'], 'fail')):
+            raise ValueError('boom')
+        RecordingJob.run(self)
+
+
+class RunnerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.root = mkdtemp(prefix='nagini-test-')
+        open(join(self.root, 'config.yml'), 'w').close()
+        self.reported = []
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        props.clear()
+        os.environ.pop('JOB_PROP_FILE', None)
+        os.environ.pop('JOB_OUTPUT_PROP_FILE', None)
+
+    def run_jobs(self, job, processes, **kwargs):
+        base_props = {'working.dir': self.root}
+        base_props.update(kwargs.pop('base_props', {}))
+        runner = LocalRunner(job, processes, base_props=base_props,
+                             callback=lambda n: self.reported.append(
+                                 (n.name, n.status)), **kwargs)
+        ok = runner.run()
+        return ok, dict((n.name, n) for n in runner.nodes)
+
+    def runs(self):
+        """Return and forget names of run jobs"""
+        path = join(self.root, 'runs.log')
+        if not os.path.exists(path):
+            return []
+        with open(path) as fd:
+            runs = sorted(fd.read().split())
+        os.remove(path)
+        return runs
+
+
+class LocalRunnerTest(RunnerTestCase):
+    def test_diamond_runs_shared_job_once(self):
+        for processes in (1, 3):
+            ok, nodes = self.run_jobs(D(), processes)
+            self.assertTrue(ok)
+            self.assertEqual(self.runs(), ['A', 'B', 'C', 'D'])
+            output = nodes['D'].output_props
+            self.assertEqual([output.get(k) for k in ('A', 'B', 'C')],
+                             ['1'] * 3)
+            # outputs of requires are merged in order of requires()
+            self.assertEqual(output['D.input'], 'C')
+            # values are handed over as strings like through files
+            self.assertEqual(output['number'], '5')
+
+    def test_temp_files_are_removed(self):
+        tmp_dir = join(self.root, 'tmp')
+        os.mkdir(tmp_dir)
+        tempdir, tempfile.tempdir = tempfile.tempdir, tmp_dir
+        try:
+            self.run_jobs(D(), 1)
+            self.assertEqual(os.listdir(tmp_dir), [])
+            self.run_jobs(Root(), 2)
+            self.assertEqual(os.listdir(tmp_dir), [])
+        finally:
+            tempfile.tempdir = tempdir
+
+    def test_failure_stops_only_downstream_jobs(self):
+        ok, nodes = self.run_jobs(Root(), 2)
+        self.assertFalse(ok)
+        self.assertEqual(dict((n, nodes[n].status) for n in nodes), {
+            'A': SUCCEEDED, 'B': SUCCEEDED, 'C': SUCCEEDED, 'D': SUCCEEDED,
+            'Failing': FAILED, 'AfterFailing': SKIPPED, 'Root': SKIPPED
+        })
+        self.assertIn('boom', nodes['Failing'].error)
+        self.assertEqual(self.runs(), ['A', 'B', 'C', 'D'])
+        self.assertEqual(len(self.reported), len(nodes))
+
+    def test_exited_and_dead_workers_fail_jobs(self):
+        ok, nodes = self.run_jobs(AfterExits(), 2)
+        self.assertFalse(ok)
+        self.assertEqual(dict((n, nodes[n].status) for n in nodes), {
+            'A': SUCCEEDED, 'Exiting': FAILED, 'Dying': FAILED,
+            'AfterExits': SKIPPED
+        })
+        self.assertIn('SystemExit', nodes['Exiting'].error)
+        self.assertIn('died', nodes['Dying'].error)
+
+    def test_partitions_run_as_jobs_joined_for_dependents(self):
+        for processes in (1, 2):
+            ok, nodes = self.run_jobs(AfterPartitions(), processes)
+            self.assertTrue(ok)
+            self.assertEqual(self.runs(), ['A', 'AfterPartitions',
+                                           'Partitioned', 'Partitioned'])
+            self.assertEqual(sorted(nodes), [
+                'A', 'AfterPartitions', 'Partitioned', 'Partitioned-x',
+                'Partitioned-y'])
+            self.assertEqual(nodes['AfterPartitions'].dependencies,
+                             [nodes['Partitioned']])
+            self.assertEqual(nodes['Partitioned-y'].output_props['part.y'],
+                             '1')
+            # noop join passes on no props, not even partition_property
+            self.assertEqual(nodes['Partitioned'].output_props, {})
+            output = nodes['AfterPartitions'].output_props
+            for name in ('part', 'part.x', 'part.y', 'A'):
+                self.assertNotIn(name, output)
+
+
+class ResumeTest(RunnerTestCase):
+    def test_failed_run_is_resumed(self):
+        path = join(self.root, 'checkpoints.json')
+        open(join(self.root, 'fail'), 'w').close()
+        ok, nodes = self.run_jobs(Report(), 1, checkpoints=Checkpoints(path))
+        self.assertFalse(ok)
+        self.assertEqual(self.runs(), ['Export'])
+
+        os.remove(join(self.root, 'fail'))
+        for processes in (1, 2):
+            ok, nodes = self.run_jobs(Report(), processes,
+                                      checkpoints=Checkpoints(path),
+                                      resume=True)
+            self.assertTrue(ok)
+            self.assertTrue(nodes['Export'].resumed)
+            self.assertEqual(nodes['Report'].output_props['Export'], '1')
+        # Report was run once and resumed after that
+        self.assertEqual(self.runs(), ['Report'])
+
+    def test_changed_fields_and_missing_outputs_invalidate_checkpoint(self):
+        path = join(self.root, 'checkpoints.json')
+        self.run_jobs(Report(), 1, checkpoints=Checkpoints(path))
+        self.assertEqual(self.runs(), ['Export', 'Report'])
+
+        self.run_jobs(Report(), 1, checkpoints=Checkpoints(path),
+                      resume=True, base_props={'day': '2020-01-02'})
+        self.assertEqual(self.runs(), ['Export', 'Report'])
+
+        os.remove(join(self.root, 'export-2020-01-01'))
+        self.run_jobs(Report(), 1, checkpoints=Checkpoints(path),
+                      resume=True)
+        # jobs requiring a job that was run again are run too
+        self.assertEqual(self.runs(), ['Export', 'Report'])
+
+    def test_outputs_are_checked_only_on_resume(self):
+        values = {'working.dir': self.root}
+        digest, outputs_exist = job_fingerprint(Export, values)
+        self.assertIsNotNone(digest)
+        self.assertIsNone(outputs_exist)
+        self.assertEqual(job_fingerprint(Export, values, check_outputs=True),
+                         (digest, False))
+
+    def test_working_dirs_have_own_checkpoints(self):
+        paths = [Checkpoints.for_working_dir(path).path
+                 for path in (self.root, join(self.root, 'other'),
+                              join(self.root, 'other', '..'))]
+        self.assertNotEqual(paths[0], paths[1])
+        self.assertEqual(paths[0], paths[2])